@@ -0,0 +1,146 @@
+"""
+Acceso compartido a MongoDB para todos los scripts.
+
+Un solo MongoClient por proceso, creado la primera vez que se usa (importar
+un script no abre conexiones ni espera a Atlas) y configurable por .env:
+
+    MONGODB_URI              URI del cluster (obligatoria)
+    MONGODB_DB               base de datos (por defecto ml_reviews)
+    MONGODB_MAX_POOL         conexiones máximas del pool (por defecto 50)
+    MONGODB_MIN_POOL         conexiones que se mantienen abiertas (por defecto 0)
+    MONGODB_TIMEOUT_MS       espera para elegir servidor y conectar (por defecto 10000)
+    MONGODB_SOCKET_TIMEOUT_MS  espera por respuesta; 0 = sin límite (por defecto 0)
+    MONGODB_RETRY_WRITES     1/0, reintentar escrituras una vez (por defecto 1)
+    MONGODB_COMPRESSORS      compresión de red en orden de preferencia
+                             (por defecto zstd,snappy,zlib; se omiten las no instaladas)
+    MONGODB_ESQUEMA          completo (por defecto) o compacto: reseñas en `reviews`
+                             con nombres cortos (ver esquema.py)
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+import metricas
+
+load_dotenv()
+
+NOMBRE_DB = os.getenv("MONGODB_DB", "ml_reviews")
+ESQUEMA_COMPACTO = os.getenv("MONGODB_ESQUEMA", "completo") == "compacto"
+
+# Paquete de Python que necesita cada compresor (zlib viene con Python)
+MODULOS_COMPRESION = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+_cliente = None
+_lock = threading.Lock()
+
+
+def compresores_disponibles(preferidos=None):
+    """Compresores de `preferidos` (o MONGODB_COMPRESSORS) cuyo paquete está instalado."""
+    if preferidos is None:
+        preferidos = os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib")
+    disponibles = []
+    for nombre in (c.strip() for c in preferidos.split(",")):
+        modulo = MODULOS_COMPRESION.get(nombre)
+        if not modulo:
+            continue
+        try:
+            __import__(modulo)
+        except ImportError:
+            continue
+        disponibles.append(nombre)
+    return disponibles
+
+
+def opciones_cliente():
+    """Parámetros de MongoClient tomados del entorno."""
+    socket_timeout = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "0"))
+    timeout = int(os.getenv("MONGODB_TIMEOUT_MS", "10000"))
+    opciones = {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL", "50")),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL", "0")),
+        "serverSelectionTimeoutMS": timeout,
+        "connectTimeoutMS": timeout,
+        "socketTimeoutMS": socket_timeout or None,
+        "retryWrites": os.getenv("MONGODB_RETRY_WRITES", "1") == "1",
+        "appname": "ml_sentiment",
+        # Sin hilos de monitoreo ni conexiones hasta la primera operación
+        "connect": False,
+        # Latencia por comando (metricas.py)
+        "event_listeners": [metricas.MonitorMongo()],
+    }
+    compresores = compresores_disponibles()
+    if compresores:
+        opciones["compressors"] = ",".join(compresores)
+    return opciones
+
+
+def cliente() -> MongoClient:
+    """MongoClient compartido; se crea en la primera llamada."""
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                uri = os.getenv("MONGODB_URI")
+                if not uri:
+                    raise ValueError("No se encontró MONGODB_URI en el .env")
+                _cliente = MongoClient(uri, **opciones_cliente())
+    return _cliente
+
+
+def db() -> Database:
+    return cliente()[NOMBRE_DB]
+
+
+def coleccion(nombre: str) -> Collection:
+    return db()[nombre]
+
+
+def products() -> Collection:
+    """Productos scrapeados de los listados."""
+    return coleccion("products")
+
+
+def raw_reviews():
+    """
+    Reseñas por producto (con los campos de sentimiento una vez enriquecidas).
+    Con el esquema compacto, un esquema.ReseñasCompactas con la misma interfaz.
+    """
+    if ESQUEMA_COMPACTO:
+        import esquema
+        return esquema.reseñas_compactas()
+    return coleccion("raw_reviews")
+
+
+def term_freq() -> Collection:
+    """Frecuencia de términos por (categoria, sentiment_label, termino)."""
+    return coleccion("term_freq")
+
+
+def meta() -> Collection:
+    """Marcador de versión de los datos enriquecidos."""
+    return coleccion("meta")
+
+
+def product_stats() -> Collection:
+    """Conteos por sentimiento y suma de estrellas por producto y categoría."""
+    return coleccion("product_stats")
+
+
+def usar_cliente(nuevo):
+    """Reemplaza el cliente compartido (p. ej. mongomock en bench_pipeline.py)."""
+    global _cliente
+    with _lock:
+        _cliente = nuevo
+
+
+def cerrar():
+    """Cierra el cliente compartido (se vuelve a crear si se usa de nuevo)."""
+    global _cliente
+    with _lock:
+        if _cliente is not None:
+            _cliente.close()
+            _cliente = None
@@ -0,0 +1,521 @@
+"""
+Benchmark del pipeline completo sin MercadoLibre ni Atlas.
+
+Sirve páginas de listado y de producto desde un servidor HTTP local (en
+otro proceso, para no competir por el GIL), usa mongomock en memoria o un
+mongod local y, opcionalmente, un modelo simulado. Con eso ejecuta el
+código real de cada etapa y mide su rendimiento:
+
+    listados     scrape_products.scrape_listing (requests + BeautifulSoup + inserción)
+    reseñas      scrape_reviews.scrape_reviews_for_product (extracción + inserción)
+    sentimiento  enrich_sentiment.enriquecer_lote (tokenización, inferencia y escrituras)
+
+Uso:
+    python bench_pipeline.py
+    python bench_pipeline.py --paginas 10 --reseñas-por-producto 20 --salida bench_nuevo.json
+    python bench_pipeline.py --mongo-uri mongodb://localhost:27017 --modelo real
+    python bench_pipeline.py --html-listado pagina_completa.html --html-producto debug_product_page.html
+    python bench_pipeline.py --comparar bench_pipeline.json
+
+Las reseñas se extraen por defecto con un navegador local (requests + XPath
+de lxml, los mismos selectores que Selenium) y sin las esperas fijas de
+scrape_reviews; --navegador chrome y --factor-esperas 1 reproducen la
+extracción real. Las páginas grabadas son las que guardan
+diagnostico_html.py (pagina_completa.html) y scrape_reviews.py
+(debug_product_page.html).
+"""
+import argparse
+import contextlib
+import functools
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import tempfile
+import time
+import types
+import zlib
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_sentiment import commit_actual, generar_corpus
+
+ETAPAS = ["listados", "reseñas", "sentimiento"]
+CATEGORIAS = ["audifonos", "laptops", "televisores"]
+MARCAS = ["Sony", "Samsung", "JBL", "Lenovo", "HP", "LG", "Xiaomi", "Asus", "TCL", "Huawei"]
+
+# URLs de MercadoLibre en páginas grabadas → servidor local
+PATRON_URL_ML = re.compile(r"https?://(?:articulo|www)\.mercadolibre\.com\.ec/")
+
+
+# ------------------------
+# Páginas sintéticas
+# ------------------------
+def relleno(kb):
+    """Marcado de relleno (tarjetas anidadas) para acercar el tamaño y el parseo a una página real."""
+    bloque = ('<div class="andes-card"><div class="andes-card__content"><span class="andes-badge">'
+              'Envío gratis</span><p class="ui-pdp-color--GRAY">Llega mañana</p></div></div>\n')
+    return bloque * max(0, kb * 1024 // len(bloque))
+
+
+def html_listado(base, categoria, pagina, por_pagina, kb):
+    items = []
+    for i in range(por_pagina):
+        pid = f"{categoria}-{pagina}-{i}"
+        rnd = random.Random(pid)
+        titulo = f"{rnd.choice(MARCAS)} {categoria.capitalize()} modelo {pid.upper()}"
+        items.append(
+            '<li class="ui-search-layout__item"><div class="poly-card">'
+            f'<a class="poly-component__title" href="{base}/producto/{pid}?tracking_id={rnd.random():.6f}">{titulo}</a>'
+            f'<span class="andes-money-amount__fraction">{rnd.randint(20, 2000)}</span>'
+            '</div></li>'
+        )
+    return (f"<html><head><title>{categoria}</title></head><body>{relleno(kb)}"
+            f'<ol class="ui-search-layout">{"".join(items)}</ol></body></html>')
+
+
+def html_producto(pid, textos, max_reseñas, kb):
+    rnd = random.Random(pid)
+    reseñas = []
+    for _ in range(rnd.randint(1, max_reseñas)):
+        reseñas.append(
+            '<article class="ui-review-capability-comments__comment">'
+            f'<div class="ui-review-capability-comments__comment__rating" aria-label="Calificación {rnd.randint(1, 5)} de 5"></div>'
+            f'<p class="ui-review-capability-comments__comment__text">{rnd.choice(textos)}</p>'
+            '</article>'
+        )
+    return (f'<html><body><h1 class="ui-pdp-title">{pid}</h1>{relleno(kb)}'
+            f'<section class="ui-review-capability">{"".join(reseñas)}</section></body></html>')
+
+
+# ------------------------
+# Servidor HTTP local (proceso aparte)
+# ------------------------
+def servir_paginas(config, puertos):
+    """Proceso del servidor: publica el puerto elegido en `puertos` y atiende hasta ser terminado."""
+    textos = generar_corpus(5000)
+    grabado_listado = grabado_producto = None
+    if config["html_listado"]:
+        with open(config["html_listado"], encoding="utf-8") as f:
+            grabado_listado = f.read()
+    if config["html_producto"]:
+        with open(config["html_producto"], encoding="utf-8") as f:
+            grabado_producto = f.read()
+
+    @functools.lru_cache(maxsize=256)
+    def listado(base, categoria, pagina):
+        if grabado_listado is not None:
+            # Productos distintos en cada página: /producto/<categoria>-<pagina>/<ruta original>
+            return PATRON_URL_ML.sub(f"{base}/producto/{categoria}-{pagina}/", grabado_listado)
+        return html_listado(base, categoria, pagina, config["por_pagina"], config["kb"])
+
+    @functools.lru_cache(maxsize=1024)
+    def producto(pid):
+        if grabado_producto is not None:
+            return grabado_producto
+        return html_producto(pid, textos, config["reseñas_por_producto"], config["kb"])
+
+    class Manejador(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            ruta = self.path.split("?")[0]
+            m = re.match(r"^/listado/([a-z0-9-]+)(?:_Desde_(\d+))?", ruta)
+            if m:
+                pagina = (int(m.group(2)) - 1) // 48 if m.group(2) else 0
+                base = f"http://{self.headers.get('Host')}"
+                cuerpo = listado(base, m.group(1), pagina)
+            elif ruta.startswith("/producto/"):
+                cuerpo = producto(ruta[len("/producto/"):])
+            else:
+                self.send_error(404)
+                return
+            datos = cuerpo.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+    puertos.put(servidor.server_address[1])
+    servidor.serve_forever()
+
+
+def iniciar_servidor(args):
+    config = {
+        "html_listado": args.html_listado, "html_producto": args.html_producto,
+        "por_pagina": args.productos_por_pagina, "reseñas_por_producto": args.reseñas_por_producto,
+        "kb": args.kb_pagina,
+    }
+    puertos = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=servir_paginas, args=(config, puertos), daemon=True)
+    proceso.start()
+    return proceso, f"http://127.0.0.1:{puertos.get(timeout=60)}"
+
+
+# ------------------------
+# Navegador local (sustituto de Selenium para páginas estáticas)
+# ------------------------
+class ElementoLocal:
+    """Lo que extract_reviews_selenium usa de un WebElement."""
+
+    def __init__(self, nodo):
+        self.nodo = nodo
+
+    @property
+    def text(self):
+        return " ".join(self.nodo.text_content().split())
+
+    def find_element(self, by, xpath):
+        from selenium.common.exceptions import NoSuchElementException
+        encontrados = self.nodo.xpath(xpath)
+        if not encontrados:
+            raise NoSuchElementException(xpath)
+        return ElementoLocal(encontrados[0])
+
+    def get_attribute(self, nombre):
+        return self.nodo.get(nombre)
+
+    def click(self):
+        pass
+
+
+class NavegadorLocal:
+    """Descarga con requests y evalúa los XPath con lxml; no ejecuta JavaScript."""
+
+    def __init__(self):
+        import requests
+        self.sesion = requests.Session()
+        self.page_source = ""
+        self.arbol = None
+
+    def get(self, url):
+        import lxml.html
+        resp = self.sesion.get(url, timeout=15)
+        self.page_source = resp.text
+        self.arbol = lxml.html.fromstring(resp.content)
+
+    def execute_script(self, *args):
+        return None
+
+    def find_elements(self, by, xpath):
+        return [ElementoLocal(nodo) for nodo in self.arbol.xpath(xpath)]
+
+    def quit(self):
+        self.sesion.close()
+
+
+class EsperasEscaladas:
+    """Reemplaza al módulo time de scrape_reviews para escalar sus time.sleep fijos."""
+
+    def __init__(self, factor):
+        self.factor = factor
+
+    def sleep(self, segundos):
+        if self.factor > 0:
+            time.sleep(segundos * self.factor)
+
+    def __getattr__(self, nombre):
+        return getattr(time, nombre)
+
+
+# ------------------------
+# Modelo simulado
+# ------------------------
+class TokenizerSimulado:
+    """Tokenizer por palabras con ids estables (sin descargar el modelo)."""
+    name_or_path = "simulado"
+    model_max_length = 128
+    pad_token_id = 0
+
+    def __len__(self):
+        return 30000
+
+    def __call__(self, textos, truncation=True, max_length=128):
+        return {"input_ids": [
+            [1 + zlib.crc32(p.encode("utf-8")) % 29999 for p in t.lower().split()][:max_length]
+            for t in textos
+        ]}
+
+
+def inferencia_simulada(ms_por_reseña):
+    """Reemplazo de sentiment_model.analizar_ids con una latencia fija por reseña."""
+    etiquetas = ["POS", "NEU", "NEG"]
+
+    def analizar_ids(pipe, lista_ids, batch_size=16):
+        if ms_por_reseña:
+            time.sleep(ms_por_reseña * len(lista_ids) / 1000)
+        return [{"label": etiquetas[sum(ids) % 3], "score": 0.9} for ids in lista_ids]
+    return analizar_ids
+
+
+def cargar_enrich(args):
+    """Importa enrich_sentiment con el modelo real o el simulado."""
+    if args.modelo == "simulado":
+        import sentiment_model
+        sentiment_model.cargar_pipeline = lambda *a, **k: types.SimpleNamespace(
+            tokenizer=TokenizerSimulado(), model=None
+        )
+    import enrich_sentiment
+    if args.modelo == "simulado":
+        enrich_sentiment.analizar_ids = inferencia_simulada(args.ms_por_reseña)
+    return enrich_sentiment
+
+
+# ------------------------
+# MongoDB
+# ------------------------
+def compatibilidad_mongomock():
+    """PyMongo ≥ 4.11 pasa `sort` a los UpdateOne/ReplaceOne de bulk_write; mongomock 4.x no lo acepta."""
+    from mongomock.collection import BulkOperationBuilder
+
+    def sin_sort(original):
+        def metodo(self, *args, sort=None, **kwargs):
+            return original(self, *args, **kwargs)
+        return metodo
+
+    for nombre in ("add_update", "add_replace"):
+        original = getattr(BulkOperationBuilder, nombre)
+        if "sort" not in inspect.signature(original).parameters:
+            setattr(BulkOperationBuilder, nombre, sin_sort(original))
+
+
+def preparar_mongo(args):
+    """Base de datos vacía para el benchmark, con los índices de producción."""
+    import base_datos
+    import indices
+
+    if args.mongo_uri:
+        if args.db == os.getenv("MONGODB_DB", "ml_reviews"):
+            raise SystemExit(f"--db {args.db} es la base de datos de los scripts: usa otra (se borra)")
+        os.environ["MONGODB_URI"] = args.mongo_uri
+    else:
+        import mongomock
+        compatibilidad_mongomock()
+        base_datos.usar_cliente(mongomock.MongoClient())
+    base_datos.NOMBRE_DB = args.db
+    base_datos.cliente().drop_database(args.db)
+
+    for nombre, indice, error in indices.crear_indices(base_datos.db()):
+        print(f"  ✗ índice {nombre}.{indice}: {error[:80]}")
+    return base_datos.db()
+
+
+def sembrar_productos(db, base, args):
+    """Productos apuntando al servidor local (cuando no se mide la etapa de listados)."""
+    docs = [
+        {"categoria": categoria, "titulo": f"Producto {categoria}-{p}-{i}",
+         "url_producto": f"{base}/producto/{categoria}-{p}-{i}", "origen": "bench"}
+        for categoria in args.categorias
+        for p in range(args.paginas)
+        for i in range(args.productos_por_pagina)
+    ]
+    db.products.insert_many(docs)
+
+
+def sembrar_reseñas(db, args):
+    """Reseñas pendientes de analizar (cuando no se mide la etapa de reseñas)."""
+    import base_datos
+
+    textos = generar_corpus(5000)
+    rnd = random.Random(42)
+    docs = []
+    for producto in db.products.find({}, {"categoria": 1, "titulo": 1, "url_producto": 1}):
+        for _ in range(rnd.randint(1, args.reseñas_por_producto)):
+            docs.append({
+                "producto_mongo_id": producto["_id"], "categoria": producto["categoria"],
+                "url_producto": producto["url_producto"], "titulo_producto": producto["titulo"],
+                "reseña_texto": rnd.choice(textos), "puntuacion": rnd.randint(1, 5), "origen": "bench",
+            })
+    base_datos.raw_reviews().insert_many(docs)
+
+
+# ------------------------
+# Etapas
+# ------------------------
+@contextlib.contextmanager
+def salida_etapa(verboso):
+    """Los scripts imprimen por producto/reseña: se descarta salvo con --verboso."""
+    if verboso:
+        yield
+        return
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        yield
+
+
+def por_segundo(n, segundos):
+    return round(n / segundos, 2) if segundos else 0.0
+
+
+def medir_listados(base, args):
+    from scrape_products import scrape_listing, url_pagina
+
+    paginas = productos = 0
+    inicio = time.perf_counter()
+    with salida_etapa(args.verboso):
+        for categoria in args.categorias:
+            for pagina in range(args.paginas):
+                insertados, _ = scrape_listing(categoria, url_pagina(f"{base}/listado/{categoria}", pagina))
+                paginas += 1
+                productos += insertados
+    segundos = time.perf_counter() - inicio
+    return {"segundos": round(segundos, 2), "paginas": paginas, "productos": productos,
+            "paginas_por_seg": por_segundo(paginas, segundos),
+            "productos_por_seg": por_segundo(productos, segundos)}
+
+
+def medir_reseñas(db, args):
+    import scrape_reviews
+
+    scrape_reviews.time = EsperasEscaladas(args.factor_esperas)
+    driver = scrape_reviews.setup_driver() if args.navegador == "chrome" else NavegadorLocal()
+    productos = list(db.products.find())
+    reseñas = 0
+    inicio = time.perf_counter()
+    try:
+        with salida_etapa(args.verboso):
+            for doc in productos:
+                reseñas += len(scrape_reviews.scrape_reviews_for_product(driver, doc, max_reviews=args.max_reseñas))
+            # Con JOURNAL=1 la etapa incluye aplicar el journal en la BD
+            scrape_reviews.journal.esperar("reseñas")
+    finally:
+        driver.quit()
+    segundos = time.perf_counter() - inicio
+    return {"segundos": round(segundos, 2), "productos": len(productos), "reseñas": reseñas,
+            "productos_por_seg": por_segundo(len(productos), segundos),
+            "reseñas_por_seg": por_segundo(reseñas, segundos)}
+
+
+def medir_sentimiento(enrich_sentiment, args):
+    exitosas = fallidas = lotes = 0
+    ultimo_id = None
+    inicio = time.perf_counter()
+    with salida_etapa(args.verboso):
+        while True:
+            ok, error, ultimo_id = enrich_sentiment.enriquecer_lote(limit=args.lote, desde_id=ultimo_id)
+            if ok == 0 and error == 0:
+                break
+            exitosas += ok
+            fallidas += error
+            lotes += 1
+        enrich_sentiment.journal.esperar("sentimiento")
+    segundos = time.perf_counter() - inicio
+    return {"segundos": round(segundos, 2), "lotes": lotes, "analizadas": exitosas, "fallidas": fallidas,
+            "reseñas_por_seg": por_segundo(exitosas, segundos)}
+
+
+# ------------------------
+# Reporte
+# ------------------------
+def comparar(actual, anterior):
+    """Imprime la variación de cada métrica *_por_seg entre dos archivos de resultados."""
+    print(f"\nComparación con {anterior.get('commit') or 'resultado anterior'}:")
+    for etapa, datos in actual["etapas"].items():
+        previos = anterior.get("etapas", {}).get(etapa, {})
+        for clave, valor in datos.items():
+            if not clave.endswith("_por_seg") or not previos.get(clave):
+                continue
+            cambio = (valor - previos[clave]) * 100 / previos[clave]
+            print(f"  {etapa:<12} {clave:<18} {previos[clave]:>9.1f} → {valor:>9.1f} ({cambio:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline con servidor y base de datos locales")
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS,
+                        help="Etapas a medir (las anteriores se siembran sin medir)")
+    parser.add_argument("--categorias", nargs="+", default=CATEGORIAS)
+    parser.add_argument("--paginas", type=int, default=5, help="Páginas de listado por categoría")
+    parser.add_argument("--productos-por-pagina", type=int, default=48)
+    parser.add_argument("--reseñas-por-producto", type=int, default=10,
+                        help="Máximo de reseñas en cada página de producto (1..N)")
+    parser.add_argument("--max-reseñas", type=int, default=20, help="max_reviews de scrape_reviews")
+    parser.add_argument("--kb-pagina", type=int, default=150, help="Relleno de cada página sintética (KB)")
+    parser.add_argument("--html-listado", help="Página de listado grabada (en vez de la sintética)")
+    parser.add_argument("--html-producto", help="Página de producto grabada (en vez de la sintética)")
+    parser.add_argument("--navegador", choices=["local", "chrome"], default="local")
+    parser.add_argument("--factor-esperas", type=float, default=0.0,
+                        help="Escala de los time.sleep de scrape_reviews (1 = como en producción)")
+    parser.add_argument("--modelo", choices=["simulado", "real"], default="simulado")
+    parser.add_argument("--ms-por-reseña", type=float, default=0.0, help="Latencia del modelo simulado")
+    parser.add_argument("--lote", type=int, default=50, help="Reseñas por enriquecer_lote")
+    parser.add_argument("--mongo-uri", help="mongod local (por defecto: mongomock en memoria)")
+    parser.add_argument("--db", default="ml_bench", help="Base de datos del benchmark (se borra al empezar)")
+    parser.add_argument("--salida", default="bench_pipeline.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--verboso", action="store_true", help="Mostrar la salida de los scripts")
+    args = parser.parse_args()
+
+    print("="*80)
+    print("BENCHMARK DEL PIPELINE (servidor y base de datos locales)")
+    print("="*80)
+
+    # Caché de tokens propia: cada corrida parte en frío
+    directorio = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.environ["TOKEN_CACHE_PATH"] = os.path.join(directorio, "tokens.sqlite")
+
+    proceso, base = iniciar_servidor(args)
+    print(f"Servidor de páginas: {base}")
+    try:
+        db = preparar_mongo(args)
+        print(f"MongoDB: {args.mongo_uri or 'mongomock (en memoria)'} / {args.db}")
+
+        import metricas
+        enrich_sentiment = cargar_enrich(args) if "sentimiento" in args.etapas else None
+        metricas.registro.reiniciar()
+
+        etapas = {}
+        if "listados" in args.etapas:
+            etapas["listados"] = medir_listados(base, args)
+        else:
+            sembrar_productos(db, base, args)
+        if "reseñas" in args.etapas:
+            etapas["reseñas"] = medir_reseñas(db, args)
+        elif "sentimiento" in args.etapas:
+            sembrar_reseñas(db, args)
+        if "sentimiento" in args.etapas:
+            etapas["sentimiento"] = medir_sentimiento(enrich_sentiment, args)
+    finally:
+        proceso.terminate()
+
+    print(f"\n{'Etapa':<12} {'Segundos':>9}  Rendimiento")
+    for etapa, datos in etapas.items():
+        tasas = " | ".join(f"{k.replace('_por_seg', '')}/s: {v}" for k, v in datos.items() if k.endswith("_por_seg"))
+        print(f"{etapa:<12} {datos['segundos']:>9}  {tasas}")
+    resumen_metricas = metricas.resumen()["metricas"]
+    metricas.imprimir(resumen_metricas)
+
+    salida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "cpu": platform.processor() or platform.machine(),
+        "mongo": "uri" if args.mongo_uri else "mongomock",
+        "modelo": enrich_sentiment.MODEL_NAME if enrich_sentiment and args.modelo == "real" else args.modelo,
+        "navegador": args.navegador,
+        "escala": {
+            "categorias": args.categorias, "paginas": args.paginas,
+            "productos_por_pagina": args.productos_por_pagina,
+            "reseñas_por_producto": args.reseñas_por_producto, "kb_pagina": args.kb_pagina,
+            "grabadas": bool(args.html_listado or args.html_producto),
+        },
+        "etapas": etapas,
+        "metricas": resumen_metricas,
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(salida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(salida, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Benchmark de inferencia de sentimiento.
+
+Mide reseñas/seg, latencia p50/p99 por lote y RSS máximo de
+`analizar_sentimiento` para distintas combinaciones de tamaño de lote, hilos
+y backend (transformers/torch, torch sobre ids pretokenizados y ONNX Runtime
+si está instalado). Cada combinación corre en su propio subproceso, así el
+RSS máximo es el de esa combinación y no el pico acumulado de las anteriores.
+
+Uso:
+    python bench_sentiment.py
+    python bench_sentiment.py --corpus reseñas.txt --lotes 1 8 32 --hilos 1 4
+    python bench_sentiment.py --salida bench_nuevo.json --comparar bench_base.json
+
+Funciona sin conexión una vez que los archivos del modelo están en la caché
+de HuggingFace (no se conecta a MongoDB).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Sin red: usar solo los archivos del modelo ya descargados
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+from sentiment_model import (
+    MODEL_NAME, cargar_pipeline, cargar_pipeline_onnx,
+    max_tokens_modelo, obtener_token_ids, analizar_ids,
+)
+
+
+# ------------------------
+# Corpus sintético
+# ------------------------
+FRASES_POSITIVAS = [
+    "Excelente calidad, llegó antes de lo esperado",
+    "El sonido es muy claro y la batería dura todo el día",
+    "Muy buen producto, lo recomiendo totalmente",
+    "La imagen del televisor es espectacular",
+    "Cómodos y livianos, perfectos para el gimnasio",
+    "La laptop es rápida y no se calienta",
+]
+FRASES_NEGATIVAS = [
+    "Dejó de funcionar a las dos semanas",
+    "La batería no dura nada y se calienta mucho",
+    "Llegó con la pantalla rayada y el vendedor no responde",
+    "El audio se corta constantemente por bluetooth",
+    "Pésima calidad, no lo recomiendo",
+]
+FRASES_NEUTRAS = [
+    "Es lo que dice la descripción",
+    "Cumple para el precio que tiene",
+    "Todavía no lo he usado lo suficiente",
+    "El empaque venía un poco maltratado pero el producto bien",
+]
+CONECTORES = [", además ", ". ", ", pero ", " y ", ". También ", ", aunque "]
+APERTURAS = ["", "", "La verdad ", "En general ", "Hola, ", "Bueno, ", "Sinceramente ",
+             "Después de un mes de uso: ", "Para mi hijo. ", "Segunda vez que compro. "]
+CIERRES = ["", "", " Gracias.", " 5 estrellas.", " Volvería a comprar.", " Saludos.",
+           " Nada más que decir.", " Lo uso a diario.", " Ojo con eso.", " 10/10"]
+
+
+def generar_corpus(n=2000, tasa_duplicados=0.15, semilla=42):
+    """
+    Genera reseñas en español con longitud log-normal (la mayoría cortas,
+    algunas largas) y una fracción de duplicados exactos, similar a lo que
+    se extrae de MercadoLibre.
+    """
+    rnd = random.Random(semilla)
+    frases = FRASES_POSITIVAS + FRASES_NEGATIVAS + FRASES_NEUTRAS
+    corpus = []
+
+    for _ in range(n):
+        if corpus and rnd.random() < tasa_duplicados:
+            corpus.append(rnd.choice(corpus))
+            continue
+
+        # Número de frases ~ log-normal (mediana ~2, cola larga hasta ~25)
+        n_frases = max(1, min(25, int(rnd.lognormvariate(0.7, 0.8))))
+        partes = [rnd.choice(APERTURAS) + rnd.choice(frases)]
+        for _ in range(n_frases - 1):
+            partes.append(rnd.choice(CONECTORES) + rnd.choice(frases).lower())
+        corpus.append("".join(partes) + rnd.choice([".", "!", "", " 👍"]) + rnd.choice(CIERRES))
+
+    return corpus
+
+
+def cargar_corpus(ruta):
+    """Carga un corpus desde .txt (una reseña por línea) o .jsonl (campo reseña_texto/texto)."""
+    textos = []
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            if ruta.endswith(".jsonl"):
+                doc = json.loads(linea)
+                linea = doc.get("reseña_texto") or doc.get("texto") or ""
+            if linea:
+                textos.append(linea)
+    return textos
+
+
+def describir_corpus(textos):
+    longitudes = sorted(len(t) for t in textos)
+    return {
+        "reseñas": len(textos),
+        "unicas": len(set(textos)),
+        "tasa_duplicados": round(1 - len(set(textos)) / len(textos), 4) if textos else 0,
+        "caracteres_p50": percentil(longitudes, 50),
+        "caracteres_p99": percentil(longitudes, 99),
+        "caracteres_max": longitudes[-1] if longitudes else 0,
+    }
+
+
+# ------------------------
+# Medición
+# ------------------------
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0
+    k = min(len(valores_ordenados) - 1, max(0, round(p / 100 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[k]
+
+
+def medir(inferir, textos, batch_size, repeticiones_calentamiento=2):
+    """
+    Corre `inferir(lote, batch_size)` sobre el corpus en lotes y retorna las
+    métricas de la corrida.
+    """
+    textos = [t.strip() for t in textos]
+    lotes = [textos[i:i + batch_size] for i in range(0, len(textos), batch_size)]
+
+    # Calentamiento (carga perezosa de pesos, asignación de buffers)
+    for lote in lotes[:repeticiones_calentamiento]:
+        inferir(lote, batch_size)
+
+    # Solo se reparte la latencia por lote: dentro de un lote no hay tiempos
+    # por reseña (la latencia de una reseña sola es la del lote de tamaño 1)
+    latencias_lote = []
+
+    inicio = time.perf_counter()
+    for lote in lotes:
+        t0 = time.perf_counter()
+        inferir(lote, batch_size)
+        latencias_lote.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - inicio
+
+    media_lote = statistics.fmean(latencias_lote)
+    latencias_lote.sort()
+    return {
+        "reseñas_por_seg": round(len(textos) / total, 2),
+        "segundos": round(total, 3),
+        "lote_ms_p50": round(percentil(latencias_lote, 50), 3),
+        "lote_ms_p99": round(percentil(latencias_lote, 99), 3),
+        "lote_ms_media": round(media_lote, 3),
+        "reseña_ms_media": round(total * 1000 / len(textos), 3),
+    }
+
+
+def inferencia_pipeline(pipe):
+    """Texto → pipeline de transformers, truncando por tokens."""
+    max_tokens = max_tokens_modelo(pipe.tokenizer)
+
+    def inferir(lote, batch_size):
+        return pipe(lote, batch_size=batch_size, truncation=True, max_length=max_tokens)
+
+    return inferir
+
+
+def inferencia_ids(pipe):
+    """Tokenización en hilos + inferencia directa sobre ids (ruta de enrich_sentiment)."""
+    max_tokens = max_tokens_modelo(pipe.tokenizer)
+
+    def inferir(lote, batch_size):
+        lista_ids = obtener_token_ids(pipe.tokenizer, lote, max_tokens)
+        return analizar_ids(pipe, lista_ids, batch_size=batch_size)
+
+    return inferir
+
+
+def cargar_backend(nombre, hilos):
+    """Retorna la función de inferencia del backend, o None si no está disponible."""
+    if nombre in ("torch", "torch-ids"):
+        pipe = cargar_pipeline(MODEL_NAME, device=-1)
+        return inferencia_pipeline(pipe) if nombre == "torch" else inferencia_ids(pipe)
+    if nombre == "onnx":
+        # ONNX Runtime fija sus hilos al crear la sesión
+        pipe = cargar_pipeline_onnx(MODEL_NAME, hilos=hilos)
+        return inferencia_pipeline(pipe) if pipe is not None else None
+    return None
+
+
+def textos_de(args):
+    return cargar_corpus(args.corpus) if args.corpus else generar_corpus(args.n, args.duplicados)
+
+
+def medir_configuracion(args, nombre, hilos, batch_size):
+    """Mide una combinación (se corre en un subproceso aparte) e imprime el resultado en JSON."""
+    import torch
+
+    torch.set_num_threads(hilos)
+    inferir = cargar_backend(nombre, hilos)
+    if inferir is None:
+        print(json.dumps({"omitido": True}))
+        return
+    metricas = medir(inferir, textos_de(args), batch_size)
+    # ru_maxrss: KB en Linux; el proceso solo corrió esta combinación
+    metricas["rss_pico_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(metricas))
+
+
+def correr_configuracion(args, nombre, hilos, batch_size):
+    """Lanza `medir_configuracion` en su propio proceso y retorna sus métricas (o None)."""
+    comando = [sys.executable, __file__, "--medir", nombre, str(hilos), str(batch_size),
+               "--n", str(args.n), "--duplicados", str(args.duplicados)]
+    if args.corpus:
+        comando += ["--corpus", args.corpus]
+    salida = subprocess.check_output(comando, text=True)
+    metricas = json.loads(salida.strip().splitlines()[-1])
+    return None if metricas.get("omitido") else metricas
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def comparar(actual, anterior):
+    """Imprime la variación de reseñas/seg entre dos archivos de resultados."""
+    previos = {
+        (r["backend"], r["hilos"], r["batch_size"]): r for r in anterior.get("resultados", [])
+    }
+    print(f"\nComparación con {anterior.get('commit') or 'resultado anterior'}:")
+    for r in actual["resultados"]:
+        clave = (r["backend"], r["hilos"], r["batch_size"])
+        if clave not in previos:
+            continue
+        antes = previos[clave]["reseñas_por_seg"]
+        cambio = (r["reseñas_por_seg"] - antes) * 100 / antes if antes else 0
+        print(f"  {clave[0]:>6} | hilos={clave[1]:<2} | lote={clave[2]:<3} | "
+              f"{antes:>8.1f} → {r['reseñas_por_seg']:>8.1f} rev/s ({cambio:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia de sentimiento")
+    parser.add_argument("--corpus", help="Archivo .txt o .jsonl con reseñas (por defecto: sintético)")
+    parser.add_argument("--n", type=int, default=2000, help="Reseñas del corpus sintético")
+    parser.add_argument("--duplicados", type=float, default=0.15, help="Tasa de duplicados del corpus sintético")
+    parser.add_argument("--lotes", type=int, nargs="+", default=[1, 8, 32], help="Tamaños de lote")
+    parser.add_argument("--hilos", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="Hilos de torch / de la sesión de ONNX Runtime")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-ids", "onnx"],
+                        help="torch, torch-ids y/o onnx")
+    parser.add_argument("--salida", default="bench_sentiment.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--medir", nargs=3, metavar=("BACKEND", "HILOS", "LOTE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        nombre, hilos, batch_size = args.medir
+        medir_configuracion(args, nombre, int(hilos), int(batch_size))
+        return
+
+    import torch
+
+    print("="*80)
+    print("BENCHMARK DE INFERENCIA DE SENTIMIENTO")
+    print("="*80)
+
+    info_corpus = describir_corpus(textos_de(args))
+    print(f"Corpus: {info_corpus}")
+
+    print("\nCada combinación corre en su propio proceso (carga el modelo de nuevo)...")
+    combinaciones = [(h, b) for h in sorted(set(args.hilos)) for b in args.lotes]
+    resultados = []
+    for nombre in args.backends:
+        if nombre not in ("torch", "torch-ids", "onnx"):
+            print(f"  Backend desconocido: {nombre}, se omite")
+            continue
+        for hilos, batch_size in combinaciones:
+            metricas = correr_configuracion(args, nombre, hilos, batch_size)
+            if metricas is None:
+                print("  ONNX Runtime no disponible (pip install optimum[onnxruntime]), se omite")
+                break
+            fila = {"backend": nombre, "hilos": hilos, "batch_size": batch_size, **metricas}
+            resultados.append(fila)
+            print(f"  {nombre:>6} | hilos={hilos:<2} | lote={batch_size:<3} | "
+                  f"{metricas['reseñas_por_seg']:>8.1f} rev/s | "
+                  f"lote p50={metricas['lote_ms_p50']:.2f}ms p99={metricas['lote_ms_p99']:.2f}ms | "
+                  f"RSS={metricas['rss_pico_mb']}MB")
+
+    if not resultados:
+        print("No hay backends disponibles")
+        return
+
+    salida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "modelo": MODEL_NAME,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpu": platform.processor() or platform.machine(),
+        "corpus": info_corpus,
+        "resultados": resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(salida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(salida, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
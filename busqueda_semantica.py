@@ -0,0 +1,343 @@
+"""
+Búsqueda semántica de reseñas con embeddings locales (CPU).
+
+    python busqueda_semantica.py --indexar                  # agrega las reseñas nuevas al índice
+    python busqueda_semantica.py "la batería se calienta"   # top-k desde la terminal
+    python busqueda_semantica.py --bench 500000             # tiempo por búsqueda con vectores sintéticos
+
+Cada reseña se codifica con un modelo de sentence-transformers (cargado con
+transformers: mean pooling y normalización L2) y el vector se guarda en un
+índice en disco:
+
+    indice_semantico/
+    ├── vectores.bin   # filas × dim en float16 (o int8 con EMBEDDINGS_TIPO=int8)
+    ├── ids.bin        # _id (ObjectId, 12 bytes) de cada fila
+    ├── categorias.bin # categoría de cada fila (uint16, índice en meta.json)
+    └── meta.json      # modelo, dimensión, tipo, filas, categorías y último _id indexado
+
+El índice se abre con np.memmap (no se carga entero en memoria) y las
+reseñas nuevas se agregan al final. Con vectores normalizados la similitud
+coseno es un producto punto, que se calcula por bloques; el filtro por
+categoría se aplica ahí mismo, antes del top-k.
+
+    EMBEDDINGS_MODELO   modelo (por defecto sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2)
+    EMBEDDINGS_DIR      directorio del índice (por defecto indice_semantico)
+    EMBEDDINGS_TIPO     float16 (por defecto) o int8
+    EMBEDDINGS_BATCH    reseñas por lote de inferencia (por defecto 64)
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+import base_datos
+
+MODELO = os.getenv("EMBEDDINGS_MODELO", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+DIRECTORIO = os.getenv("EMBEDDINGS_DIR", "indice_semantico")
+TIPO = os.getenv("EMBEDDINGS_TIPO", "float16")
+BATCH = int(os.getenv("EMBEDDINGS_BATCH", "64"))
+MAX_TOKENS = 128
+
+# Valor de un componente almacenado → float (int8: componentes de [-1, 1] × 127)
+ESCALAS = {"float16": 1.0, "int8": 1 / 127}
+# Filas por bloque al calcular similitudes (~12 MB en float32 con dim 384: cabe en caché)
+FILAS_BLOQUE = 8192
+
+COLUMNAS_RESULTADO = ["similitud", "reseña_texto", "sentiment_label", "sentiment_stars",
+                      "categoria", "titulo_producto"]
+
+
+# ------------------------
+# Modelo de embeddings
+# ------------------------
+class Codificador:
+    """Embeddings normalizados de textos con un modelo de transformers."""
+
+    def __init__(self, modelo=MODELO, max_tokens=MAX_TOKENS):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.nombre = modelo
+        self.tokenizer = AutoTokenizer.from_pretrained(modelo)
+        self.modelo = AutoModel.from_pretrained(modelo).eval()
+        self.max_tokens = max_tokens
+        self.dim = self.modelo.config.hidden_size
+
+    def codificar(self, textos, batch_size=BATCH):
+        """Matriz float32 (len(textos) × dim) con filas de norma 1."""
+        if not textos:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # Lotes de textos de largo parecido: menos relleno por lote
+        orden = sorted(range(len(textos)), key=lambda i: len(textos[i]))
+        salida = np.empty((len(textos), self.dim), dtype=np.float32)
+        with self.torch.inference_mode():
+            for inicio in range(0, len(orden), batch_size):
+                indices = orden[inicio:inicio + batch_size]
+                lote = self.tokenizer([textos[i] for i in indices], padding=True, truncation=True,
+                                      max_length=self.max_tokens, return_tensors="pt")
+                estados = self.modelo(**lote).last_hidden_state
+                mascara = lote["attention_mask"].unsqueeze(-1).to(estados.dtype)
+                promedio = (estados * mascara).sum(1) / mascara.sum(1).clamp(min=1e-9)
+                salida[indices] = self.torch.nn.functional.normalize(promedio, dim=1).numpy()
+        return salida
+
+
+# ------------------------
+# Índice en disco
+# ------------------------
+def cuantizar(vectores, tipo):
+    if tipo == "int8":
+        return np.clip(np.round(vectores * 127), -127, 127).astype(np.int8)
+    return vectores.astype(np.float16)
+
+
+class IndiceSemantico:
+    """Vectores e _id en archivos binarios de ancho fijo, abiertos con np.memmap."""
+
+    def __init__(self, directorio=DIRECTORIO):
+        self.directorio = directorio
+        self.ruta_vectores = os.path.join(directorio, "vectores.bin")
+        self.ruta_ids = os.path.join(directorio, "ids.bin")
+        self.ruta_categorias = os.path.join(directorio, "categorias.bin")
+        self.ruta_meta = os.path.join(directorio, "meta.json")
+        self.meta = None
+        self.mtime = None
+        self.actualizar()
+
+    def actualizar(self):
+        """Vuelve a abrir los archivos si otro proceso agregó filas (cambió meta.json)."""
+        try:
+            mtime = os.stat(self.ruta_meta).st_mtime_ns
+        except FileNotFoundError:
+            self.meta, self.vectores, self.ids = None, None, None
+            return
+        if mtime == self.mtime:
+            return
+        with open(self.ruta_meta, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.mtime = mtime
+        self._abrir()
+
+    def _abrir(self):
+        # Solo las filas registradas en meta.json: lo escrito después (un corte
+        # a mitad de un lote) no se lee y se sobrescribe en el próximo agregar()
+        filas, dim = self.meta["filas"], self.meta["dim"]
+        if filas == 0:
+            self.vectores = np.zeros((0, dim), dtype=self.meta["tipo"])
+            self.ids = np.zeros((0, 12), dtype=np.uint8)
+            self.categorias = np.zeros(0, dtype=np.uint16)
+            return
+        self.vectores = np.memmap(self.ruta_vectores, dtype=self.meta["tipo"], mode="r", shape=(filas, dim))
+        self.ids = np.memmap(self.ruta_ids, dtype=np.uint8, mode="r", shape=(filas, 12))
+        # Índices anteriores a categorias.bin: se filtra solo en MongoDB
+        self.categorias = (np.memmap(self.ruta_categorias, dtype=np.uint16, mode="r", shape=(filas,))
+                           if "categorias" in self.meta else None)
+
+    def __len__(self):
+        return self.meta["filas"] if self.meta else 0
+
+    def ultimo_id(self):
+        ultimo = (self.meta or {}).get("ultimo_id")
+        return ObjectId(ultimo) if ultimo else None
+
+    def agregar(self, ids, vectores, ultimo_id, modelo, tipo=TIPO, categorias=None):
+        """
+        Agrega filas al final y registra `ultimo_id` (el último _id revisado,
+        tenga o no texto). `categorias` trae la categoría de cada fila.
+        meta.json se escribe al final: es el punto de control.
+        """
+        if self.meta is None:
+            os.makedirs(self.directorio, exist_ok=True)
+            self.meta = {"modelo": modelo, "dim": int(vectores.shape[1]), "tipo": tipo,
+                         "filas": 0, "categorias": [], "ultimo_id": None}
+        elif self.meta["modelo"] != modelo:
+            raise ValueError(f"El índice de {self.directorio} usa {self.meta['modelo']}, no {modelo}: "
+                             f"bórralo para reconstruirlo")
+        elif "categorias" not in self.meta:
+            raise ValueError(f"El índice de {self.directorio} no guarda categorías: bórralo para reconstruirlo")
+
+        filas = self.meta["filas"]
+        datos = cuantizar(vectores, self.meta["tipo"])
+        binarios = b"".join(ObjectId(i).binary for i in ids)
+        nombres = self.meta["categorias"]
+        for categoria in categorias or []:
+            if categoria not in nombres:
+                nombres.append(categoria)
+        codigos = np.array([nombres.index(c) for c in categorias] if categorias else np.zeros(len(ids)),
+                           dtype=np.uint16)
+        for ruta, contenido, ancho in ((self.ruta_vectores, datos.tobytes(), datos.itemsize * self.meta["dim"]),
+                                       (self.ruta_ids, binarios, 12),
+                                       (self.ruta_categorias, codigos.tobytes(), codigos.itemsize)):
+            with open(ruta, "ab") as f:
+                f.truncate(filas * ancho)
+                f.write(contenido)
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.meta["filas"] = filas + len(ids)
+        self.meta["ultimo_id"] = str(ultimo_id)
+        tmp = self.ruta_meta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.ruta_meta)
+        self.mtime = None
+        self.actualizar()
+
+    def filtra_categorias(self):
+        """True si buscar() puede filtrar por categoría (índice con categorias.bin)."""
+        self.actualizar()
+        return self.meta is not None and "categorias" in self.meta
+
+    def buscar(self, consulta, k=20, categoria=None):
+        """
+        [(ObjectId, similitud)] de las k filas más parecidas al vector `consulta`,
+        solo de `categoria` si se indica (y el índice guarda categorías).
+        """
+        self.actualizar()
+        if not len(self):
+            return []
+        codigo = None
+        if categoria is not None and self.categorias is not None:
+            if categoria not in self.meta["categorias"]:
+                return []
+            codigo = self.meta["categorias"].index(categoria)
+        q = np.asarray(consulta, dtype=np.float32)
+        puntajes, posiciones = [], []
+        for inicio in range(0, len(self), FILAS_BLOQUE):
+            bloque = np.asarray(self.vectores[inicio:inicio + FILAS_BLOQUE], dtype=np.float32) @ q
+            if codigo is not None:
+                bloque[self.categorias[inicio:inicio + FILAS_BLOQUE] != codigo] = -np.inf
+            if len(bloque) > k:
+                mejores = np.argpartition(bloque, -k)[-k:]
+            else:
+                mejores = np.arange(len(bloque))
+            puntajes.append(bloque[mejores])
+            posiciones.append(mejores + inicio)
+        puntajes = np.concatenate(puntajes)
+        posiciones = np.concatenate(posiciones)
+        orden = np.argsort(-puntajes)[:k]
+        escala = ESCALAS[self.meta["tipo"]]
+        return [(ObjectId(self.ids[posiciones[i]].tobytes()), float(puntajes[i] * escala))
+                for i in orden if np.isfinite(puntajes[i])]
+
+
+# ------------------------
+# Indexación y consultas
+# ------------------------
+def indexar(lote=1000, codificador=None, indice=None):
+    """
+    Agrega al índice las reseñas con _id mayor al último indexado. Se
+    indexan todas las que tienen texto (no solo las enriquecidas), así la
+    marca por _id no se salta reseñas que se enriquezcan más tarde.
+    """
+    reseñas = base_datos.raw_reviews()
+    indice = indice if indice is not None else IndiceSemantico()
+    codificador = codificador if codificador is not None else Codificador()
+    ultimo = indice.ultimo_id()
+    nuevas = 0
+    while True:
+        filtro = {"_id": {"$gt": ultimo}} if ultimo is not None else {}
+        docs = list(reseñas.find(filtro, {"reseña_texto": 1, "categoria": 1}).sort("_id", 1).limit(lote))
+        if not docs:
+            break
+        con_texto = [(d["_id"], d["reseña_texto"].strip(), d.get("categoria") or "")
+                     for d in docs if (d.get("reseña_texto") or "").strip()]
+        inicio = time.perf_counter()
+        vectores = codificador.codificar([texto for _, texto, _ in con_texto])
+        segundos = time.perf_counter() - inicio
+        ultimo = docs[-1]["_id"]
+        indice.agregar([_id for _id, _, _ in con_texto], vectores, ultimo, codificador.nombre,
+                       categorias=[categoria for _, _, categoria in con_texto])
+        nuevas += len(con_texto)
+        print(f"  {len(indice)} reseñas en el índice (+{len(con_texto)}, "
+              f"{len(con_texto) / segundos if segundos else 0:.0f} reseñas/s)")
+    return nuevas
+
+
+def buscar_reseñas(indice, codificador, consulta, k=20, categoria=None):
+    """
+    DataFrame con las k reseñas enriquecidas más parecidas a `consulta`
+    (opcionalmente de una categoría), ordenadas por similitud.
+
+    La categoría se filtra en el índice, antes del top-k. Que la reseña esté
+    enriquecida cambia con el tiempo y se verifica en MongoDB: si entre los
+    candidatos no alcanzan k, se piden más hasta completar o agotar el índice.
+    """
+    categoria = categoria if categoria and categoria != "Todas" else None
+    vector = codificador.codificar([consulta])[0]
+    filtro = {"sentiment_label": {"$exists": True}}
+    if categoria and not indice.filtra_categorias():
+        filtro["categoria"] = categoria
+    proyeccion = {campo: 1 for campo in COLUMNAS_RESULTADO[1:]}
+    pedidos = k * 2
+    while True:
+        candidatos = dict(indice.buscar(vector, pedidos, categoria))
+        if not candidatos:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+        docs = base_datos.raw_reviews().find({**filtro, "_id": {"$in": list(candidatos)}}, proyeccion)
+        filas = [{**doc, "similitud": round(candidatos[doc["_id"]], 3)} for doc in docs]
+        if len(filas) >= k or len(candidatos) < pedidos:
+            break
+        pedidos *= 4
+    filas.sort(key=lambda fila: -fila["similitud"])
+    return pd.DataFrame(filas[:k], columns=COLUMNAS_RESULTADO)
+
+
+def bench(n, dim=384, consultas=20, tipo=TIPO):
+    """Tiempo por búsqueda sobre n vectores aleatorios (índice temporal en disco)."""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directorio:
+        indice = IndiceSemantico(directorio)
+        rng = np.random.default_rng(0)
+        for inicio in range(0, n, 100_000):
+            filas = min(100_000, n - inicio)
+            vectores = rng.standard_normal((filas, dim), dtype=np.float32)
+            vectores /= np.linalg.norm(vectores, axis=1, keepdims=True)
+            ids = [ObjectId() for _ in range(filas)]
+            indice.agregar(ids, vectores, ids[-1], "sintetico", tipo)
+        tamaño = os.path.getsize(indice.ruta_vectores) / 1024 / 1024
+
+        tiempos = []
+        for _ in range(consultas):
+            q = rng.standard_normal(dim, dtype=np.float32)
+            inicio = time.perf_counter()
+            indice.buscar(q / np.linalg.norm(q), k=20)
+            tiempos.append(time.perf_counter() - inicio)
+        tiempos.sort()
+        print(f"{n} vectores × {dim} ({tipo}, {tamaño:.0f} MB): "
+              f"p50 {tiempos[len(tiempos) // 2] * 1000:.0f} ms · máx {tiempos[-1] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsqueda semántica de reseñas")
+    parser.add_argument("consulta", nargs="?", help="texto a buscar")
+    parser.add_argument("--indexar", action="store_true", help="agregar las reseñas nuevas al índice")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--categoria")
+    parser.add_argument("--lote", type=int, default=1000)
+    parser.add_argument("--bench", type=int, metavar="N", help="medir la búsqueda sobre N vectores sintéticos")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        return
+    codificador = Codificador()
+    indice = IndiceSemantico()
+    if args.indexar:
+        print(f"Agregadas {indexar(args.lote, codificador, indice)} reseñas")
+    if args.consulta:
+        inicio = time.perf_counter()
+        resultados = buscar_reseñas(indice, codificador, args.consulta, args.k, args.categoria)
+        print(f"{len(resultados)} resultados en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        for fila in resultados.itertuples():
+            print(f"  {fila.similitud:.3f} [{fila.sentiment_label}] {str(fila.reseña_texto)[:90]}")
+
+
+if __name__ == "__main__":
+    main()
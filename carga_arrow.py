@@ -0,0 +1,178 @@
+"""
+Carga de reseñas desde MongoDB directo a tablas Arrow (columnar).
+
+Con PyMongoArrow los documentos BSON se decodifican por lotes directamente
+en columnas Arrow, sin crear un dict de Python por reseña ni copiar cada
+campo dos veces en pd.DataFrame(list(cursor)). Si pymongoarrow no está
+instalado se usa el camino anterior (cursor → lista de dicts → DataFrame).
+
+Benchmark de tiempo de carga y memoria máxima de ambos caminos:
+
+    python carga_arrow.py --sembrar 500000     # opcional: datos sintéticos en bench_reviews
+    python carga_arrow.py --bench --coleccion bench_reviews
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import pyarrow as pa
+
+from dataframe_compacto import COLUMNAS_CATEGORICAS, compactar
+
+try:
+    from pymongoarrow.api import Schema, aggregate_arrow_all
+    ARROW_DISPONIBLE = True
+except ImportError:
+    ARROW_DISPONIBLE = False
+
+# Tipo Arrow de cada campo que puede pedir el dashboard
+TIPOS_ARROW = {
+    "_id": pa.string(),  # ObjectId → string en el servidor ($toString)
+    "categoria": pa.string(),
+    "titulo_producto": pa.string(),
+    "reseña_texto": pa.string(),
+    "sentiment_label": pa.string(),
+    "sentiment_stars": pa.int32(),
+    "sentiment_actualizado": pa.timestamp("ms"),
+}
+
+
+def esquema_para(proyeccion):
+    """Schema de PyMongoArrow con los campos incluidos en una proyección de find()."""
+    return Schema({campo: TIPOS_ARROW[campo] for campo, incluir in proyeccion.items() if incluir})
+
+
+def cargar_tabla_arrow(coleccion, filtro, proyeccion):
+    """
+    Ejecuta el filtro en MongoDB y decodifica el resultado en una tabla Arrow.
+    Las columnas categóricas se codifican como diccionario (pandas las recibe
+    como category sin pasar por object).
+    """
+    campos = {campo: 1 for campo, incluir in proyeccion.items() if incluir}
+    if "_id" in campos:
+        campos["_id"] = {"$toString": "$_id"}
+    else:
+        campos["_id"] = 0
+
+    pipeline = [{"$match": filtro}, {"$project": campos}]
+    tabla = aggregate_arrow_all(coleccion, pipeline, schema=esquema_para(proyeccion))
+
+    for col in COLUMNAS_CATEGORICAS:
+        if col in tabla.column_names:
+            indice = tabla.column_names.index(col)
+            tabla = tabla.set_column(indice, col, tabla.column(col).dictionary_encode())
+    return tabla
+
+
+def cargar_dataframe(coleccion, filtro, proyeccion, usar_arrow=True):
+    """
+    DataFrame compacto con las reseñas que cumplen `filtro`. Usa Arrow si
+    está disponible y, si no, el camino por cursor de PyMongo.
+    Con el esquema compacto los atributos del producto se agregan por columna
+    desde el diccionario de productos (ver esquema.py).
+    """
+    # No hasattr: una Collection de PyMongo responde a cualquier atributo (subcolección)
+    from esquema import ReseñasCompactas
+    if isinstance(coleccion, ReseñasCompactas):
+        return compactar(coleccion.dataframe(filtro, proyeccion))
+
+    if usar_arrow and ARROW_DISPONIBLE:
+        tabla = cargar_tabla_arrow(coleccion, filtro, proyeccion)
+        df = tabla.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+        return compactar(df)
+
+    data = list(coleccion.find(filtro, proyeccion))
+    columnas = [campo for campo, incluir in proyeccion.items() if incluir]
+    return compactar(pd.DataFrame(data, columns=columnas))
+
+
+# ------------------------
+# Benchmark
+# ------------------------
+PROYECCION_DASHBOARD = {"_id": 1, "categoria": 1, "titulo_producto": 1,
+                        "sentiment_label": 1, "sentiment_stars": 1, "sentiment_actualizado": 1}
+
+
+def conectar():
+    import base_datos
+    return base_datos.db()
+
+
+def sembrar(coleccion, n):
+    """Inserta n reseñas sintéticas enriquecidas (sin tocar raw_reviews)."""
+    from datetime import datetime
+    from dataframe_compacto import generar_sintetico
+
+    df = generar_sintetico(n).drop(columns=["_id"])
+    df["sentiment_actualizado"] = datetime.utcnow()
+    coleccion.drop()
+    registros = df.to_dict("records")
+    for i in range(0, len(registros), 10_000):
+        coleccion.insert_many(registros[i:i + 10_000], ordered=False)
+    print(f"Insertadas {n} reseñas sintéticas en {coleccion.name}")
+
+
+def medir_camino(nombre_coleccion, camino):
+    """Carga una vez con el camino indicado (se corre en un subproceso aparte)."""
+    coleccion = conectar()[nombre_coleccion]
+    inicio = time.perf_counter()
+    df = cargar_dataframe(
+        coleccion, {"sentiment_label": {"$exists": True}}, PROYECCION_DASHBOARD,
+        usar_arrow=(camino == "arrow"),
+    )
+    segundos = time.perf_counter() - inicio
+    print(json.dumps({
+        "camino": camino,
+        "filas": len(df),
+        "segundos": round(segundos, 3),
+        # ru_maxrss: KB en Linux
+        "rss_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "df_mb": round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1),
+    }))
+
+
+def bench(nombre_coleccion):
+    """Corre cada camino en su propio proceso para medir la memoria máxima por separado."""
+    caminos = ["cursor", "arrow"] if ARROW_DISPONIBLE else ["cursor"]
+    if not ARROW_DISPONIBLE:
+        print("pymongoarrow no está instalado: solo se mide el camino por cursor")
+
+    for camino in caminos:
+        salida = subprocess.check_output(
+            [sys.executable, __file__, "--medir", camino, "--coleccion", nombre_coleccion],
+            text=True,
+        )
+        r = json.loads(salida.strip().splitlines()[-1])
+        print(f"  {r['camino']:>6} | {r['filas']} filas | {r['segundos']:.2f}s | "
+              f"RSS pico {r['rss_pico_mb']} MB | DataFrame {r['df_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga Arrow desde MongoDB")
+    parser.add_argument("--coleccion", default="raw_reviews")
+    parser.add_argument("--sembrar", type=int, help="Insertar N reseñas sintéticas en --coleccion")
+    parser.add_argument("--bench", action="store_true", help="Comparar cursor vs Arrow")
+    parser.add_argument("--medir", choices=["cursor", "arrow"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        medir_camino(args.coleccion, args.medir)
+        return
+    if args.sembrar:
+        if args.coleccion == "raw_reviews":
+            print("Usa --coleccion distinta de raw_reviews para los datos sintéticos")
+            return
+        sembrar(conectar()[args.coleccion], args.sembrar)
+    if args.bench:
+        print("="*80)
+        print(f"CARGA DE {args.coleccion}: cursor de PyMongo vs PyMongoArrow")
+        print("="*80)
+        bench(args.coleccion)
+
+
+if __name__ == "__main__":
+    main()
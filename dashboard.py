@@ -1,54 +1,456 @@
 import os
+import shutil
+import threading
+import time
+import uuid
 import pandas as pd
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from bson import ObjectId
 import streamlit as st
 import altair as alt
 from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-import re
+from io import BytesIO
+from render_cache import CacheRender
+from dataframe_compacto import compactar
+from indice_productos import IndiceProductos, Producto
+from exportar import exportar_reseñas, filtro_exportacion
+from terminos import MotorTerminos, leer_documentos
+from duplicados import FILTRO_REPRESENTANTES
+import busqueda_semantica
+import base_datos
 
 
-# Config MongoDB
+# Config MongoDB (conexión compartida y perezosa, ver base_datos.py)
 
-load_dotenv()
-MONGODB_URI = os.getenv("MONGODB_URI")
+# Modo sin Atlas: leer un snapshot Parquet (ver snapshot.py) con DuckDB
+SNAPSHOT_DIR = os.getenv("DASHBOARD_SNAPSHOT")
 
-if not MONGODB_URI:
-    raise ValueError("No se encontró MONGODB_URI en el .env")
-
-client = MongoClient(MONGODB_URI)
-db = client["ml_reviews"]
-reviews_col = db["raw_reviews"]
+if SNAPSHOT_DIR:
+    products_col = reviews_col = term_freq_col = meta_col = product_stats_col = None
+else:
+    products_col = base_datos.products()
+    reviews_col = base_datos.raw_reviews()
+    term_freq_col = base_datos.term_freq()
+    meta_col = base_datos.meta()
+    product_stats_col = base_datos.product_stats()
 
 
 # Funciones auxiliares
 
+FILTRO_ENRIQUECIDAS = {"sentiment_label": {"$exists": True}}
+
+
+def filtro_categoria(categoria=None, sin_duplicadas=False):
+    """
+    Filtro de reseñas enriquecidas, opcionalmente por categoría y sin las
+    casi duplicadas (solo el representante de cada grupo, ver duplicados.py).
+    """
+    filtro = dict(FILTRO_ENRIQUECIDAS)
+    if categoria and categoria != "Todas":
+        filtro["categoria"] = categoria
+    if sin_duplicadas:
+        filtro.update(FILTRO_REPRESENTANTES)
+    return filtro
+
+
+# TTL de la caché de búsquedas semánticas
+TTL_DATOS_SEG = int(os.getenv("DASHBOARD_TTL_SEG", "60"))
+
+
+@st.cache_resource
+def fuente_snapshot():
+    """Conexión DuckDB sobre el snapshot (solo en modo DASHBOARD_SNAPSHOT)."""
+    from snapshot import FuenteSnapshot
+    return FuenteSnapshot(SNAPSHOT_DIR)
+
+
+@st.cache_data(ttl=10)
+def leer_meta():
+    """
+    Marcador de cambios de raw_reviews (lo actualiza enrich_sentiment.py):
+    {"version": int, "reiniciado": fecha del último borrado de sentimientos}.
+    Es una lectura por _id de un solo documento.
+    """
+    if SNAPSHOT_DIR:
+        return {"version": fuente_snapshot().version()}
+    meta = meta_col.find_one({"_id": "raw_reviews"}, {"version": 1, "reiniciado": 1})
+    return meta or {}
+
+
+@st.cache_data(ttl=10)
+def coleccion_inicializada(coleccion):
+    """
+    `coleccion` (product_stats o term_freq) ya cubre todas las reseñas
+    enriquecidas (marca en meta que pone enrich_sentiment.py). Mientras no,
+    se cuenta sobre las reseñas.
+    """
+    return meta_col.find_one({"_id": coleccion, "inicializado": True}, {"_id": 1}) is not None
+
+
+def version_datos():
+    """
+    Versión de los datos enriquecidos. Las funciones cacheadas la reciben
+    como argumento para invalidarse cuando llegan reseñas nuevas.
+    """
+    return leer_meta().get("version", 0)
+
+
+@st.cache_resource
+def cache_render():
+    """Caché de PNGs compartida por todas las sesiones del dashboard."""
+    return CacheRender(
+        max_items=int(os.getenv("RENDER_CACHE_ITEMS", "64")),
+        directorio=os.getenv("RENDER_CACHE_DIR") or None,
+        max_bytes_disco=int(os.getenv("RENDER_CACHE_DIR_MB", "256")) * 1024 * 1024,
+    )
+
+
+def render_nube(frecuencias, colormap):
+    """Genera la nube de palabras como PNG (bytes)."""
+    wc = WordCloud(
+        width=800,
+        height=400,
+        background_color="white",
+        colormap=colormap,
+        max_words=30,  # Reducido a 30 palabras más relevantes
+        relative_scaling=0.5,
+        min_font_size=12,
+        prefer_horizontal=0.7
+    ).generate_from_frequencies(frecuencias)
+
+    buffer = BytesIO()
+    wc.to_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def nube_cacheada(frecuencias, categoria, sentiment_label, colormap, version):
+    """Nube de palabras desde la caché de renders; solo se genera si cambió la versión de los datos."""
+    clave = ("nube", categoria, sentiment_label, version)
+    return cache_render().obtener_o_generar(clave, lambda: render_nube(frecuencias, colormap))
+
+
 @st.cache_data
-def cargar_datos():
+def cargar_resumen(categoria=None, version=0, sin_duplicadas=False):
     """
-    Carga reseñas enriquecidas desde MongoDB a un DataFrame.
-    Solo toma las que ya tienen sentimiento calculado.
+    Conteo por sentimiento y distribución por categoría. Se lee de
+    product_stats (un documento por categoría, lo mantiene enrich_sentiment.py);
+    si aún no está inicializada, o sin las casi duplicadas (product_stats las cuenta),
+    se calcula en MongoDB con un solo $facet sobre las reseñas.
+
+    Retorna (conteo_labels: dict, agrupado: DataFrame[categoria, sentiment_label, conteo]).
     """
-    cursor = reviews_col.find(
-        {"sentiment_label": {"$exists": True}},
-        {"_id": 1, "categoria": 1, "titulo_producto": 1, 
-         "reseña_texto": 1, "sentiment_label": 1, "sentiment_stars": 1}
+    if SNAPSHOT_DIR:
+        return fuente_snapshot().resumen(categoria)
+
+    filtro_stats = {"tipo": "categoria"}
+    if categoria and categoria != "Todas":
+        filtro_stats["categoria"] = categoria
+    filas = [
+        {"categoria": doc.get("categoria"), "sentiment_label": label, "conteo": n}
+        for doc in product_stats_col.find(filtro_stats, {"categoria": 1, "conteo": 1})
+        for label, n in doc.get("conteo", {}).items()
+        if n > 0
+    ] if not sin_duplicadas and coleccion_inicializada("product_stats") else []
+    if filas:
+        agrupado = pd.DataFrame(filas, columns=["categoria", "sentiment_label", "conteo"])
+        conteo_labels = agrupado.groupby("sentiment_label")["conteo"].sum().to_dict()
+        return conteo_labels, agrupado
+
+    pipeline = [
+        {"$match": filtro_categoria(categoria, sin_duplicadas)},
+        {"$facet": {
+            "por_label": [
+                {"$group": {"_id": "$sentiment_label", "conteo": {"$sum": 1}}},
+            ],
+            "por_categoria": [
+                {"$group": {
+                    "_id": {"categoria": "$categoria", "sentiment_label": "$sentiment_label"},
+                    "conteo": {"$sum": 1},
+                }},
+            ],
+        }},
+    ]
+    resultado = next(reviews_col.aggregate(pipeline), {"por_label": [], "por_categoria": []})
+
+    conteo_labels = {d["_id"]: d["conteo"] for d in resultado["por_label"]}
+    agrupado = pd.DataFrame(
+        [
+            {"categoria": d["_id"].get("categoria"),
+             "sentiment_label": d["_id"].get("sentiment_label"),
+             "conteo": d["conteo"]}
+            for d in resultado["por_categoria"]
+        ],
+        columns=["categoria", "sentiment_label", "conteo"],
     )
+    return conteo_labels, agrupado
+
+
+@st.cache_data
+def cargar_frecuencias(categoria=None, sentiment_label=None, limite=200, version=0):
+    """
+    Términos más frecuentes de un sentimiento, desde la tabla materializada
+    term_freq (la mantiene enrich_sentiment.py), sin leer el texto de las reseñas.
+    Si term_freq aún no está inicializada se agrupan los tokens_limpios de las
+    reseñas (más lento; las enriquecidas antes de que existieran no cuentan).
+    Retorna {termino: conteo} ordenado de mayor a menor.
+    """
+    if SNAPSHOT_DIR:
+        return fuente_snapshot().frecuencias(categoria, sentiment_label, limite)
+
+    filtro = {"sentiment_label": sentiment_label}
+    if categoria and categoria != "Todas":
+        filtro["categoria"] = categoria
+    if not coleccion_inicializada("term_freq"):
+        pipeline = [
+            {"$match": {**filtro, "tokens_limpios.0": {"$exists": True}}},
+            {"$unwind": "$tokens_limpios"},
+            {"$group": {"_id": "$tokens_limpios", "conteo": {"$sum": 1}}},
+            {"$sort": {"conteo": -1}},
+            {"$limit": limite},
+        ]
+        return {d["_id"]: d["conteo"] for d in reviews_col.aggregate(pipeline, allowDiskUse=True)}
+    pipeline = [
+        {"$match": filtro},
+        {"$group": {"_id": "$termino", "conteo": {"$sum": "$conteo"}}},
+        {"$match": {"conteo": {"$gt": 0}}},
+        {"$sort": {"conteo": -1}},
+        {"$limit": limite},
+    ]
+    return {d["_id"]: d["conteo"] for d in term_freq_col.aggregate(pipeline)}
+
+
+# Tiempo mínimo entre reconstrucciones del motor de términos aunque cambie la versión
+TTL_TERMINOS_SEG = int(os.getenv("DASHBOARD_TERMINOS_TTL_SEG", "300"))
 
-    data = list(cursor)
-    if not data:
-        return pd.DataFrame()
-    df = pd.DataFrame(data)
-    return df
 
+@st.cache_resource
+def estado_terminos():
+    """Motor de términos distintivos compartido entre sesiones."""
+    return {"motor": None, "version": None, "creado": 0.0, "lock": threading.Lock()}
 
-def calcular_metricas_generales(df: pd.DataFrame):
-    total = len(df)
+
+def motor_terminos(version=0):
+    """
+    Matriz dispersa documento-término de las reseñas enriquecidas. Se arma
+    una vez por versión de los datos (como mucho cada DASHBOARD_TERMINOS_TTL_SEG
+    mientras el enriquecimiento sigue corriendo); las consultas por categoría
+    y sentimiento reutilizan la misma matriz. Retorna (motor, versión con la
+    que se armó), que puede ser anterior a `version` dentro del TTL.
+    """
+    estado = estado_terminos()
+    with estado["lock"]:
+        vigente = estado["motor"] is not None and (
+            estado["version"] == version or time.time() - estado["creado"] < TTL_TERMINOS_SEG
+        )
+        if not vigente:
+            if SNAPSHOT_DIR:
+                documentos = fuente_snapshot().documentos()
+            else:
+                documentos = leer_documentos(reviews_col)
+            estado["motor"] = MotorTerminos(*documentos)
+            estado["version"] = version
+            estado["creado"] = time.time()
+        return estado["motor"], estado["version"]
+
+
+@st.cache_data
+def cargar_distintivos(categoria=None, sentiment_label=None, top=10, version_motor=0):
+    """
+    Términos (unigramas y bigramas) más distintivos de un sentimiento por
+    log-odds. La caché va por la versión del motor, no la de los datos: si no,
+    un motor todavía viejo quedaría guardado como resultado de la versión nueva.
+    """
+    motor, _ = motor_terminos(version_motor)
+    return motor.distintivos(sentiment_label, categoria, top)
+
+
+# Reseñas por página en la tabla de detalle por producto
+RESEÑAS_POR_PAGINA = 20
+
+
+@st.cache_resource(ttl=600)
+def indice_productos():
+    """
+    Índice en memoria de títulos (prefijo y subcadena) construido una vez
+    y compartido entre sesiones; se reconstruye cada 10 minutos.
+    """
+    if SNAPSHOT_DIR:
+        productos = fuente_snapshot().productos()
+    else:
+        cursor = products_col.find({}, {"titulo": 1, "categoria": 1})
+        productos = (Producto(d["_id"], d.get("titulo"), d.get("categoria")) for d in cursor)
+    return IndiceProductos(productos)
+
+
+def id_producto_mongo(producto_id):
+    """Los ids llegan como texto (st.cache_data no puede hashear ObjectId)."""
+    return ObjectId(producto_id) if ObjectId.is_valid(producto_id) else producto_id
+
+
+@st.cache_data
+def cargar_conteo_duplicadas(version=0):
+    """Reseñas marcadas como casi duplicadas (índice disperso sobre duplicado_de)."""
+    return reviews_col.count_documents({"duplicado_de": {"$exists": True}})
+
+
+@st.cache_data
+def cargar_conteo_producto(producto_id, version=0, sin_duplicadas=False):
+    """
+    Conteo por sentimiento de un producto: lectura por _id en product_stats
+    o, si el producto no está ahí, consulta indexada por producto_mongo_id.
+    """
+    if SNAPSHOT_DIR:
+        return fuente_snapshot().conteo_producto(producto_id)
+    stats = None if sin_duplicadas or not coleccion_inicializada("product_stats") else product_stats_col.find_one(
+        {"_id": id_producto_mongo(producto_id)}, {"conteo": 1}
+    )
+    if stats:
+        return {label: n for label, n in stats.get("conteo", {}).items() if n > 0}
+    pipeline = [
+        {"$match": {"producto_mongo_id": id_producto_mongo(producto_id),
+                    **filtro_categoria(sin_duplicadas=sin_duplicadas)}},
+        {"$group": {"_id": "$sentiment_label", "conteo": {"$sum": 1}}},
+    ]
+    return {d["_id"]: d["conteo"] for d in reviews_col.aggregate(pipeline)}
+
+
+@st.cache_data
+def cargar_pagina_reseñas(producto_id, pagina=1, version=0, sin_duplicadas=False):
+    """
+    Una página de reseñas (con texto) de un producto, ordenadas por _id.
+    Usa el índice (producto_mongo_id, _id): solo se leen las filas de la página.
+    """
+    if SNAPSHOT_DIR:
+        df = fuente_snapshot().pagina_reseñas_producto(producto_id, pagina, RESEÑAS_POR_PAGINA)
+        return compactar(df)
+    cursor = (
+        reviews_col.find(
+            {"producto_mongo_id": id_producto_mongo(producto_id),
+             **filtro_categoria(sin_duplicadas=sin_duplicadas)},
+            {"_id": 0, "reseña_texto": 1, "sentiment_label": 1, "sentiment_stars": 1}
+        )
+        .sort("_id", 1)
+        .skip((pagina - 1) * RESEÑAS_POR_PAGINA)
+        .limit(RESEÑAS_POR_PAGINA)
+    )
+    return compactar(
+        pd.DataFrame(list(cursor), columns=["reseña_texto", "sentiment_label", "sentiment_stars"])
+    )
+
+
+@st.cache_data
+def cargar_peor_calificados(categoria=None, minimo_reseñas=5, limite=10, version=0):
+    """
+    Productos con menor promedio de estrellas (con al menos `minimo_reseñas`),
+    calculado sobre product_stats: un documento por producto, sin leer reseñas.
+    """
+    if SNAPSHOT_DIR:
+        return fuente_snapshot().peor_calificados(categoria, minimo_reseñas, limite)
+
+    if not coleccion_inicializada("product_stats"):
+        return pd.DataFrame(columns=["titulo", "total", "promedio_estrellas", "pct_negativas"])
+    filtro = {"tipo": "producto", "total": {"$gte": minimo_reseñas}}
+    if categoria and categoria != "Todas":
+        filtro["categoria"] = categoria
+    pipeline = [
+        {"$match": filtro},
+        {"$project": {
+            "_id": 0,
+            "titulo": 1,
+            "total": 1,
+            "promedio_estrellas": {"$divide": ["$suma_estrellas", "$total"]},
+            "pct_negativas": {"$multiply": [
+                {"$divide": [{"$ifNull": ["$conteo.negativo", 0]}, "$total"]}, 100
+            ]},
+        }},
+        {"$sort": {"promedio_estrellas": 1, "total": -1}},
+        {"$limit": limite},
+    ]
+    df = pd.DataFrame(
+        list(product_stats_col.aggregate(pipeline)),
+        columns=["titulo", "total", "promedio_estrellas", "pct_negativas"],
+    )
+    return df.round({"promedio_estrellas": 2, "pct_negativas": 1})
+
+
+@st.cache_resource
+def motor_semantico():
+    """Índice de embeddings (memmap) y modelo, cargados en la primera búsqueda."""
+    return busqueda_semantica.IndiceSemantico(), busqueda_semantica.Codificador()
+
+
+@st.cache_data(ttl=TTL_DATOS_SEG)
+def buscar_semantica(consulta, categoria=None, k=20):
+    """Reseñas más parecidas a `consulta` (ver busqueda_semantica.py)."""
+    indice, codificador = motor_semantico()
+    return compactar(busqueda_semantica.buscar_reseñas(indice, codificador, consulta, k, categoria))
+
+
+# Exportaciones: static/ del dashboard, servido en streaming por Streamlit
+# (server.enableStaticServing en .streamlit/config.toml) sin pasar por memoria
+DIRECTORIO_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIRECTORIO_EXPORTACIONES = os.path.join(DIRECTORIO_STATIC, "exportaciones")
+TTL_EXPORTACION_SEG = int(os.getenv("DASHBOARD_EXPORTACION_TTL_SEG", "3600"))
+# Streamlit no sirve desde static/ archivos de más de 200 MB
+MAXIMO_STATIC_BYTES = 200 * 1024 * 1024
+
+
+def podar_exportaciones(ttl=TTL_EXPORTACION_SEG):
+    """Borra los directorios de exportación sin cambios hace más de `ttl` segundos (sesiones terminadas)."""
+    if not os.path.isdir(DIRECTORIO_EXPORTACIONES):
+        return
+    limite = time.time() - ttl
+    for nombre in os.listdir(DIRECTORIO_EXPORTACIONES):
+        ruta = os.path.join(DIRECTORIO_EXPORTACIONES, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                shutil.rmtree(ruta, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def directorio_sesion():
+    """
+    Directorio de exportación de la sesión. El nombre es aleatorio porque
+    static/ se sirve sin autenticación: solo quien tiene el enlace lo descarga.
+    """
+    if "exportacion_id" not in st.session_state:
+        st.session_state["exportacion_id"] = uuid.uuid4().hex
+    directorio = os.path.join(DIRECTORIO_EXPORTACIONES, st.session_state["exportacion_id"])
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def exportar_filtradas(directorio, categoria=None, formato="csv"):
+    """
+    Exporta las reseñas de la categoría a `directorio`, leyendo por lotes
+    (no arma un DataFrame ni el CSV completo en memoria).
+    Retorna la ruta del archivo.
+    """
+    ruta = os.path.join(directorio, f"reviews_sentiment.{formato}")
+    parcial = ruta + ".parcial"
+    try:
+        if SNAPSHOT_DIR:
+            fuente_snapshot().exportar(parcial, formato, categoria)
+        else:
+            exportar_reseñas(reviews_col, filtro_exportacion(categoria), parcial, formato)
+    except Exception:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+    os.replace(parcial, ruta)
+    return ruta
+
+
+def calcular_metricas_generales(conteo_labels):
+    """
+    Recibe el conteo por sentimiento (dict o Series, p. ej. de cargar_resumen
+    o value_counts) y retorna (total, %positivas, %neutras, %negativas).
+    """
+    conteo_labels = dict(conteo_labels)
+    total = int(sum(conteo_labels.values()))
     if total == 0:
         return total, 0, 0, 0
 
-    conteo_labels = df["sentiment_label"].value_counts()
     pos = conteo_labels.get("positivo", 0)
     neu = conteo_labels.get("neutral", 0)
     neg = conteo_labels.get("negativo", 0)
@@ -59,88 +461,6 @@ def calcular_metricas_generales(df: pd.DataFrame):
 
     return total, pct_pos, pct_neu, pct_neg
 
-# STOPWORDS AMPLIADAS - Incluye palabras contextuales y no significativas
-STOPWORDS_ES = {
-    # Artículos, preposiciones, conectores
-    "el","la","los","las","de","del","y","a","en","un","una","que","se","por",
-    "con","para","es","son","lo","al","como","más","mas","ya","me","mi","su","sus",
-    "este","esta","esto","esa","ese","eso","tu","te","cuando","todo","todos","todas",
-    "hay","aqui","ahí","ahi","pues","pero","si","no","muy","bien","mal","super",
-    "tan","solo","solo","sólo","fue","sido","estar","tener","hacer","vez","veces",
-    "puede","pueden","debe","deben","algún","alguna","otros","otras","cada","mismo",
-    "misma","quiero","quiere","dar","dio","dió","hecho","hacer","está","horas",
-    
-    # Palabras genéricas de opinión que NO aportan insight
-    "reseña","opinion","opinión","review","comentario","calificacion","calificación",
-    "estrellas","estrella","puntos","valoracion","valoración","evaluacion","evaluación",
-    "bueno","buena","regular","normal","común","típico","tipico",
-    
-    # Contexto de compra/producto (demasiado genérico)
-    "producto","productos","artículo","articulo","artículos","articulos","item",
-    "compra","compre","compré","comprado","comprar","compras",
-    "mercado","libre","mercadolibre","tienda","vendedor","vendedora",
-    "precio","precios","costo","costos","vale","pagar","pagué","pague","pago",
-    "envio","envío","envios","envíos","entrega","llegó","llego","llegada",
-    "pedido","pedidos","orden","ordenes","órdenes",
-    "cliente","clientes","servicio","atención","atencion",
-    
-    # Palabras sobre uso/experiencia (muy genéricas)
-    "uso","usar","usada","utilizar","utilizando","utilizó","utilizo",
-    "funcionamiento","función","funciona","funcionan","funcionar",
-    
-    # Adjetivos vagos
-    "útil","util","útiles","utiles","opciones","opción","opcion","expectativas",
-    "características","caracteristicas","materiales","material",
-    "tamaño","tamano","color","colores","modelo","modelos", "único","opiniones",
-    
-    # Verbos comunes poco informativos
-    "recomiendo","recomendar","recomendada","recomendable",
-    "cumple","cumplir","esperar","esperaba","esperado","esperando","geniales","mejor",
-    
-    # Temporalidad genérica
-    "dias","día","dias","meses","mes","año","anos","tiempo","veces","primera","primer",
-    
-    # Meses
-    "ene","feb","mar","abr","may","jun","jul","ago","sept","oct","nov","dic",
-    "enero","febrero","marzo","abril","mayo","junio","julio","agosto",
-    "septiembre","octubre","noviembre","diciembre",
-    
-    # Números y variaciones
-    "uno","dos","tres","cuatro","cinco","seis","siete","ocho","nueve","diez",
-}
-
-def limpiar_texto(texto: str) -> str:
-    """
-    Limpia el texto eliminando stopwords y palabras poco informativas.
-    Mantiene solo palabras relevantes para análisis de sentimiento.
-    """
-    if not texto:
-        return ""
-    
-    texto = str(texto).lower()
-    
-    # Eliminar puntuación pero mantener espacios
-    texto = re.sub(r'[^\w\s]', ' ', texto)
-    
-    # Eliminar números
-    texto = re.sub(r'\d+', '', texto)
-    
-    palabras = texto.split()
-    
-    # Filtrar palabras:
-    # 1. No en stopwords
-    # 2. Longitud >= 4 (más estricto)
-    # 3. No sean solo vocales repetidas (aaaa, eee, etc)
-    palabras_filtradas = [
-        p for p in palabras 
-        if (p not in STOPWORDS_ES and 
-            len(p) >= 4 and
-            len(set(p)) > 2)  # Al menos 3 caracteres diferentes
-    ]
-    
-    return " ".join(palabras_filtradas)
-
-
 st.set_page_config(
     page_title="Sentimiento de productos - Mercado Libre",
     layout="wide"
@@ -149,9 +469,25 @@ st.set_page_config(
 st.title("Dashboard de Sentimiento de Productos (Mercado Libre)")
 st.caption("Análisis de opiniones de clientes usando PLN")
 
-df = cargar_datos()
+st.sidebar.header("Datos")
+refrescar = st.sidebar.button("🔄 Actualizar datos")
+if refrescar:
+    leer_meta.clear()
+
+version = version_datos()
+# Total y categorías salen del resumen (product_stats o una agregación):
+# la página no necesita las filas de las reseñas
+conteo_todas, agrupado_todas = cargar_resumen("Todas", version=version)
+total_enriquecidas = sum(conteo_todas.values())
+if SNAPSHOT_DIR:
+    st.sidebar.caption(
+        f"{total_enriquecidas} reseñas · snapshot {SNAPSHOT_DIR} "
+        f"({fuente_snapshot().meta.get('exportado', 's/f')})"
+    )
+else:
+    st.sidebar.caption(f"{total_enriquecidas} reseñas enriquecidas · versión de datos {version}")
 
-if df.empty:
+if total_enriquecidas == 0:
     st.warning("No hay reseñas enriquecidas en la base de datos. "
                "Asegúrate de haber ejecutado el script enrich_sentiment.py.")
     st.stop()
@@ -159,30 +495,33 @@ if df.empty:
 # ----- Filtro por categoría -----
 st.sidebar.header("Filtros")
 
-if "categoria" in df.columns:
-    categorias_unicas = df["categoria"].dropna().unique().tolist()
-    categorias_unicas.sort()
-    categorias_opciones = ["Todas"] + categorias_unicas
+categorias_unicas = sorted(agrupado_todas["categoria"].dropna().unique().tolist())
+categorias_opciones = ["Todas"] + categorias_unicas
 
-    categoria_seleccionada = st.sidebar.selectbox(
-        "Categoría",
-        options=categorias_opciones,
-        index=0
-    )
+categoria_seleccionada = st.sidebar.selectbox(
+    "Categoría",
+    options=categorias_opciones,
+    index=0
+)
 
-    if categoria_seleccionada == "Todas":
-        df_filtrado = df.copy()
-    else:
-        df_filtrado = df[df["categoria"] == categoria_seleccionada].copy()
-else:
-    st.sidebar.info("No hay campo 'categoria' en los datos.")
-    df_filtrado = df.copy()
+# Casi duplicadas (duplicados.py): contar cada grupo una sola vez
+sin_duplicadas = False
+if not SNAPSHOT_DIR:
+    duplicadas = cargar_conteo_duplicadas(version)
+    if duplicadas:
+        sin_duplicadas = st.sidebar.checkbox(
+            "Agrupar reseñas casi duplicadas",
+            help=f"{duplicadas} reseñas son copias casi idénticas de otra; se cuenta solo la original"
+        )
+
+conteo_labels, agrupado = cargar_resumen(categoria_seleccionada, version=version,
+                                         sin_duplicadas=sin_duplicadas)
 
 
 # ----- Métricas generales -----
 st.subheader("Resumen general")
 
-total, pct_pos, pct_neu, pct_neg = calcular_metricas_generales(df_filtrado)
+total, pct_pos, pct_neu, pct_neg = calcular_metricas_generales(conteo_labels)
 
 col1, col2, col3, col4 = st.columns(4)
 col1.metric("Total reseñas", total)
@@ -195,13 +534,7 @@ st.markdown("---")
 # ----- Distribución por categoría -----
 st.subheader("Sentimiento por categoría")
 
-if "categoria" in df_filtrado.columns:
-    agrupado = (
-        df_filtrado.groupby(["categoria", "sentiment_label"])
-                   .size()
-                   .reset_index(name="conteo")
-    )
-
+if not agrupado.empty and agrupado["categoria"].notna().any():
     chart = alt.Chart(agrupado).mark_bar().encode(
         x=alt.X("categoria:N", title="Categoría"),
         y=alt.Y("conteo:Q", title="Número de reseñas"),
@@ -226,19 +559,25 @@ st.markdown("---")
 # ----- Análisis por producto -----
 st.subheader("Detalle por producto")
 
-if "titulo_producto" in df_filtrado.columns:
-    productos_unicos = df_filtrado["titulo_producto"].dropna().unique().tolist()
-    productos_unicos.sort()
+indice = indice_productos()
+busqueda = st.text_input(
+    "Buscar producto",
+    placeholder="Escribe el inicio o parte del título (p. ej. 'laptop', 'bluetooth')"
+)
+productos_encontrados = indice.buscar(busqueda, categoria_seleccionada, limite=50)
 
+if productos_encontrados:
     producto_seleccionado = st.selectbox(
         "Selecciona un producto",
-        options=productos_unicos
+        options=productos_encontrados,
+        format_func=lambda p: p.titulo
     )
-
-    df_prod = df_filtrado[df_filtrado["titulo_producto"] == producto_seleccionado]
+    st.caption(f"{len(productos_encontrados)} coincidencias (máx. 50) de {len(indice)} productos")
 
     # Métricas por producto
-    total_p, pct_pos_p, pct_neu_p, pct_neg_p = calcular_metricas_generales(df_prod)
+    conteo_producto = cargar_conteo_producto(str(producto_seleccionado.id), version=version,
+                                             sin_duplicadas=sin_duplicadas)
+    total_p, pct_pos_p, pct_neu_p, pct_neg_p = calcular_metricas_generales(conteo_producto)
 
     c1, c2, c3, c4 = st.columns(4)
     c1.metric("Reseñas del producto", total_p)
@@ -246,44 +585,81 @@ if "titulo_producto" in df_filtrado.columns:
     c3.metric(" Neutras (%)", pct_neu_p)
     c4.metric(" Negativas (%)", pct_neg_p)
 
-    # Tabla de reseñas
-    st.write("Reseñas del producto (muestra):")
+    # Tabla de reseñas paginada (el texto se consulta solo para esta página)
+    if total_p > 0:
+        paginas = (total_p + RESEÑAS_POR_PAGINA - 1) // RESEÑAS_POR_PAGINA
+        pagina = st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1)
+        st.write("Reseñas del producto:")
+        st.dataframe(
+            cargar_pagina_reseñas(str(producto_seleccionado.id), int(pagina), version=version,
+                                  sin_duplicadas=sin_duplicadas),
+            height=300
+        )
+    else:
+        st.info("Este producto aún no tiene reseñas analizadas.")
+else:
+    st.info("No se encontraron productos con ese texto.")
+
+# ----- Ranking de productos -----
+st.markdown("**Productos peor calificados** (mínimo 5 reseñas)")
+peor_calificados = cargar_peor_calificados(categoria_seleccionada, version=version)
+if not peor_calificados.empty:
     st.dataframe(
-        df_prod[["reseña_texto", "sentiment_label", "sentiment_stars"]]
-          .reset_index(drop=True),
-        height=300
+        peor_calificados.rename(columns={
+            "titulo": "Producto", "total": "Reseñas",
+            "promedio_estrellas": "Estrellas (prom.)", "pct_negativas": "Negativas (%)",
+        }),
+        hide_index=True
     )
+elif not SNAPSHOT_DIR and not coleccion_inicializada("product_stats"):
+    st.info("No hay estadísticas por producto. "
+            "Ejecuta: python enrich_sentiment.py --reconstruir-estadisticas")
+
+# ----- Búsqueda semántica -----
+st.markdown("---")
+st.subheader("Búsqueda semántica de reseñas")
+
+if SNAPSHOT_DIR or not os.path.exists(os.path.join(busqueda_semantica.DIRECTORIO, "meta.json")):
+    st.info("No hay índice semántico. Ejecuta: python busqueda_semantica.py --indexar")
 else:
-    st.info("Los documentos no tienen campo 'titulo_producto' definido.")
+    consulta = st.text_input(
+        "Buscar reseñas por significado",
+        placeholder="p. ej. 'la batería dura poco o se calienta'"
+    )
+    if consulta.strip():
+        inicio = time.perf_counter()
+        resultados = buscar_semantica(consulta.strip(), categoria_seleccionada)
+        st.caption(f"{len(resultados)} reseñas · {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        st.dataframe(
+            resultados.rename(columns={
+                "similitud": "Similitud", "reseña_texto": "Reseña", "sentiment_label": "Sentimiento",
+                "sentiment_stars": "Estrellas", "categoria": "Categoría", "titulo_producto": "Producto",
+            }),
+            hide_index=True
+        )
 
 st.markdown("---")
 st.subheader(" Nube de palabras por sentimiento")
 st.caption("Palabras más frecuentes en opiniones positivas vs negativas (filtrado inteligente)")
 
+frecuencias_pos = cargar_frecuencias(categoria_seleccionada, "positivo", version=version)
+frecuencias_neg = cargar_frecuencias(categoria_seleccionada, "negativo", version=version)
+
+if not SNAPSHOT_DIR and not coleccion_inicializada("term_freq"):
+    st.info("term_freq todavía no está inicializada: las nubes se calculan sobre las reseñas "
+            "(más lento y sin las que no tienen tokens). Ejecuta: python enrich_sentiment.py --reconstruir-terminos")
+elif not frecuencias_pos and not frecuencias_neg and total > 0:
+    st.info("No hay frecuencias de términos calculadas. "
+            "Ejecuta: python enrich_sentiment.py --reconstruir-terminos")
+
 col_pos, col_neg = st.columns(2)
 
 # ---- Nube de reseñas positivas ----
 with col_pos:
     st.markdown("** Reseñas positivas**")
-    df_pos = df_filtrado[df_filtrado["sentiment_label"] == "positivo"]
-    if not df_pos.empty:
-        texto_pos = " ".join(df_pos["reseña_texto"].astype(str).apply(limpiar_texto).tolist())
-        if texto_pos.strip():
-            wc_pos = WordCloud(
-                width=800,
-                height=400,
-                background_color="white",
-                colormap="Greens",
-                max_words=30,  # Reducido a 30 palabras más relevantes
-                relative_scaling=0.5,
-                min_font_size=12,
-                prefer_horizontal=0.7
-            ).generate(texto_pos)
-
-            fig_pos, ax_pos = plt.subplots(figsize=(10, 5))
-            ax_pos.imshow(wc_pos, interpolation="bilinear")
-            ax_pos.axis("off")
-            st.pyplot(fig_pos)
+    if conteo_labels.get("positivo", 0) > 0:
+        if frecuencias_pos:
+            st.image(nube_cacheada(frecuencias_pos, categoria_seleccionada, "positivo", "Greens", version))
         else:
             st.info("No hay suficiente texto positivo para generar la nube.")
     else:
@@ -292,25 +668,9 @@ with col_pos:
 # ---- Nube de reseñas negativas ----
 with col_neg:
     st.markdown("** Reseñas negativas**")
-    df_neg = df_filtrado[df_filtrado["sentiment_label"] == "negativo"]
-    if not df_neg.empty:
-        texto_neg = " ".join(df_neg["reseña_texto"].astype(str).apply(limpiar_texto).tolist())
-        if texto_neg.strip():
-            wc_neg = WordCloud(
-                width=800,
-                height=400,
-                background_color="white",
-                colormap="Reds",
-                max_words=30,  # Reducido a 30 palabras más relevantes
-                relative_scaling=0.5,
-                min_font_size=12,
-                prefer_horizontal=0.7
-            ).generate(texto_neg)
-
-            fig_neg, ax_neg = plt.subplots(figsize=(10, 5))
-            ax_neg.imshow(wc_neg, interpolation="bilinear")
-            ax_neg.axis("off")
-            st.pyplot(fig_neg)
+    if conteo_labels.get("negativo", 0) > 0:
+        if frecuencias_neg:
+            st.image(nube_cacheada(frecuencias_neg, categoria_seleccionada, "negativo", "Reds", version))
         else:
             st.info("No hay suficiente texto negativo para generar la nube.")
     else:
@@ -318,41 +678,62 @@ with col_neg:
 
 # ----- Análisis adicional -----
 st.markdown("---")
-st.subheader(" Top palabras por sentimiento")
+st.subheader(" Términos distintivos por sentimiento")
+st.caption("Palabras y bigramas que más distinguen cada sentimiento de los demás "
+           "(log-odds con prior de Dirichlet; z alto = más característico)")
 
 col_top1, col_top2 = st.columns(2)
+_, version_terminos = motor_terminos(version)
+columnas_distintivos = {"termino": "Término", "z": "z", "frecuencia": "Frecuencia"}
 
 with col_top1:
-    st.markdown("** Top 10 palabras positivas**")
-    if not df_pos.empty:
-        texto_pos_limpio = " ".join(df_pos["reseña_texto"].astype(str).apply(limpiar_texto).tolist())
-        palabras_pos = texto_pos_limpio.split()
-        if palabras_pos:
-            from collections import Counter
-            top_pos = Counter(palabras_pos).most_common(10)
-            df_top_pos = pd.DataFrame(top_pos, columns=["Palabra", "Frecuencia"])
-            st.dataframe(df_top_pos, hide_index=True)
+    st.markdown("** Top 10 términos positivos**")
+    top_pos = cargar_distintivos(categoria_seleccionada, "positivo", version_motor=version_terminos)
+    if not top_pos.empty:
+        st.dataframe(top_pos.rename(columns=columnas_distintivos), hide_index=True)
 
 with col_top2:
-    st.markdown("** Top 10 palabras negativas**")
-    if not df_neg.empty:
-        texto_neg_limpio = " ".join(df_neg["reseña_texto"].astype(str).apply(limpiar_texto).tolist())
-        palabras_neg = texto_neg_limpio.split()
-        if palabras_neg:
-            from collections import Counter
-            top_neg = Counter(palabras_neg).most_common(10)
-            df_top_neg = pd.DataFrame(top_neg, columns=["Palabra", "Frecuencia"])
-            st.dataframe(df_top_neg, hide_index=True)
+    st.markdown("** Top 10 términos negativos**")
+    top_neg = cargar_distintivos(categoria_seleccionada, "negativo", version_motor=version_terminos)
+    if not top_neg.empty:
+        st.dataframe(top_neg.rename(columns=columnas_distintivos), hide_index=True)
 
 # ----- Exportar datos -----
 st.markdown("---")
 st.subheader(" Exportar datos")
 
-if st.button("Descargar CSV de reseñas filtradas"):
-    csv = df_filtrado.to_csv(index=False).encode('utf-8')
-    st.download_button(
-        label=" Descargar archivo CSV",
-        data=csv,
-        file_name="reviews_sentiment.csv",
-        mime="text/csv"
-    )
+formato_exportacion = st.radio("Formato", options=["csv", "parquet"], horizontal=True)
+
+if st.button("Preparar exportación de reseñas filtradas"):
+    podar_exportaciones()
+    directorio = directorio_sesion()
+    # Borrar la exportación anterior de esta sesión
+    anterior = st.session_state.pop("ruta_exportacion", None)
+    if anterior and os.path.exists(anterior):
+        os.remove(anterior)
+    with st.spinner("Exportando..."):
+        st.session_state["ruta_exportacion"] = exportar_filtradas(
+            directorio, categoria_seleccionada, formato_exportacion
+        )
+
+ruta_exportacion = st.session_state.get("ruta_exportacion")
+if ruta_exportacion and os.path.exists(ruta_exportacion):
+    extension = os.path.splitext(ruta_exportacion)[1]
+    if st.get_option("server.enableStaticServing") and os.path.getsize(ruta_exportacion) <= MAXIMO_STATIC_BYTES:
+        # Enlace al archivo en static/: el servidor lo envía desde el disco por partes
+        relativa = os.path.relpath(ruta_exportacion, DIRECTORIO_STATIC).replace(os.sep, "/")
+        st.markdown(
+            f'<a href="app/static/{relativa}" download="reviews_sentiment{extension}">'
+            f' Descargar archivo {extension[1:].upper()}</a>',
+            unsafe_allow_html=True,
+        )
+    else:
+        if st.get_option("server.enableStaticServing"):
+            st.caption("Archivo de más de 200 MB: para no cargarlo en memoria conviene `python exportar.py`.")
+        with open(ruta_exportacion, "rb") as archivo:
+            st.download_button(
+                label=f" Descargar archivo {extension[1:].upper()}",
+                data=archivo,
+                file_name=f"reviews_sentiment{extension}",
+                mime="text/csv" if extension == ".csv" else "application/octet-stream"
+            )
@@ -0,0 +1,131 @@
+"""
+Representación compacta en memoria de las reseñas del dashboard.
+
+- categoria, sentiment_label, titulo_producto → category
+- sentiment_stars → Int8
+- _id y reseña_texto → strings respaldados por Arrow (si pyarrow está instalado)
+
+Ejecutar directamente compara la memoria de un DataFrame sintético de
+500k reseñas antes y después de compactar:
+
+    python dataframe_compacto.py --n 500000
+"""
+import argparse
+import random
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_CATEGORICAS = ["categoria", "sentiment_label", "titulo_producto"]
+COLUMNAS_TEXTO = ["_id", "reseña_texto"]
+
+try:
+    import pyarrow  # noqa: F401
+    TIPO_TEXTO = "string[pyarrow]"
+except ImportError:
+    TIPO_TEXTO = "string"
+
+
+def compactar(df: pd.DataFrame) -> pd.DataFrame:
+    """Convierte las columnas conocidas a tipos compactos (sin copiar las demás)."""
+    if df.empty:
+        return df
+    conversiones = {}
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            conversiones[col] = "category"
+    if "sentiment_stars" in df.columns:
+        conversiones["sentiment_stars"] = "Int8"
+    for col in COLUMNAS_TEXTO:
+        if col in df.columns:
+            if col == "_id" and df[col].dtype == object:
+                df = df.assign(_id=df[col].astype(str))
+            conversiones[col] = TIPO_TEXTO
+    return df.astype(conversiones)
+
+
+def concatenar(df: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """
+    Concatena dos DataFrames compactos manteniendo las columnas categóricas
+    (pd.concat las convierte a object si las categorías no coinciden).
+    """
+    if df.empty:
+        return delta
+    if delta.empty:
+        return df
+    df = df.copy(deep=False)
+    delta = delta.copy(deep=False)
+    for col in COLUMNAS_CATEGORICAS:
+        if col not in df.columns or col not in delta.columns:
+            continue
+        nuevas = delta[col].cat.categories.difference(df[col].cat.categories)
+        if len(nuevas):
+            df[col] = df[col].cat.add_categories(nuevas)
+        delta[col] = delta[col].cat.set_categories(df[col].cat.categories)
+    return pd.concat([df, delta], ignore_index=True)
+
+
+def memoria_mb(df: pd.DataFrame) -> float:
+    return round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1)
+
+
+def generar_sintetico(n=500_000, n_productos=20_000, semilla=42) -> pd.DataFrame:
+    """DataFrame con la forma del que carga el dashboard, como dtype object."""
+    rnd = random.Random(semilla)
+    categorias = ["audifonos", "laptops", "televisores"]
+    labels = ["positivo", "neutral", "negativo"]
+    estrellas = {"positivo": 5, "neutral": 3, "negativo": 1}
+    titulos = [
+        f"{rnd.choice(['Audífonos', 'Laptop', 'Smart TV'])} Marca{i % 300} Modelo {i} "
+        f"{rnd.choice(['Bluetooth Inalámbricos', '16gb Ram 512gb Ssd', '55 Pulgadas 4k Uhd'])}"
+        for i in range(n_productos)
+    ]
+    palabras = ("muy buen sonido batería dura excelente llegó rápido pantalla "
+                "calienta mucho dejó funcionar recomiendo calidad precio").split()
+
+    filas = []
+    for i in range(n):
+        label = rnd.choice(labels)
+        filas.append({
+            "_id": f"{i:024x}",
+            "categoria": rnd.choice(categorias),
+            "titulo_producto": titulos[rnd.randrange(n_productos)],
+            "reseña_texto": " ".join(rnd.choices(palabras, k=rnd.randint(3, 40))),
+            "sentiment_label": label,
+            "sentiment_stars": estrellas[label],
+        })
+    df = pd.DataFrame(filas)
+    # Representación "ingenua": todo object como lo deja pd.DataFrame(list(cursor))
+    return df.astype({c: object for c in df.columns if c != "sentiment_stars"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria del DataFrame del dashboard")
+    parser.add_argument("--n", type=int, default=500_000, help="Reseñas sintéticas")
+    args = parser.parse_args()
+
+    print(f"Generando {args.n} reseñas sintéticas...")
+    df = generar_sintetico(args.n)
+    compacto = compactar(df)
+
+    print(f"\n{'Columna':<18}{'Antes (MB)':>12}{'Después (MB)':>14}")
+    antes = df.memory_usage(deep=True, index=False)
+    despues = compacto.memory_usage(deep=True, index=False)
+    for col in df.columns:
+        print(f"{col:<18}{antes[col] / 1024 / 1024:>12.1f}{despues[col] / 1024 / 1024:>14.1f}")
+    print(f"{'TOTAL':<18}{memoria_mb(df):>12.1f}{memoria_mb(compacto):>14.1f}")
+
+    # Sin el texto (lo que mantiene cargar_datos en memoria)
+    sin_texto = [c for c in df.columns if c != "reseña_texto"]
+    print(f"{'Sin reseña_texto':<18}{memoria_mb(df[sin_texto]):>12.1f}"
+          f"{memoria_mb(compacto[sin_texto]):>14.1f}")
+
+    # Filtro con máscara: no copia columnas
+    mascara = compacto["categoria"] == "laptops"
+    print(f"\nMáscara de filtro por categoría: {mascara.memory_usage(index=False) / 1024:.0f} KB "
+          f"(vs copia filtrada: {memoria_mb(compacto[mascara])} MB)")
+    print(f"Filas seleccionadas: {int(np.count_nonzero(mascara))}")
+
+
+if __name__ == "__main__":
+    main()
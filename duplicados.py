@@ -0,0 +1,287 @@
+"""
+Detección de reseñas casi duplicadas con MinHash + LSH.
+
+Vendedores y compradores publican la misma reseña en varios productos con
+cambios mínimos (puntuación, emojis, una o dos palabras). Cada texto se
+normaliza, se parte en shingles de caracteres y se resume en una firma
+MinHash; la firma se divide en bandas y cada banda se guarda en
+`minhash_bandas` apuntando al representante de su grupo. Una reseña nueva
+solo se compara con los representantes que comparten alguna banda y es
+duplicada si la similitud de Jaccard estimada llega a DUPLICADOS_UMBRAL.
+
+    DUPLICADOS=1              detectar durante el enriquecimiento y reutilizar
+                              el sentimiento del representante (por defecto 0)
+    DUPLICADOS_UMBRAL=0.7     similitud de Jaccard mínima (cambiar una o dos palabras
+                              de una reseña corta la deja en ~0.7)
+
+Las duplicadas llevan `duplicado_de` (el _id del representante); los
+representantes guardan su firma en `minhash_firmas`.
+
+    python duplicados.py               # indexa las reseñas existentes (reanudable) y reporta
+    python duplicados.py --reporte     # solo el reporte
+"""
+import argparse
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+import base_datos
+import journal
+
+ACTIVO = os.getenv("DUPLICADOS", "0") == "1"
+UMBRAL = float(os.getenv("DUPLICADOS_UMBRAL", "0.7"))
+
+COLECCION_BANDAS = "minhash_bandas"
+COLECCION_FIRMAS = "minhash_firmas"
+# Filtro de reseñas que no son copia de otra (el dashboard las usa para agrupar)
+FILTRO_REPRESENTANTES = {"duplicado_de": {"$exists": False}}
+
+# 20 bandas de 5 valores: un par con similitud 0.7 comparte alguna banda con
+# probabilidad ~0.97; con 0.3, ~0.05 (pocos candidatos que verificar)
+NUM_PERMUTACIONES = 100
+BANDAS = 20
+FILAS = NUM_PERMUTACIONES // BANDAS
+K_SHINGLE = 5
+PRIMO = (1 << 31) - 1
+
+# Semilla fija: las firmas guardadas tienen que seguir siendo comparables
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, PRIMO, NUM_PERMUTACIONES).astype(np.uint64)
+_B = _rng.randint(0, PRIMO, NUM_PERMUTACIONES).astype(np.uint64)
+
+
+# ------------------------
+# Firmas MinHash
+# ------------------------
+def normalizar(texto):
+    """Minúsculas, sin tildes, emojis ni puntuación, espacios simples."""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9ñ ]", " ", texto)).strip()
+
+
+def shingles(texto):
+    """Hashes (módulo PRIMO) de los K_SHINGLE-gramas de caracteres del texto normalizado."""
+    normal = normalizar(texto)
+    if not normal:
+        return None
+    if len(normal) <= K_SHINGLE:
+        partes = {normal}
+    else:
+        partes = {normal[i:i + K_SHINGLE] for i in range(len(normal) - K_SHINGLE + 1)}
+    hashes = np.fromiter((zlib.crc32(p.encode("utf-8")) for p in partes), dtype=np.uint64, count=len(partes))
+    return hashes % PRIMO
+
+
+def firma(texto):
+    """Firma MinHash (NUM_PERMUTACIONES × uint32), o None si el texto no tiene letras ni números."""
+    hashes = shingles(texto)
+    if hashes is None:
+        return None
+    # Permutaciones (a·h + b) mod p con h, a, b < p = 2^31 - 1: no desborda uint64
+    permutados = (hashes[:, None] * _A + _B) % PRIMO
+    return permutados.min(axis=0).astype(np.uint32)
+
+
+def claves_bandas(f):
+    return [
+        f"{b}:{hashlib.blake2b(f[b * FILAS:(b + 1) * FILAS].tobytes(), digest_size=8).hexdigest()}"
+        for b in range(BANDAS)
+    ]
+
+
+def similitud(f1, f2):
+    """Jaccard estimada: fracción de posiciones iguales de las firmas."""
+    return float(np.mean(f1 == f2))
+
+
+# ------------------------
+# Índice LSH en MongoDB
+# ------------------------
+class Detector:
+    """
+    Asigna cada reseña nueva a un representante existente o la registra
+    como representante. Incremental: solo consulta las bandas del lote.
+    """
+
+    def __init__(self, db=None, umbral=UMBRAL):
+        db = db if db is not None else base_datos.db()
+        self.bandas = db[COLECCION_BANDAS]
+        self.firmas = db[COLECCION_FIRMAS]
+        self.umbral = umbral
+
+    def asignar(self, docs, escrituras=None):
+        """
+        `docs`: [(_id, texto)]. Retorna {_id: _id del representante} de las
+        casi duplicadas; las demás quedan registradas como representantes
+        (también de las siguientes del mismo lote). Con `escrituras` (lista
+        de operaciones del journal) las firmas y bandas nuevas se agregan ahí
+        en vez de escribirse: las aplica quien llama, junto con el resto.
+        """
+        firmas = {}
+        for _id, texto in docs:
+            f = firma(texto or "")
+            if f is not None:
+                firmas[_id] = (f, claves_bandas(f))
+        if not firmas:
+            return {}
+
+        todas = {clave for _, claves in firmas.values() for clave in claves}
+        existentes = {d["_id"]: d["r"] for d in self.bandas.find({"_id": {"$in": list(todas)}})}
+        candidatos = set(existentes.values())
+        conocidas = {
+            d["_id"]: np.frombuffer(d["f"], dtype=np.uint32)
+            for d in self.firmas.find({"_id": {"$in": list(candidatos)}})
+        } if candidatos else {}
+
+        duplicados = {}
+        nuevos = {}
+        bandas_nuevas = {}
+        for _id, (f, claves) in firmas.items():
+            reps = {existentes.get(c) or bandas_nuevas.get(c) for c in claves} - {None}
+            if _id in reps:
+                continue  # ya es representante (p. ej. al reanalizar)
+            mejor, similitud_mejor = None, 0.0
+            for rep in reps:
+                f_rep = conocidas.get(rep)
+                if f_rep is None:
+                    f_rep = nuevos.get(rep)
+                if f_rep is None:
+                    continue
+                s = similitud(f, f_rep)
+                if s > similitud_mejor:
+                    mejor, similitud_mejor = rep, s
+            if mejor is not None and similitud_mejor >= self.umbral:
+                duplicados[_id] = mejor
+                continue
+            nuevos[_id] = f
+            for clave in claves:
+                if clave not in existentes:
+                    bandas_nuevas.setdefault(clave, _id)
+
+        # Idempotente: si otro proceso registró la misma banda antes, gana el primero
+        if escrituras is not None:
+            escrituras.extend(
+                journal.actualizar(COLECCION_FIRMAS, {"_id": _id}, {"$setOnInsert": {"f": Binary(f.tobytes())}},
+                                   upsert=True)
+                for _id, f in nuevos.items()
+            )
+            escrituras.extend(
+                journal.actualizar(COLECCION_BANDAS, {"_id": clave}, {"$setOnInsert": {"r": rep}}, upsert=True)
+                for clave, rep in bandas_nuevas.items()
+            )
+            return duplicados
+        if nuevos:
+            self.firmas.bulk_write([
+                UpdateOne({"_id": _id}, {"$setOnInsert": {"f": Binary(f.tobytes())}}, upsert=True)
+                for _id, f in nuevos.items()
+            ], ordered=False)
+        if bandas_nuevas:
+            self.bandas.bulk_write([
+                UpdateOne({"_id": clave}, {"$setOnInsert": {"r": rep}}, upsert=True)
+                for clave, rep in bandas_nuevas.items()
+            ], ordered=False)
+        return duplicados
+
+
+def operaciones_registro(**incrementos):
+    """Los contadores de registrar() como $inc del journal (lista vacía si no hay nada que sumar)."""
+    incrementos = {k: v for k, v in incrementos.items() if v}
+    return [journal.incrementar("meta", {"_id": "duplicados"}, {"$inc": incrementos})] if incrementos else []
+
+
+def registrar(db=None, **incrementos):
+    """Suma a los contadores de meta.duplicados (duplicadas, reutilizadas, segundos_ahorrados)."""
+    db = db if db is not None else base_datos.db()
+    incrementos = {k: v for k, v in incrementos.items() if v}
+    if incrementos:
+        db["meta"].update_one({"_id": "duplicados"}, {"$inc": incrementos}, upsert=True)
+
+
+# ------------------------
+# Indexación de reseñas existentes y reporte
+# ------------------------
+def indexar(lote=2000):
+    """
+    Recorre por _id las reseñas aún no indexadas (sigue desde el último _id
+    procesado) y marca las casi duplicadas con `duplicado_de`.
+    """
+    db = base_datos.db()
+    reseñas = base_datos.raw_reviews()
+    detector = Detector(db)
+    ultimo = (db["meta"].find_one({"_id": "duplicados"}, {"ultimo_id": 1}) or {}).get("ultimo_id")
+    total = duplicadas = 0
+    while True:
+        filtro = dict(FILTRO_REPRESENTANTES)
+        if ultimo is not None:
+            filtro["_id"] = {"$gt": ultimo}
+        docs = list(reseñas.find(filtro, {"reseña_texto": 1}).sort("_id", 1).limit(lote))
+        if not docs:
+            break
+        asignados = detector.asignar([(d["_id"], d.get("reseña_texto")) for d in docs])
+        if asignados:
+            reseñas.bulk_write([
+                UpdateOne({"_id": _id}, {"$set": {"duplicado_de": rep}}) for _id, rep in asignados.items()
+            ], ordered=False)
+        ultimo = docs[-1]["_id"]
+        db["meta"].update_one({"_id": "duplicados"}, {"$set": {"ultimo_id": ultimo}}, upsert=True)
+        registrar(db, duplicadas=len(asignados))
+        total += len(docs)
+        duplicadas += len(asignados)
+        print(f"  {total} reseñas indexadas, {duplicadas} casi duplicadas")
+    return total, duplicadas
+
+
+def reporte(top=5):
+    """Proporción de duplicadas, inferencia ahorrada y los grupos más grandes."""
+    db = base_datos.db()
+    reseñas = base_datos.raw_reviews()
+    contadores = db["meta"].find_one({"_id": "duplicados"}) or {}
+    total = reseñas.count_documents({})
+    duplicadas = reseñas.count_documents({"duplicado_de": {"$exists": True}})
+
+    print("=" * 80)
+    print("RESEÑAS CASI DUPLICADAS")
+    print("=" * 80)
+    print(f"  • Reseñas: {total}")
+    print(f"  • Casi duplicadas: {duplicadas} ({duplicadas * 100 / total if total else 0:.1f}%)")
+    print(f"  • Representantes: {db[COLECCION_FIRMAS].estimated_document_count()}")
+    print(f"  • Sentimientos reutilizados: {contadores.get('reutilizadas', 0)} "
+          f"(~{contadores.get('segundos_ahorrados', 0):.1f} s de inferencia ahorrados)")
+
+    grupos = list(reseñas.aggregate([
+        {"$match": {"duplicado_de": {"$exists": True}}},
+        {"$group": {"_id": "$duplicado_de", "copias": {"$sum": 1}}},
+        {"$sort": {"copias": -1}},
+        {"$limit": top},
+    ]))
+    if grupos:
+        print("\nGrupos más grandes:")
+        for grupo in grupos:
+            rep = reseñas.find_one({"_id": grupo["_id"]}, {"reseña_texto": 1}) or {}
+            print(f"  {grupo['copias'] + 1:>5} × {(rep.get('reseña_texto') or '')[:70]}")
+    return {"reseñas": total, "duplicadas": duplicadas,
+            "proporcion": round(duplicadas / total, 4) if total else 0.0,
+            "reutilizadas": contadores.get("reutilizadas", 0),
+            "segundos_ahorrados": round(contadores.get("segundos_ahorrados", 0), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reseñas casi duplicadas (MinHash + LSH)")
+    parser.add_argument("--reporte", action="store_true", help="solo mostrar el reporte")
+    parser.add_argument("--lote", type=int, default=2000)
+    args = parser.parse_args()
+
+    if not args.reporte:
+        indexar(args.lote)
+    reporte()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,32 @@
-from pymongo import MongoClient
-from dotenv import load_dotenv
-from transformers import pipeline
+from pymongo import UpdateOne
+from collections import Counter
+from sentiment_model import (
+    MODEL_NAME, cargar_pipeline, mapear_resultado,
+    max_tokens_modelo, obtener_token_ids, analizar_ids,
+)
+from token_cache import CacheTokens, id_tokenizer
+from texto_utils import tokens_limpios
+from indices import crear_indices
+import base_datos
+import duplicados
+import journal
+import metricas
 import os
+import sys
+import threading
 import time
 
 # ------------------------
 # Configuración MongoDB
 # ------------------------
-load_dotenv()
-MONGODB_URI = os.getenv("MONGODB_URI")
-
-if not MONGODB_URI:
-    raise ValueError("No se encontró MONGODB_URI en el .env")
-
-client = MongoClient(MONGODB_URI)
-db = client["ml_reviews"]
-reviews_col = db["raw_reviews"]
+# Conexión compartida y perezosa (ver base_datos.py)
+reviews_col = base_datos.raw_reviews()
+# Frecuencia de términos materializada por (categoria, sentiment_label, termino)
+term_freq_col = base_datos.term_freq()
+# Marcador de versión de los datos enriquecidos (lo lee el dashboard para invalidar cachés)
+meta_col = base_datos.meta()
+# Conteos por sentimiento y suma de estrellas por producto y por categoría
+product_stats_col = base_datos.product_stats()
 
 # ------------------------
 # Cargar modelo de sentimiento (multilingüe español)
@@ -23,88 +34,452 @@ reviews_col = db["raw_reviews"]
 print("="*80)
 print("CARGANDO MODELO DE ANÁLISIS DE SENTIMIENTO")
 print("="*80)
-print("Modelo: pysentimiento/robertuito-sentiment-analysis")
+print(f"Modelo: {MODEL_NAME}")
 print("Esto puede tardar un poco la primera vez...")
 
-MODEL_NAME = "pysentimiento/robertuito-sentiment-analysis"
-
 try:
-    sentiment_pipeline = pipeline(
-        "sentiment-analysis",
-        model=MODEL_NAME,
-        tokenizer=MODEL_NAME,
-        device=-1  # -1 = CPU, 0 = GPU
-    )
+    sentiment_pipeline = cargar_pipeline(MODEL_NAME, device=-1)  # -1 = CPU, 0 = GPU
     print("Modelo cargado correctamente\n")
 except Exception as e:
     print(f"Error al cargar modelo: {e}")
     exit(1)
 
+# Truncado por tokens (no por caracteres) según el límite real del modelo
+MAX_TOKENS = max_tokens_modelo(sentiment_pipeline.tokenizer)
+
+# Inferencia por lotes y tokenización en paralelo
+BATCH_INFERENCIA = int(os.getenv("SENTIMENT_BATCH_SIZE", "16"))
+HILOS_TOKENIZER = int(os.getenv("TOKENIZER_THREADS", "4"))
+
+# Caché de token ids por hash de reseña (se invalida sola si cambia el tokenizer)
+token_cache = CacheTokens(
+    os.getenv("TOKEN_CACHE_PATH", "cache/tokens.sqlite"),
+    tokenizer_id=id_tokenizer(sentiment_pipeline.tokenizer, MAX_TOKENS),
+)
+
+# Reseñas casi duplicadas: reutilizan el sentimiento de su representante (ver duplicados.py)
+detector = duplicados.Detector(base_datos.db()) if duplicados.ACTIVO else None
+# Inferencia promedio por reseña del último lote (para estimar lo ahorrado)
+segundos_por_reseña = 0.0
+
 def analizar_sentimiento(texto: str):
     """
     Usa modelo en español (pysentimiento/robertuito) que devuelve:
     POS / NEG / NEU
-    
-    Mapeo:
-      - POS → stars=5, score=1.0, label="positivo"
-      - NEG → stars=1, score=-1.0, label="negativo"
-      - NEU → stars=3, score=0.0, label="neutral"
+
+    Ver sentiment_model.mapear_resultado para el mapeo a stars/score/label.
     """
     if not texto or not texto.strip():
-        return None, None, None
+        return None, None, None, None
 
     texto_limpio = texto.strip()
     
     try:
-        # Limitar a 512 tokens (límite del modelo)
-        result = sentiment_pipeline(texto_limpio[:512])[0]
-        raw_label = result["label"]  # "POS", "NEG", "NEU"
-        confidence = result.get("score", 0.0)
-
-        if raw_label == "POS":
-            sentiment_label = "positivo"
-            sentiment_score = 1.0
-            stars = 5
-        elif raw_label == "NEG":
-            sentiment_label = "negativo"
-            sentiment_score = -1.0
-            stars = 1
-        else:  # NEU
-            sentiment_label = "neutral"
-            sentiment_score = 0.0
-            stars = 3
-
-        return stars, sentiment_score, sentiment_label, confidence
+        # Truncar por tokens al límite del modelo
+        result = sentiment_pipeline(texto_limpio, truncation=True, max_length=MAX_TOKENS)[0]
+        return mapear_resultado(result)
     
     except Exception as e:
         print(f" Error al analizar: {str(e)[:50]}...")
         return None, None, None, None
 
 
-def enriquecer_lote(limit=50, mostrar_ejemplos=False):
+def analizar_lote(textos):
+    """
+    Versión por lotes de analizar_sentimiento: tokeniza todos los textos de
+    una vez (usando la caché de tokens) e infiere en lotes de BATCH_INFERENCIA.
+    Retorna una lista de (stars, score, label, confidence) alineada con `textos`.
+    """
+    if not textos:
+        return []
+    inicio = time.perf_counter()
+    try:
+        lista_ids = obtener_token_ids(
+            sentiment_pipeline.tokenizer, textos, MAX_TOKENS,
+            cache=token_cache, hilos=HILOS_TOKENIZER,
+        )
+        resultados = analizar_ids(sentiment_pipeline, lista_ids, batch_size=BATCH_INFERENCIA)
+        return [mapear_resultado(r) for r in resultados]
+    except Exception as e:
+        # Si falla el lote completo, se analiza reseña por reseña
+        print(f" Error en lote, analizando individualmente: {str(e)[:50]}...")
+        return [analizar_sentimiento(t) for t in textos]
+    finally:
+        # Tokenización + inferencia del lote; por reseña se registra el promedio
+        segundos = time.perf_counter() - inicio
+        metricas.observar("ml_inferencia_lote_segundos", segundos)
+        metricas.observar("ml_inferencia_resena_segundos", segundos / len(textos), veces=len(textos))
+
+
+def resultados_lote(validos, escrituras):
+    """
+    analizar_lote para los (doc, texto) de `validos`. Con DUPLICADOS=1 las casi
+    duplicadas toman el resultado de su representante (del mismo lote o ya
+    analizado con el modelo actual) sin pasar por el modelo; las firmas nuevas
+    y los contadores van a `escrituras` (el journal del lote).
+    Retorna (resultados alineados con `validos`, {_id: _id del representante}).
+    """
+    global segundos_por_reseña
+    if detector is None:
+        return analizar_lote([texto for _, texto in validos]), {}
+
+    representantes = {doc["_id"]: doc["duplicado_de"] for doc, _ in validos if doc.get("duplicado_de")}
+    nuevas = detector.asignar([(doc["_id"], texto) for doc, texto in validos if not doc.get("duplicado_de")],
+                              escrituras)
+    representantes.update(nuevas)
+
+    en_lote = {doc["_id"] for doc, _ in validos}
+    externos = list({rep for rep in representantes.values() if rep not in en_lote})
+    guardados = {
+        d["_id"]: (d.get("sentiment_stars"), d.get("sentiment_score"),
+                   d.get("sentiment_label"), d.get("sentiment_confidence"))
+        for d in reviews_col.find(
+            {"_id": {"$in": externos}, "sentiment_model": MODEL_NAME, "sentiment_label": {"$exists": True}},
+            {"sentiment_stars": 1, "sentiment_score": 1, "sentiment_label": 1, "sentiment_confidence": 1},
+        )
+    } if externos else {}
+
+    def reutilizable(doc):
+        rep = representantes.get(doc["_id"])
+        return rep is not None and (rep in guardados or rep in en_lote)
+
+    indices = [i for i, (doc, _) in enumerate(validos) if not reutilizable(doc)]
+    inicio = time.perf_counter()
+    inferidos = analizar_lote([validos[i][1] for i in indices])
+    if indices:
+        segundos_por_reseña = (time.perf_counter() - inicio) / len(indices)
+
+    resultados = [None] * len(validos)
+    por_id = {}
+    for i, resultado in zip(indices, inferidos):
+        resultados[i] = resultado
+        por_id[validos[i][0]["_id"]] = resultado
+    reutilizadas = 0
+    for i, (doc, _) in enumerate(validos):
+        if resultados[i] is None:
+            rep = representantes[doc["_id"]]
+            resultados[i] = guardados.get(rep) or por_id.get(rep) or (None, None, None, None)
+            reutilizadas += 1
+
+    ahorrados = reutilizadas * segundos_por_reseña
+    escrituras += duplicados.operaciones_registro(
+        duplicadas=len(nuevas), reutilizadas=reutilizadas, segundos_ahorrados=ahorrados
+    )
+    metricas.sumar("ml_duplicados_total", len(nuevas))
+    metricas.sumar("ml_resenas_reutilizadas_total", reutilizadas)
+    metricas.sumar("ml_inferencia_ahorrada_segundos_total", ahorrados)
+    return resultados, representantes
+
+
+def pretokenizar_pendientes(filtro, bloque=1000):
+    """
+    Tokeniza por adelantado las reseñas que cumplen `filtro` y llena la caché,
+    para que la inferencia no espere a la tokenización.
+    """
+    cursor = reviews_col.find(filtro, {"reseña_texto": 1, "texto": 1}, batch_size=bloque)
+    textos = []
+    for doc in cursor:
+        texto = doc.get("reseña_texto") or doc.get("texto")
+        if texto and texto.strip():
+            textos.append(texto)
+        if len(textos) >= bloque:
+            obtener_token_ids(sentiment_pipeline.tokenizer, textos, MAX_TOKENS,
+                              cache=token_cache, hilos=HILOS_TOKENIZER)
+            textos = []
+    if textos:
+        obtener_token_ids(sentiment_pipeline.tokenizer, textos, MAX_TOKENS,
+                          cache=token_cache, hilos=HILOS_TOKENIZER)
+
+
+def iniciar_pretokenizacion(filtro):
+    """Corre pretokenizar_pendientes en segundo plano mientras se procesa."""
+    hilo = threading.Thread(target=pretokenizar_pendientes, args=(filtro,), daemon=True)
+    hilo.start()
+    return hilo
+
+
+def filtro_modelo_anterior():
+    """Filtro de reseñas analizadas con un modelo distinto al actual (para contarlas)."""
+    return {"sentiment_model": {"$exists": True, "$ne": MODEL_NAME}}
+
+
+def asegurar_indices():
+    """Crea los índices que usan las consultas de enriquecimiento (declarados en indices.py)."""
+    errores = crear_indices(colecciones=["raw_reviews", "term_freq", "product_stats"])
+    for coleccion, indice, error in errores:
+        print(f" No se pudo crear el índice {coleccion}.{indice}: {error[:80]}")
+
+
+def operaciones_frecuencias(deltas):
+    """
+    Incrementos/decrementos de frecuencia de términos como operaciones del
+    journal. `deltas`: Counter {(categoria, sentiment_label, termino): n}.
+    """
+    operaciones = [
+        journal.incrementar(
+            "term_freq",
+            {"categoria": categoria, "sentiment_label": label, "termino": termino},
+            {"$inc": {"conteo": n}},
+        )
+        for (categoria, label, termino), n in deltas.items()
+        if n != 0
+    ]
+    # Si hubo decrementos (reanálisis), limpiar los términos que quedaron en 0
+    if operaciones and any(n < 0 for n in deltas.values()):
+        operaciones.append(journal.borrar("term_freq", {"conteo": {"$lte": 0}}))
+    return operaciones
+
+
+def acumular_estadisticas(estadisticas, doc, label, stars, signo=1):
     """
-    Toma un lote de reseñas sin sentimiento y las enriquece.
+    Suma (signo=1) o descuenta (signo=-1) una reseña en las estadísticas de
+    su producto y de su categoría. `estadisticas`: {_id: {"datos": ..., "inc": Counter}}.
     """
-    cursor = reviews_col.find(
-        {"sentiment_score": {"$exists": False}},
-        limit=limit
+    categoria = doc.get("categoria")
+    destinos = [(f"categoria:{categoria}", {"tipo": "categoria", "categoria": categoria})]
+    if doc.get("producto_mongo_id") is not None:
+        destinos.append((doc["producto_mongo_id"], {
+            "tipo": "producto",
+            "categoria": categoria,
+            "titulo": doc.get("titulo_producto"),
+        }))
+    for clave, datos in destinos:
+        entrada = estadisticas.setdefault(clave, {"datos": datos, "inc": Counter()})
+        entrada["inc"][f"conteo.{label}"] += signo
+        entrada["inc"]["total"] += signo
+        entrada["inc"]["suma_estrellas"] += signo * (stars or 0)
+
+
+def operaciones_estadisticas(estadisticas):
+    """Los cambios acumulados por producto y categoría, como $inc del journal."""
+    operaciones = []
+    for clave, entrada in estadisticas.items():
+        incrementos = {campo: n for campo, n in entrada["inc"].items() if n != 0}
+        if not incrementos:
+            continue
+        operaciones.append(journal.incrementar(
+            "product_stats",
+            {"_id": clave},
+            {
+                "$inc": incrementos,
+                "$set": entrada["datos"],
+                "$currentDate": {"actualizado": True},
+            },
+        ))
+    return operaciones
+
+
+# Colecciones derivadas cuya marca ya se vio en meta (no se vuelve a consultar)
+_inicializadas = set()
+
+
+def marcar_inicializada(coleccion):
+    """Marca en meta que `coleccion` (product_stats o term_freq) cubre todas las reseñas enriquecidas."""
+    meta_col.update_one(
+        {"_id": coleccion},
+        {"$set": {"inicializado": True}, "$currentDate": {"actualizado": True}},
+        upsert=True,
     )
+    _inicializadas.add(coleccion)
+
+
+def inicializada(coleccion):
+    """
+    True si `coleccion` (product_stats o term_freq) cubre todas las reseñas
+    enriquecidas; lo marca su reconstrucción (--reconstruir-estadisticas,
+    --reconstruir-terminos). Sin la marca sus $inc se omiten y las lecturas
+    agrupan raw_reviews: contar solo lo nuevo dejaría totales incompletos y
+    al reanalizar se descontarían etiquetas nunca contadas. Una base sin
+    reseñas enriquecidas se marca sola.
+    """
+    if coleccion not in _inicializadas:
+        if meta_col.find_one({"_id": coleccion, "inicializado": True}, {"_id": 1}):
+            _inicializadas.add(coleccion)
+        elif reviews_col.find_one({"sentiment_label": {"$exists": True}}, {"_id": 1}) is None:
+            marcar_inicializada(coleccion)
+    return coleccion in _inicializadas
+
+
+def distribucion_sentimientos():
+    """
+    Conteo por sentimiento desde product_stats (una lectura por categoría).
+    Si todavía no está inicializada (datos previos a product_stats) se agrupa raw_reviews.
+    """
+    if inicializada("product_stats"):
+        conteo = Counter()
+        for doc in product_stats_col.find({"tipo": "categoria"}, {"conteo": 1}):
+            conteo.update(doc.get("conteo", {}))
+        return dict(conteo)
+    pipeline_agg = [
+        {"$match": {"sentiment_label": {"$exists": True}}},
+        {"$group": {"_id": "$sentiment_label", "total": {"$sum": 1}}},
+    ]
+    return {d["_id"]: d["total"] for d in reviews_col.aggregate(pipeline_agg)}
+
+
+def reconstruir_estadisticas():
+    """
+    Recalcula product_stats desde cero con $group en MongoDB (primera vez o
+    si quedó desalineada). No correr en paralelo con un enriquecimiento.
+    """
+    asegurar_indices()
+
+    def agrupar(clave, datos):
+        conteos = {
+            label: {"$sum": {"$cond": [{"$eq": ["$sentiment_label", label]}, 1, 0]}}
+            for label in ["positivo", "neutral", "negativo"]
+        }
+        return [
+            {"$group": {
+                "_id": clave,
+                **{campo: {"$first": valor} for campo, valor in datos.items()},
+                **conteos,
+                "total": {"$sum": 1},
+                "suma_estrellas": {"$sum": {"$ifNull": ["$sentiment_stars", 0]}},
+            }},
+            {"$project": {
+                **{campo: 1 for campo in datos},
+                "conteo": {label: f"${label}" for label in conteos},
+                "total": 1,
+                "suma_estrellas": 1,
+                "actualizado": "$$NOW",
+            }},
+        ]
+
+    enriquecidas = {"$match": {"sentiment_label": {"$exists": True}}}
+    reviews_col.aggregate([
+        enriquecidas,
+        {"$match": {"producto_mongo_id": {"$ne": None}}},
+        *agrupar("$producto_mongo_id", {
+            "tipo": {"$literal": "producto"},
+            "categoria": "$categoria",
+            "titulo": "$titulo_producto",
+        }),
+        {"$out": product_stats_col.name},
+    ], allowDiskUse=True)
+    # Las categorías son pocas: se escriben con upsert (mismo _id que acumular_estadisticas)
+    por_categoria = reviews_col.aggregate([
+        enriquecidas,
+        *agrupar("$categoria", {"tipo": {"$literal": "categoria"}, "categoria": "$categoria"}),
+    ], allowDiskUse=True)
+    for doc in por_categoria:
+        doc.pop("_id")
+        product_stats_col.replace_one({"_id": f"categoria:{doc['categoria']}"}, doc, upsert=True)
+    marcar_inicializada("product_stats")
+    marcar_nueva_version()
+    print(f"Estadísticas reconstruidas: "
+          f"{product_stats_col.count_documents({'tipo': 'producto'})} productos, "
+          f"{product_stats_col.count_documents({'tipo': 'categoria'})} categorías")
+
+
+def operacion_nueva_version(reinicio=False):
+    """
+    Incrementa la versión de raw_reviews: un solo documento, lectura trivial
+    para el dashboard. `reinicio=True` indica que se borraron sentimientos y
+    el dashboard debe recargar todo en vez de traer solo los cambios.
+    Reaplicarla desde el journal solo adelanta la versión otra vez.
+    """
+    fechas = {"actualizado": True}
+    if reinicio:
+        fechas["reiniciado"] = True
+    return journal.actualizar(
+        "meta",
+        {"_id": "raw_reviews"},
+        {"$inc": {"version": 1}, "$currentDate": fechas},
+        upsert=True,
+    )
+
+
+def marcar_nueva_version(reinicio=False):
+    journal.aplicar([(operacion_nueva_version(reinicio), None)])
+
+
+def reconstruir_frecuencias(bloque=1000):
+    """
+    Calcula tokens_limpios para las reseñas enriquecidas que aún no los tienen
+    y reconstruye term_freq desde cero con un $group en MongoDB.
+    Útil la primera vez o si cambia la lista de stopwords; no correr en
+    paralelo con un enriquecimiento.
+    """
+    asegurar_indices()
+
+    filtro = {"sentiment_label": {"$exists": True}, "tokens_limpios": {"$exists": False}}
+    cursor = reviews_col.find(filtro, {"reseña_texto": 1, "texto": 1}, batch_size=bloque)
+    operaciones = []
+    actualizadas = 0
+    for doc in cursor:
+        texto = doc.get("reseña_texto") or doc.get("texto") or ""
+        operaciones.append(UpdateOne(
+            {"_id": doc["_id"]}, {"$set": {"tokens_limpios": tokens_limpios(texto)}}
+        ))
+        if len(operaciones) >= bloque:
+            actualizadas += reviews_col.bulk_write(operaciones, ordered=False).modified_count
+            operaciones = []
+    if operaciones:
+        actualizadas += reviews_col.bulk_write(operaciones, ordered=False).modified_count
+    print(f"Tokens calculados para {actualizadas} reseñas")
+
+    reviews_col.aggregate([
+        {"$match": {"sentiment_label": {"$exists": True}, "tokens_limpios.0": {"$exists": True}}},
+        {"$unwind": "$tokens_limpios"},
+        {"$group": {
+            "_id": {"categoria": "$categoria", "sentiment_label": "$sentiment_label",
+                    "termino": "$tokens_limpios"},
+            "conteo": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "categoria": "$_id.categoria",
+            "sentiment_label": "$_id.sentiment_label",
+            "termino": "$_id.termino",
+            "conteo": 1,
+        }},
+        {"$out": term_freq_col.name},
+    ], allowDiskUse=True)
+    marcar_inicializada("term_freq")
+    marcar_nueva_version()
+    print(f"Frecuencias reconstruidas: {term_freq_col.estimated_document_count()} términos")
+
+
+def enriquecer_lote(limit=50, mostrar_ejemplos=False, filtro=None, desde_id=None):
+    """
+    Toma un lote de reseñas y las enriquece.
+
+    Por defecto procesa las reseñas sin sentimiento. Con `filtro` se puede
+    reprocesar otro subconjunto (p. ej. reseñas de un modelo anterior);
+    los resultados se sobrescriben en el mismo documento con $set.
+    `desde_id` permite avanzar por _id para no repetir reseñas fallidas.
+
+    Retorna (exitosos, fallidos, ultimo_id).
+    """
+    query = dict(filtro) if filtro is not None else {"sentiment_score": {"$exists": False}}
+    if desde_id is not None:
+        query["_id"] = {"$gt": desde_id}
+
+    cursor = reviews_col.find(query, limit=limit).sort("_id", 1)
 
     docs = list(cursor)
     if not docs:
-        return 0
+        return 0, 0, desde_id
 
     exitosos = 0
     fallidos = 0
 
-    for idx, doc in enumerate(docs, 1):
+    validos = []
+    for doc in docs:
         texto = doc.get("reseña_texto") or doc.get("texto")
-        
-        if not texto:
+        if not texto or not texto.strip():
             fallidos += 1
             continue
+        validos.append((doc, texto))
 
-        stars, score, label, confidence = analizar_sentimiento(texto)
+    escrituras = []
+    resultados, representantes = resultados_lote(validos, escrituras)
+    deltas = Counter()
+    estadisticas = {}
+
+    for idx, ((doc, texto), resultado) in enumerate(zip(validos, resultados), 1):
+        stars, score, label, confidence = resultado
 
         if stars is None:
             fallidos += 1
@@ -117,11 +492,36 @@ def enriquecer_lote(limit=50, mostrar_ejemplos=False):
             "sentiment_confidence": confidence,
             "sentiment_model": MODEL_NAME,
         }
+        if doc["_id"] in representantes:
+            update_fields["duplicado_de"] = representantes[doc["_id"]]
+
+        # Tokens limpios: se calculan una sola vez y se reutilizan al reanalizar
+        tokens = doc.get("tokens_limpios")
+        if tokens is None:
+            tokens = tokens_limpios(texto)
+            update_fields["tokens_limpios"] = tokens
+        elif doc.get("sentiment_label"):
+            # Ya estaba contada con su etiqueta anterior: descontarla
+            for termino in tokens:
+                deltas[(doc.get("categoria"), doc.get("sentiment_label"), termino)] -= 1
+        for termino in tokens:
+            deltas[(doc.get("categoria"), label, termino)] += 1
 
-        reviews_col.update_one(
+        # Estadísticas por producto/categoría: al reanalizar se descuenta la etiqueta anterior
+        if doc.get("sentiment_label"):
+            acumular_estadisticas(estadisticas, doc, doc["sentiment_label"],
+                                  doc.get("sentiment_stars"), signo=-1)
+        acumular_estadisticas(estadisticas, doc, label, stars)
+
+        escrituras.append(journal.actualizar(
+            "raw_reviews",
             {"_id": doc["_id"]},
-            {"$set": update_fields}
-        )
+            {
+                "$set": update_fields,
+                # Marca de tiempo del servidor: el dashboard la usa para cargar solo lo nuevo
+                "$currentDate": {"sentiment_actualizado": True},
+            }
+        ))
 
         exitosos += 1
 
@@ -129,13 +529,93 @@ def enriquecer_lote(limit=50, mostrar_ejemplos=False):
         if mostrar_ejemplos and idx <= 3:
             print(f"  ✓ [{idx}] {label.upper()}: {texto[:60]}...")
 
-    return exitosos, fallidos
+    if inicializada("term_freq"):
+        escrituras += operaciones_frecuencias(deltas)
+    if inicializada("product_stats"):
+        escrituras += operaciones_estadisticas(estadisticas)
+    if exitosos:
+        escrituras.append(operacion_nueva_version())
+    # Con JOURNAL=1 quedan en disco y las aplica un hilo de fondo (ver journal.py)
+    journal.escribir("sentimiento", escrituras)
+    metricas.sumar("ml_resenas_analizadas_total", exitosos)
+
+    return exitosos, fallidos, docs[-1]["_id"]
+
+
+def conteo_por_modelo():
+    """Cantidad de reseñas analizadas agrupadas por sentiment_model."""
+    pipeline_agg = [
+        {"$match": {"sentiment_model": {"$exists": True}}},
+        {"$group": {"_id": "$sentiment_model", "total": {"$sum": 1}}},
+        {"$sort": {"total": -1}},
+    ]
+    return {d["_id"]: d["total"] for d in reviews_col.aggregate(pipeline_agg)}
+
+
+def reanalizar_modelos_anteriores(batch_size=50):
+    """
+    Reanaliza solo las reseñas cuyo sentiment_model difiere del modelo actual.
+
+    A diferencia de borrar todo con $unset, los resultados anteriores se
+    mantienen visibles en el dashboard y se sobrescriben lote a lote, por lo
+    que puede correr en segundo plano mientras el dashboard está en uso.
+    """
+    asegurar_indices()
+
+    pendientes = {
+        modelo: total for modelo, total in conteo_por_modelo().items()
+        if modelo != MODEL_NAME
+    }
+    if not pendientes:
+        print(f"Todas las reseñas ya usan el modelo actual ({MODEL_NAME})")
+        return 0, 0
+
+    print(f"Modelo actual: {MODEL_NAME}")
+    print("Reseñas a reanalizar por versión de modelo:")
+    for modelo, total in pendientes.items():
+        print(f"  • {modelo}: {total}")
+
+    total_exitosas = 0
+    total_fallidas = 0
+    lote_num = 0
+    hechas = Counter()
+
+    iniciar_pretokenizacion({"sentiment_model": {"$in": list(pendientes)}})
+
+    # Un modelo a la vez y por igualdad: cada lote es un rango del índice
+    # (sentiment_model, _id), ya ordenado; con $ne habría que ordenar en memoria
+    for modelo in pendientes:
+        ultimo_id = None
+        while True:
+            exitosas, fallidas, ultimo_id = enriquecer_lote(
+                limit=batch_size,
+                mostrar_ejemplos=(lote_num == 0),
+                filtro={"sentiment_model": modelo},
+                desde_id=ultimo_id,
+            )
+            if exitosas == 0 and fallidas == 0:
+                break
+
+            lote_num += 1
+            total_exitosas += exitosas
+            total_fallidas += fallidas
+            hechas[modelo] += exitosas
+
+            # Avance desde el conteo inicial, sin volver a agrupar la colección
+            print(f"Lote {lote_num}: ✓ {exitosas} | ✗ {fallidas}")
+            for nombre, total in pendientes.items():
+                print(f"    {nombre}: {hechas[nombre]}/{total}")
+
+    print(f"\nReanálisis completado: {total_exitosas} exitosas, {total_fallidas} con error")
+    return total_exitosas, total_fallidas
 
 
 def main():
     print("="*80)
     print("ENRIQUECIMIENTO DE SENTIMIENTOS")
     print("="*80)
+
+    asegurar_indices()
     
     # Estadísticas iniciales
     total_reviews = reviews_col.count_documents({})
@@ -147,26 +627,43 @@ def main():
     print(f"  • Con sentimiento analizado: {con_sentimiento}")
     print(f"  • Pendientes de analizar: {sin_sentimiento}")
     
-    if sin_sentimiento == 0:
+    de_modelos_anteriores = reviews_col.count_documents(filtro_modelo_anterior())
+    if de_modelos_anteriores:
+        print(f"  • Analizadas con un modelo anterior: {de_modelos_anteriores}")
+
+    if sin_sentimiento == 0 and de_modelos_anteriores == 0:
         print("\nNo hay reseñas pendientes de analizar")
         return
     
     # Distribución de sentimientos existentes
     if con_sentimiento > 0:
         print(f"\nDistribución actual de sentimientos:")
+        distribucion = distribucion_sentimientos()
         for label in ["positivo", "neutral", "negativo"]:
-            count = reviews_col.count_documents({"sentiment_label": label})
+            count = distribucion.get(label, 0)
             porcentaje = (count / con_sentimiento) * 100 if con_sentimiento > 0 else 0
             print(f"  • {label.capitalize()}: {count} ({porcentaje:.1f}%)")
+        if not inicializada("product_stats"):
+            print("  (product_stats sin inicializar: correr --reconstruir-estadisticas)")
+        if not inicializada("term_freq"):
+            print("  (term_freq sin inicializar: correr --reconstruir-terminos)")
     
     # Opciones
     print(f"\nOPCIONES:")
     print(f"  1. Procesar TODAS las reseñas pendientes ({sin_sentimiento} reseñas)")
     print(f"  2. Procesar en lotes de 50 (modo interactivo)")
     print(f"  3. Reanalizar TODO (borrar sentimientos existentes)")
+    print(f"  4. Reanalizar solo reseñas de modelos anteriores (sin borrar resultados)")
     
-    opcion = input("\nSelecciona una opción (1/2/3): ").strip()
+    opcion = input("\nSelecciona una opción (1/2/3/4): ").strip()
     
+    if opcion == "4":
+        try:
+            reanalizar_modelos_anteriores()
+        except KeyboardInterrupt:
+            print("\n\nProceso interrumpido por el usuario (Ctrl+C)")
+        return
+
     if opcion == "3":
         confirmar = input("¿Seguro que quieres BORRAR todos los sentimientos? (si/no): ").strip().lower()
         if confirmar == "si":
@@ -177,9 +674,16 @@ def main():
                     "sentiment_score": "",
                     "sentiment_label": "",
                     "sentiment_confidence": "",
-                    "sentiment_model": ""
+                    "sentiment_model": "",
+                    "sentiment_actualizado": ""
                 }}
             )
+            term_freq_col.delete_many({})
+            product_stats_col.delete_many({})
+            # Sin reseñas enriquecidas, term_freq y product_stats vacías están al día
+            marcar_inicializada("term_freq")
+            marcar_inicializada("product_stats")
+            marcar_nueva_version(reinicio=True)
             print(f"Eliminados sentimientos de {result.modified_count} reseñas")
             sin_sentimiento = total_reviews
         else:
@@ -191,6 +695,10 @@ def main():
     total_exitosas = 0
     total_fallidas = 0
     lote_num = 0
+    ultimo_id = None
+
+    if opcion != "2":
+        iniciar_pretokenizacion({"sentiment_score": {"$exists": False}})
     
     print(f"\n{'='*80}")
     print(f"PROCESANDO RESEÑAS")
@@ -201,9 +709,10 @@ def main():
             lote_num += 1
             print(f"Lote {lote_num}:")
             
-            exitosas, fallidas = enriquecer_lote(
+            exitosas, fallidas, ultimo_id = enriquecer_lote(
                 limit=50, 
-                mostrar_ejemplos=(lote_num == 1)  # Solo mostrar ejemplos en el primer lote
+                mostrar_ejemplos=(lote_num == 1),  # Solo mostrar ejemplos en el primer lote
+                desde_id=ultimo_id
             )
             
             if exitosas == 0 and fallidas == 0:
@@ -236,6 +745,11 @@ def main():
     print(f"Reseñas analizadas exitosamente: {total_exitosas}")
     print(f"Reseñas con error: {total_fallidas}")
     print(f"Total procesadas: {total_procesadas}")
+    if detector is not None:
+        contadores = meta_col.find_one({"_id": "duplicados"}) or {}
+        print(f"Casi duplicadas (acumulado): {contadores.get('duplicadas', 0)} · "
+              f"sentimientos reutilizados: {contadores.get('reutilizadas', 0)} "
+              f"(~{contadores.get('segundos_ahorrados', 0):.1f} s de inferencia ahorrados)")
     
     # Estadísticas finales
     con_sentimiento_final = reviews_col.count_documents({"sentiment_score": {"$exists": True}})
@@ -247,8 +761,9 @@ def main():
     
     # Distribución final
     print(f"\nDistribución de sentimientos:")
+    distribucion = distribucion_sentimientos()
     for label in ["positivo", "neutral", "negativo"]:
-        count = reviews_col.count_documents({"sentiment_label": label})
+        count = distribucion.get(label, 0)
         porcentaje = (count / con_sentimiento_final) * 100 if con_sentimiento_final > 0 else 0
         emoji = "😊" if label == "positivo" else "😐" if label == "neutral" else "😞"
         print(f"  {emoji} {label.capitalize()}: {count} ({porcentaje:.1f}%)")
@@ -257,4 +772,20 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # Con JOURNAL=1, lo pendiente de la corrida anterior se aplica antes de leer
+    journal.abrir("sentimiento")
+    # Modo no interactivo para correr el reanálisis como tarea en segundo plano:
+    #   python enrich_sentiment.py --reanalizar
+    if "--reanalizar" in sys.argv:
+        reanalizar_modelos_anteriores()
+    # Recalcular tokens y la tabla term_freq de reseñas ya enriquecidas:
+    #   python enrich_sentiment.py --reconstruir-terminos
+    elif "--reconstruir-terminos" in sys.argv:
+        reconstruir_frecuencias()
+    # Recalcular product_stats desde raw_reviews:
+    #   python enrich_sentiment.py --reconstruir-estadisticas
+    elif "--reconstruir-estadisticas" in sys.argv:
+        reconstruir_estadisticas()
+    else:
+        main()
+    metricas.exportar_configurado()
@@ -0,0 +1,521 @@
+"""
+Esquema compacto de reseñas.
+
+En el esquema completo cada documento de `raw_reviews` repite categoría,
+URL, título y origen de su producto (20 copias por producto). En el
+compacto las reseñas viven en `reviews` con nombres de campo cortos y solo
+el _id del producto; los atributos del producto quedan únicamente en
+`products`:
+
+    {"_id", "p": producto_mongo_id, "t": reseña_texto, "r": puntuacion,
+     "sl"/"ss"/"sp"/"sc"/"sm"/"sa": sentiment_label/stars/score/confidence/model/actualizado,
+     "tk": tokens_limpios, "dd": duplicado_de}
+
+Con MONGODB_ESQUEMA=compacto, base_datos.raw_reviews() retorna un
+ReseñasCompactas: acepta las mismas consultas con nombres completos, las
+traduce a la colección compacta y agrega los atributos del producto desde
+un diccionario en memoria, así los scripts no cambian. Para otros
+consumidores (mongosh, BI) `raw_reviews` pasa a ser una vista con $lookup
+que devuelve la forma completa.
+
+    python esquema.py migrar      # copia raw_reviews → reviews (reanudable)
+    python esquema.py finalizar   # última pasada, respaldo y vista raw_reviews
+    python esquema.py revertir    # vuelve al esquema completo
+    python esquema.py tamaños     # tamaño de documentos, datos e índices
+"""
+import argparse
+import re
+import threading
+import time
+
+from pymongo import InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import OperationFailure
+
+import base_datos
+
+COLECCION = "reviews"
+VISTA = "raw_reviews"
+RESPALDO = "raw_reviews_completo"
+ORIGEN = "mercadolibre_reviews"
+
+# Campo del esquema completo → campo compacto
+CAMPOS = {
+    "producto_mongo_id": "p",
+    "reseña_texto": "t",
+    "puntuacion": "r",
+    "sentiment_label": "sl",
+    "sentiment_stars": "ss",
+    "sentiment_score": "sp",
+    "sentiment_confidence": "sc",
+    "sentiment_model": "sm",
+    "sentiment_actualizado": "sa",
+    "tokens_limpios": "tk",
+    "duplicado_de": "dd",
+}
+COMPLETOS = {corto: completo for completo, corto in CAMPOS.items()}
+
+# Atributos que se toman del producto: campo de la reseña → campo en products
+DEL_PRODUCTO = {"categoria": "categoria", "titulo_producto": "titulo", "url_producto": "url_producto"}
+
+
+# ------------------------
+# Diccionario de productos
+# ------------------------
+class Productos:
+    """
+    _id → {categoria, titulo, url_producto} de todos los productos, en memoria.
+    Se recarga completo si tiene más de `vigencia` segundos al pedir ids por
+    categoría, y trae de a uno los productos nuevos que no conoce.
+    """
+
+    def __init__(self, coleccion, vigencia=60):
+        self.coleccion = coleccion
+        self.vigencia = vigencia
+        self.lock = threading.Lock()
+        self.datos = {}
+        self.cargado_en = None
+
+    def _cargar(self):
+        proyeccion = {campo: 1 for campo in DEL_PRODUCTO.values()}
+        datos = {doc.pop("_id"): doc for doc in self.coleccion.find({}, proyeccion)}
+        with self.lock:
+            self.datos = datos
+            self.cargado_en = time.monotonic()
+
+    def _vigente(self):
+        if self.cargado_en is None or time.monotonic() - self.cargado_en > self.vigencia:
+            self._cargar()
+
+    def obtener(self, producto_id):
+        if self.cargado_en is None:
+            self._cargar()
+        producto = self.datos.get(producto_id)
+        if producto is None and producto_id is not None:
+            producto = self.coleccion.find_one({"_id": producto_id}, {"_id": 0}) or {}
+            with self.lock:
+                self.datos[producto_id] = producto
+        return producto or {}
+
+    def ids_donde(self, campo, valores):
+        """_id de los productos cuyo `campo` está en `valores`."""
+        self._vigente()
+        valores = set(valores)
+        with self.lock:
+            return [pid for pid, doc in self.datos.items() if doc.get(campo) in valores]
+
+
+# ------------------------
+# Traducción de consultas
+# ------------------------
+def corto(clave):
+    """Nombre compacto de un campo (también con notación de punto: tokens_limpios.0 → tk.0)."""
+    raiz, punto, resto = clave.partition(".")
+    return CAMPOS.get(raiz, raiz) + punto + resto
+
+
+def condicion_producto(campo, valor, productos):
+    """Condición sobre un atributo del producto → condición sobre `p` con los ids que la cumplen."""
+    if isinstance(valor, dict) and any(op.startswith("$") for op in valor):
+        operadores = set(valor)
+        if operadores == {"$exists"}:
+            return None
+        if operadores == {"$in"}:
+            return {"$in": productos.ids_donde(campo, valor["$in"])}
+        if operadores == {"$ne"}:
+            return {"$nin": productos.ids_donde(campo, [valor["$ne"]])}
+        if operadores == {"$nin"}:
+            return {"$nin": productos.ids_donde(campo, valor["$nin"])}
+        raise ValueError(f"Operadores {sorted(operadores)} sobre {campo} no soportados con el esquema compacto")
+    return {"$in": productos.ids_donde(campo, [valor])}
+
+
+def traducir_filtro(filtro, productos):
+    """Filtro con nombres completos → filtro sobre la colección compacta."""
+    traducido = {}
+    condiciones_p = []
+    for clave, valor in (filtro or {}).items():
+        if clave in ("$and", "$or", "$nor"):
+            traducido[clave] = [traducir_filtro(f, productos) for f in valor]
+        elif clave in DEL_PRODUCTO:
+            condicion = condicion_producto(DEL_PRODUCTO[clave], valor, productos)
+            if condicion is not None:
+                condiciones_p.append(condicion)
+        elif clave == "origen":
+            continue
+        else:
+            traducido[corto(clave)] = valor
+
+    if "p" in traducido:
+        condiciones_p.insert(0, traducido.pop("p"))
+    if len(condiciones_p) == 1:
+        traducido["p"] = condiciones_p[0]
+    elif condiciones_p:
+        traducido.setdefault("$and", []).extend({"p": c} for c in condiciones_p)
+    return traducido
+
+
+def traducir_cambios(cambios):
+    """Operadores de actualización ($set, $unset, $inc...) con nombres cortos; se omiten los atributos del producto."""
+    return {
+        operador: {corto(k): v for k, v in campos.items() if k not in DEL_PRODUCTO and k != "origen"}
+        for operador, campos in cambios.items()
+    }
+
+
+def a_compacto(doc):
+    """Documento completo → compacto (sin atributos del producto)."""
+    return {corto(k): v for k, v in doc.items() if k not in DEL_PRODUCTO and k != "origen"}
+
+
+def a_completo(doc, productos, campos_producto=tuple(DEL_PRODUCTO)):
+    """Documento compacto → forma completa, con los atributos del producto desde el diccionario."""
+    completo = {COMPLETOS.get(k, k): v for k, v in doc.items()}
+    if campos_producto and "producto_mongo_id" in completo:
+        producto = productos.obtener(completo["producto_mongo_id"])
+        for campo in campos_producto:
+            if campo == "origen":
+                completo["origen"] = ORIGEN
+            else:
+                completo[campo] = producto.get(DEL_PRODUCTO[campo])
+    return completo
+
+
+def traducir_proyeccion(proyeccion):
+    """
+    Proyección con nombres completos → (proyección compacta, atributos del
+    producto pedidos, si hay que quitar producto_mongo_id al final).
+    """
+    if proyeccion is None:
+        return None, tuple(DEL_PRODUCTO) + ("origen",), False
+    incluye = any(v for k, v in proyeccion.items() if k != "_id")
+    if not incluye:
+        excluidos = set(proyeccion)
+        compacta = {corto(k): 0 for k in proyeccion if k not in DEL_PRODUCTO and k != "origen"}
+        pedidos = tuple(c for c in (*DEL_PRODUCTO, "origen") if c not in excluidos)
+        return compacta, pedidos, False
+
+    pedidos = tuple(c for c in (*DEL_PRODUCTO, "origen") if proyeccion.get(c))
+    compacta = {corto(k): v for k, v in proyeccion.items() if k not in DEL_PRODUCTO and k != "origen"}
+    quitar_p = bool(pedidos) and not proyeccion.get("producto_mongo_id")
+    if pedidos:
+        compacta["p"] = 1
+    return compacta, pedidos, quitar_p
+
+
+def traducir_orden(clave, direccion=None):
+    if isinstance(clave, str):
+        return corto(clave), direccion if direccion is not None else 1
+    return [(corto(k), d) for k, d in clave], None
+
+
+# ------------------------
+# Vista y pipelines de agregación
+# ------------------------
+def etapas_renombrar():
+    """Nombres cortos → completos dentro de un pipeline."""
+    return [
+        {"$addFields": {completo: f"${corto_}" for completo, corto_ in CAMPOS.items()}},
+        {"$project": {corto_: 0 for corto_ in CAMPOS.values()}},
+    ]
+
+
+def etapas_producto():
+    """Atributos del producto con $lookup a products (la vista y las agregaciones que los usan)."""
+    return [
+        {"$lookup": {"from": "products", "localField": "producto_mongo_id",
+                     "foreignField": "_id", "as": "_producto"}},
+        {"$addFields": {
+            **{campo: {"$arrayElemAt": [f"$_producto.{origen}", 0]} for campo, origen in DEL_PRODUCTO.items()},
+            "origen": {"$literal": ORIGEN},
+        }},
+        {"$project": {"_producto": 0}},
+    ]
+
+
+PIPELINE_VISTA = etapas_renombrar() + etapas_producto()
+
+
+class CursorCompacto:
+    """Cursor de find() sobre la colección compacta que entrega documentos completos."""
+
+    def __init__(self, cursor, productos, campos_producto, quitar_p):
+        self.cursor = cursor
+        self.productos = productos
+        self.campos_producto = campos_producto
+        self.quitar_p = quitar_p
+
+    def sort(self, clave, direccion=None):
+        clave, direccion = traducir_orden(clave, direccion)
+        self.cursor = self.cursor.sort(clave, direccion) if direccion is not None else self.cursor.sort(clave)
+        return self
+
+    def skip(self, n):
+        self.cursor = self.cursor.skip(n)
+        return self
+
+    def limit(self, n):
+        self.cursor = self.cursor.limit(n)
+        return self
+
+    def batch_size(self, n):
+        self.cursor = self.cursor.batch_size(n)
+        return self
+
+    def __iter__(self):
+        for doc in self.cursor:
+            completo = a_completo(doc, self.productos, self.campos_producto)
+            if self.quitar_p:
+                completo.pop("producto_mongo_id", None)
+            yield completo
+
+    def close(self):
+        self.cursor.close()
+
+
+class ReseñasCompactas:
+    """
+    Misma interfaz que la colección raw_reviews para las operaciones que usan
+    los scripts (find, count_documents, insert, update, bulk_write con
+    InsertOne y UpdateOne, aggregate), traducidas a la colección compacta.
+    """
+
+    def __init__(self, coleccion, productos):
+        self.coleccion = coleccion
+        self.productos = productos
+        self.name = coleccion.name
+        self.database = coleccion.database
+
+    def find(self, filtro=None, proyeccion=None, **kwargs):
+        compacta, campos_producto, quitar_p = traducir_proyeccion(proyeccion)
+        cursor = self.coleccion.find(traducir_filtro(filtro, self.productos), compacta, **kwargs)
+        return CursorCompacto(cursor, self.productos, campos_producto, quitar_p)
+
+    def find_one(self, filtro=None, proyeccion=None, **kwargs):
+        return next(iter(self.find(filtro, proyeccion, **kwargs).limit(1)), None)
+
+    def count_documents(self, filtro, **kwargs):
+        return self.coleccion.count_documents(traducir_filtro(filtro, self.productos), **kwargs)
+
+    def insert_one(self, doc, **kwargs):
+        compacto = a_compacto(doc)
+        resultado = self.coleccion.insert_one(compacto, **kwargs)
+        doc["_id"] = compacto["_id"]
+        return resultado
+
+    def insert_many(self, docs, **kwargs):
+        compactos = [a_compacto(doc) for doc in docs]
+        resultado = self.coleccion.insert_many(compactos, **kwargs)
+        # Como pymongo: los documentos originales reciben su _id
+        for doc, compacto in zip(docs, compactos):
+            doc["_id"] = compacto["_id"]
+        return resultado
+
+    def update_one(self, filtro, cambios, **kwargs):
+        return self.coleccion.update_one(traducir_filtro(filtro, self.productos), traducir_cambios(cambios), **kwargs)
+
+    def update_many(self, filtro, cambios, **kwargs):
+        return self.coleccion.update_many(traducir_filtro(filtro, self.productos), traducir_cambios(cambios), **kwargs)
+
+    def delete_many(self, filtro, **kwargs):
+        return self.coleccion.delete_many(traducir_filtro(filtro, self.productos), **kwargs)
+
+    def bulk_write(self, operaciones, **kwargs):
+        traducidas = []
+        for op in operaciones:
+            # pymongo no expone el documento, el filtro ni la actualización de las operaciones
+            if isinstance(op, InsertOne):
+                traducidas.append(InsertOne(a_compacto(op._doc)))
+                continue
+            if not isinstance(op, UpdateOne):
+                raise TypeError(f"{type(op).__name__} no soportado con el esquema compacto")
+            traducidas.append(UpdateOne(
+                traducir_filtro(op._filter, self.productos), traducir_cambios(op._doc), upsert=op._upsert
+            ))
+        return self.coleccion.bulk_write(traducidas, **kwargs)
+
+    def aggregate(self, pipeline, **kwargs):
+        """
+        Los $match iniciales se traducen (usan los índices de la colección
+        compacta); luego se renombran los campos y, solo si el resto del
+        pipeline usa atributos del producto, se agregan con $lookup.
+        """
+        pipeline = list(pipeline)
+        inicio = []
+        while pipeline and "$match" in pipeline[0]:
+            inicio.append({"$match": traducir_filtro(pipeline.pop(0)["$match"], self.productos)})
+        resto = repr(pipeline)
+        usa_producto = any(re.search(rf"\b{campo}\b", resto) for campo in (*DEL_PRODUCTO, "origen"))
+        etapas = inicio + etapas_renombrar() + (etapas_producto() if usa_producto else []) + pipeline
+        return self.coleccion.aggregate(etapas, **kwargs)
+
+    def dataframe(self, filtro, proyeccion):
+        """
+        DataFrame con los campos completos de `proyeccion`: lee solo los
+        campos compactos y agrega los del producto con un map por columna.
+        """
+        import pandas as pd
+
+        compacta, campos_producto, quitar_p = traducir_proyeccion(proyeccion)
+        docs = list(self.coleccion.find(traducir_filtro(filtro, self.productos), compacta))
+        df = pd.DataFrame(docs).rename(columns=COMPLETOS)
+        if campos_producto:
+            ids = df["producto_mongo_id"] if "producto_mongo_id" in df else pd.Series(dtype=object)
+            unicos = ids.drop_duplicates()
+            for campo in campos_producto:
+                if campo == "origen":
+                    df["origen"] = ORIGEN
+                    continue
+                valores = {pid: self.productos.obtener(pid).get(DEL_PRODUCTO[campo]) for pid in unicos}
+                df[campo] = ids.map(valores)
+            if quitar_p and "producto_mongo_id" in df:
+                df = df.drop(columns="producto_mongo_id")
+        columnas = [c for c, incluir in proyeccion.items() if incluir]
+        return df.reindex(columns=columnas)
+
+
+_productos = None
+_lock = threading.Lock()
+
+
+def productos():
+    """Diccionario de productos compartido por el proceso."""
+    global _productos
+    with _lock:
+        if _productos is None:
+            _productos = Productos(base_datos.products())
+    return _productos
+
+
+def reseñas_compactas():
+    return ReseñasCompactas(base_datos.coleccion(COLECCION), productos())
+
+
+# ------------------------
+# Migración
+# ------------------------
+def es_vista(db, nombre):
+    info = list(db.list_collections(filter={"name": nombre}))
+    return bool(info) and info[0].get("type") == "view"
+
+
+def copiar(db, filtro, lote=5000):
+    """Copia (con upsert por _id, idempotente) las reseñas de raw_reviews que cumplen `filtro` a la colección compacta."""
+    destino = db[COLECCION]
+    copiadas = 0
+    operaciones = []
+    for doc in db[VISTA].find(filtro).sort("_id", 1):
+        operaciones.append(ReplaceOne({"_id": doc["_id"]}, a_compacto(doc), upsert=True))
+        if len(operaciones) >= lote:
+            destino.bulk_write(operaciones, ordered=False)
+            copiadas += len(operaciones)
+            operaciones = []
+            print(f"  {copiadas} reseñas copiadas...")
+    if operaciones:
+        destino.bulk_write(operaciones, ordered=False)
+        copiadas += len(operaciones)
+    return copiadas
+
+
+def migrar(db, lote=5000):
+    """Copia raw_reviews → reviews. Se puede interrumpir y relanzar: sigue desde el último _id."""
+    import indices
+
+    if es_vista(db, VISTA):
+        print("raw_reviews ya es la vista del esquema compacto")
+        return 0
+    if "inicio_migracion" not in (db["meta"].find_one({"_id": "esquema"}) or {}):
+        # Desde aquí, finalizar recopia las reseñas que se enriquezcan durante la migración
+        db["meta"].update_one({"_id": "esquema"}, {"$currentDate": {"inicio_migracion": True}}, upsert=True)
+    ultimo = db[COLECCION].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    filtro = {"_id": {"$gt": ultimo["_id"]}} if ultimo else {}
+    copiadas = copiar(db, filtro, lote)
+    for nombre, indice, error in indices.crear_indices(db, colecciones=[COLECCION]):
+        print(f"  ✗ {nombre}.{indice}: {error[:120]}")
+    print(f"Copiadas {copiadas} reseñas ({db[COLECCION].estimated_document_count()} en {COLECCION})")
+    return copiadas
+
+
+def finalizar(db, lote=5000, borrar=False):
+    """
+    Con los scrapers y el enriquecimiento detenidos: recopia lo nuevo o
+    modificado desde el inicio de la migración, guarda raw_reviews como
+    respaldo (o la borra) y crea la vista de compatibilidad.
+    """
+    if es_vista(db, VISTA):
+        print("raw_reviews ya es la vista del esquema compacto")
+        return
+    migrar(db, lote)
+    inicio = (db["meta"].find_one({"_id": "esquema"}) or {}).get("inicio_migracion")
+    if inicio is not None:
+        copiadas = copiar(db, {"sentiment_actualizado": {"$gte": inicio}}, lote)
+        print(f"Recopiadas {copiadas} reseñas enriquecidas durante la migración")
+
+    if db[VISTA].estimated_document_count() != db[COLECCION].estimated_document_count():
+        print(f"✗ {VISTA} y {COLECCION} no tienen la misma cantidad de reseñas; se cancela")
+        return
+    if borrar:
+        db[VISTA].drop()
+    else:
+        db[VISTA].rename(RESPALDO, dropTarget=True)
+        print(f"raw_reviews respaldada en {RESPALDO}")
+    db.create_collection(VISTA, viewOn=COLECCION, pipeline=PIPELINE_VISTA)
+    db["meta"].update_one({"_id": "esquema"}, {"$set": {"esquema": "compacto"},
+                                               "$unset": {"inicio_migracion": ""}}, upsert=True)
+    print(f"Vista {VISTA} creada. Configura MONGODB_ESQUEMA=compacto en el .env")
+
+
+def revertir(db):
+    """Materializa la forma completa de nuevo en raw_reviews (con los índices) y quita la vista."""
+    import indices
+
+    if not es_vista(db, VISTA):
+        print("raw_reviews no es una vista: nada que revertir")
+        return
+    db[VISTA].drop()
+    db[COLECCION].aggregate(PIPELINE_VISTA + [{"$out": VISTA}], allowDiskUse=True)
+    # Directo: con MONGODB_ESQUEMA=compacto crear_indices tomaría "raw_reviews" por reviews
+    db[VISTA].create_indexes(indices.INDICES[VISTA])
+    restauradas = db[VISTA].estimated_document_count()
+    if restauradas == db[COLECCION].estimated_document_count():
+        # Una migración posterior empieza de cero
+        db[COLECCION].drop()
+    db["meta"].update_one({"_id": "esquema"}, {"$set": {"esquema": "completo"}}, upsert=True)
+    print(f"raw_reviews restaurada ({restauradas} reseñas). Quita MONGODB_ESQUEMA del .env")
+
+
+def tamaños(db):
+    """Documentos, tamaño promedio, datos e índices de cada colección de reseñas."""
+    print(f"{'Colección':<22} {'Docs':>10} {'Prom. doc':>10} {'Datos MB':>10} {'Almac. MB':>10} {'Índices MB':>11}")
+    for nombre in (VISTA, RESPALDO, COLECCION, "products"):
+        if es_vista(db, nombre) or nombre not in db.list_collection_names():
+            continue
+        try:
+            stats = db.command("collStats", nombre)
+        except OperationFailure:
+            continue
+        mb = 1024 * 1024
+        print(f"{nombre:<22} {stats['count']:>10} {stats.get('avgObjSize', 0):>10.0f} "
+              f"{stats['size'] / mb:>10.1f} {stats['storageSize'] / mb:>10.1f} "
+              f"{stats['totalIndexSize'] / mb:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migración al esquema compacto de reseñas")
+    parser.add_argument("accion", choices=["migrar", "finalizar", "revertir", "tamaños"])
+    parser.add_argument("--lote", type=int, default=5000)
+    parser.add_argument("--borrar", action="store_true",
+                        help=f"finalizar: borrar raw_reviews en vez de respaldarla en {RESPALDO}")
+    args = parser.parse_args()
+
+    db = base_datos.db()
+    if args.accion == "migrar":
+        migrar(db, args.lote)
+    elif args.accion == "finalizar":
+        finalizar(db, args.lote, args.borrar)
+    elif args.accion == "revertir":
+        revertir(db)
+    tamaños(db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Exportación en streaming de reseñas enriquecidas a CSV o Parquet.
+
+Lee el cursor de MongoDB por lotes y escribe cada lote al archivo a medida
+que llega, así que la memoria usada no depende del tamaño de la exportación.
+
+Uso (p. ej. en un cron):
+
+    python exportar.py --salida negativas_laptops.csv --categoria laptops --sentimiento negativo
+    python exportar.py --salida reseñas.parquet --formato parquet
+"""
+import argparse
+import csv
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from snapshot import lotes_arrow
+
+COLUMNAS_EXPORTACION = ["_id", "categoria", "titulo_producto",
+                        "reseña_texto", "sentiment_label", "sentiment_stars"]
+
+ESQUEMA_EXPORTACION = pa.schema([
+    ("_id", pa.string()),
+    ("categoria", pa.string()),
+    ("titulo_producto", pa.string()),
+    ("reseña_texto", pa.string()),
+    ("sentiment_label", pa.string()),
+    ("sentiment_stars", pa.int8()),
+])
+
+
+def filtro_exportacion(categoria=None, sentiment_label=None):
+    """Reseñas enriquecidas, opcionalmente de una categoría y/o un sentimiento."""
+    filtro = {"sentiment_label": {"$exists": True}}
+    if categoria and categoria != "Todas":
+        filtro["categoria"] = categoria
+    if sentiment_label:
+        filtro["sentiment_label"] = sentiment_label
+    return filtro
+
+
+def exportar_reseñas(coleccion, filtro, ruta, formato="csv", tamaño_lote=10_000):
+    """
+    Escribe en `ruta` las reseñas que cumplen `filtro`, lote a lote.
+    Retorna la cantidad de filas escritas.
+    """
+    proyeccion = {campo: 1 for campo in COLUMNAS_EXPORTACION}
+    cursor = coleccion.find(filtro, proyeccion, batch_size=tamaño_lote).sort("_id", 1)
+    filas = 0
+
+    if formato == "parquet":
+        with pq.ParquetWriter(ruta, ESQUEMA_EXPORTACION) as writer:
+            for lote in lotes_arrow(cursor, ESQUEMA_EXPORTACION, tamaño_lote):
+                writer.write_batch(lote)
+                filas += lote.num_rows
+        return filas
+
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNAS_EXPORTACION, extrasaction="ignore")
+        writer.writeheader()
+        for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            writer.writerow(doc)
+            filas += 1
+    return filas
+
+
+def main():
+    import base_datos
+
+    parser = argparse.ArgumentParser(description="Exportar reseñas enriquecidas a CSV/Parquet")
+    parser.add_argument("--salida", required=True, help="Archivo de salida")
+    parser.add_argument("--formato", choices=["csv", "parquet"],
+                        help="Por defecto se deduce de la extensión de --salida")
+    parser.add_argument("--categoria", help="Solo esta categoría")
+    parser.add_argument("--sentimiento", choices=["positivo", "neutral", "negativo"],
+                        help="Solo este sentimiento")
+    parser.add_argument("--lote", type=int, default=10_000, help="Documentos por lote")
+    args = parser.parse_args()
+
+    formato = args.formato or ("parquet" if args.salida.endswith(".parquet") else "csv")
+
+    filas = exportar_reseñas(
+        base_datos.raw_reviews(), filtro_exportacion(args.categoria, args.sentimiento),
+        args.salida, formato, args.lote,
+    )
+    print(f"Exportadas {filas} reseñas a {args.salida} ({formato})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+# ------------------------
+# Índice en memoria de títulos de productos
+# ------------------------
+# Se construye una vez y responde búsquedas por prefijo (arreglo ordenado +
+# bisect) y por subcadena (índice invertido de trigramas) en milisegundos,
+# sin recorrer todo el catálogo en cada búsqueda.
+
+Producto = namedtuple("Producto", ["id", "titulo", "categoria"])
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios simples."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+def trigramas(texto: str):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceProductos:
+    def __init__(self, productos):
+        """`productos`: iterable de Producto (id, titulo, categoria)."""
+        self.productos = sorted(
+            (p for p in productos if p.titulo),
+            key=lambda p: normalizar(p.titulo),
+        )
+        self.claves = [normalizar(p.titulo) for p in self.productos]
+
+        self.por_trigrama = defaultdict(list)
+        for posicion, clave in enumerate(self.claves):
+            for tri in trigramas(clave):
+                self.por_trigrama[tri].append(posicion)
+
+    def __len__(self):
+        return len(self.productos)
+
+    def _prefijo(self, consulta, categoria, limite):
+        inicio = bisect_left(self.claves, consulta)
+        resultados = []
+        for posicion in range(inicio, len(self.claves)):
+            if not self.claves[posicion].startswith(consulta):
+                break
+            producto = self.productos[posicion]
+            if categoria is None or producto.categoria == categoria:
+                resultados.append(producto)
+                if len(resultados) >= limite:
+                    break
+        return resultados
+
+    def _subcadena(self, consulta, categoria, limite, excluir):
+        tris = trigramas(consulta)
+        if tris:
+            listas = sorted((self.por_trigrama.get(t, []) for t in tris), key=len)
+            candidatos = set(listas[0])
+            for lista in listas[1:]:
+                candidatos.intersection_update(lista)
+                if not candidatos:
+                    break
+            candidatos = sorted(candidatos)
+        else:
+            # Consultas de 1-2 caracteres: no hay trigramas, se recorre el índice
+            candidatos = range(len(self.claves))
+
+        resultados = []
+        for posicion in candidatos:
+            producto = self.productos[posicion]
+            if producto.id in excluir or consulta not in self.claves[posicion]:
+                continue
+            if categoria is None or producto.categoria == categoria:
+                resultados.append(producto)
+                if len(resultados) >= limite:
+                    break
+        return resultados
+
+    def buscar(self, consulta="", categoria=None, limite=50):
+        """
+        Productos cuyo título empieza con `consulta` y, si faltan resultados,
+        los que la contienen en cualquier parte. Sin consulta, los primeros en
+        orden alfabético.
+        """
+        consulta = normalizar(consulta)
+        if categoria == "Todas":
+            categoria = None
+
+        resultados = self._prefijo(consulta, categoria, limite)
+        if consulta and len(resultados) < limite:
+            vistos = {p.id for p in resultados}
+            resultados += self._subcadena(consulta, categoria, limite - len(resultados), vistos)
+        return resultados
@@ -0,0 +1,262 @@
+"""
+Índices de MongoDB y auditoría de planes de consulta.
+
+Declara en un solo lugar los índices que necesitan las consultas de los
+scripts, los crea (idempotente) y corre `explain` (executionStats) sobre
+cada forma de consulta para marcar las que aún recorren la colección
+(COLLSCAN), ordenan en memoria (SORT) o examinan muchas más claves o
+documentos de los que retornan. Pensado para correr en staging contra un
+mongod local con datos representativos:
+
+    python indices.py                 # crear índices y auditar
+    python indices.py --solo-crear
+    python indices.py --solo-auditar  # sale con código 1 si hay consultas marcadas
+"""
+import argparse
+import os
+import sys
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import base_datos
+
+ENRIQUECIDA = {"sentiment_label": {"$exists": True}}
+ANALIZADA = {"sentiment_score": {"$exists": True}}
+
+# Se marca una consulta si examina más de FACTOR veces las claves o documentos
+# que retorna (y al menos MINIMO, para no marcar colecciones casi vacías)
+FACTOR_EXAMINADOS = float(os.getenv("AUDITORIA_FACTOR_EXAMINADOS", "10"))
+MINIMO_EXAMINADOS = int(os.getenv("AUDITORIA_MINIMO_EXAMINADOS", "1000"))
+
+# ------------------------
+# Índices por colección
+# ------------------------
+INDICES = {
+    "products": [
+        # scrape_listing: detección de duplicados por URL (y evita insertarlos)
+        IndexModel([("url_producto", ASCENDING)], unique=True),
+        # Conteos por categoría en scrape_products
+        IndexModel([("categoria", ASCENDING)]),
+    ],
+    "raw_reviews": [
+        # Reseñas de un producto: scrape_reviews y detalle paginado del dashboard
+        IndexModel([("producto_mongo_id", ASCENDING), ("_id", ASCENDING)]),
+        # Pendientes de analizar ({$exists: false} usa los valores nulos del índice)
+        IndexModel([("sentiment_score", ASCENDING), ("_id", ASCENDING)]),
+        # Conteo de analizadas ({$exists: true}): el índice anterior no es sparse
+        # y lo recorrería entero, este solo tiene las analizadas
+        IndexModel([("sentiment_score", ASCENDING)], partialFilterExpression=ANALIZADA),
+        # Reanálisis por versión de modelo
+        IndexModel([("sentiment_model", ASCENDING), ("_id", ASCENDING)]),
+        # Recopia incremental al terminar la migración al esquema compacto
+        IndexModel([("sentiment_actualizado", ASCENDING)], sparse=True),
+        # Exportación y filtros por categoría / sentimiento (solo reseñas enriquecidas)
+        IndexModel([("categoria", ASCENDING), ("sentiment_label", ASCENDING), ("_id", ASCENDING)],
+                   partialFilterExpression=ENRIQUECIDA),
+        IndexModel([("sentiment_label", ASCENDING), ("_id", ASCENDING)],
+                   partialFilterExpression=ENRIQUECIDA),
+        # Grupos de casi duplicadas (duplicados.py); solo las copias tienen el campo
+        IndexModel([("duplicado_de", ASCENDING)], sparse=True),
+    ],
+    # Esquema compacto (ver esquema.py): mismas consultas con nombres cortos.
+    # Los filtros por categoría pasan a `p $in [...]`
+    "reviews": [
+        IndexModel([("p", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("sp", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("sp", ASCENDING)], partialFilterExpression={"sp": {"$exists": True}}),
+        IndexModel([("sm", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("sa", ASCENDING)], sparse=True),
+        IndexModel([("sl", ASCENDING), ("_id", ASCENDING)], partialFilterExpression={"sl": {"$exists": True}}),
+        IndexModel([("dd", ASCENDING)], sparse=True),
+    ],
+    "term_freq": [
+        IndexModel([("categoria", ASCENDING), ("sentiment_label", ASCENDING), ("termino", ASCENDING)],
+                   unique=True),
+        IndexModel([("sentiment_label", ASCENDING), ("conteo", DESCENDING)]),
+    ],
+    "product_stats": [
+        IndexModel([("tipo", ASCENDING), ("categoria", ASCENDING), ("total", DESCENDING)]),
+    ],
+}
+
+# ------------------------
+# Formas de consulta de los scripts (valores de ejemplo)
+# ------------------------
+_ID_EJEMPLO = ObjectId()
+
+CONSULTAS = [
+    {"origen": "scrape_products: duplicado por URL", "coleccion": "products",
+     "filtro": {"url_producto": "https://articulo.mercadolibre.com.ec/MEC-000"}},
+    {"origen": "scrape_products: conteo por categoría", "coleccion": "products",
+     "filtro": {"categoria": "laptops"}},
+    {"origen": "scrape_reviews: reseñas existentes del producto", "coleccion": "raw_reviews",
+     "filtro": {"producto_mongo_id": _ID_EJEMPLO}},
+    {"origen": "enrich_sentiment: lote de pendientes", "coleccion": "raw_reviews",
+     "filtro": {"sentiment_score": {"$exists": False}, "_id": {"$gt": _ID_EJEMPLO}},
+     "orden": [("_id", 1)], "limite": 50},
+    {"origen": "enrich_sentiment: conteo de analizadas", "coleccion": "raw_reviews",
+     "filtro": ANALIZADA},
+    {"origen": "enrich_sentiment: reanálisis de modelos anteriores", "coleccion": "raw_reviews",
+     "filtro": {"sentiment_model": "modelo-anterior", "_id": {"$gt": _ID_EJEMPLO}},
+     "orden": [("_id", 1)], "limite": 50},
+    {"origen": "dashboard: conteo de casi duplicadas", "coleccion": "raw_reviews",
+     "filtro": {"duplicado_de": {"$exists": True}}},
+    {"origen": "dashboard: página de reseñas del producto", "coleccion": "raw_reviews",
+     "filtro": {"producto_mongo_id": _ID_EJEMPLO, **ENRIQUECIDA},
+     "orden": [("_id", 1)], "limite": 20},
+    {"origen": "exportar: todas (por defecto)", "coleccion": "raw_reviews",
+     "filtro": ENRIQUECIDA, "orden": [("_id", 1)]},
+    {"origen": "exportar: categoría y sentimiento", "coleccion": "raw_reviews",
+     "filtro": {"categoria": "laptops", "sentiment_label": "negativo"}, "orden": [("_id", 1)]},
+    {"origen": "exportar: solo sentimiento", "coleccion": "raw_reviews",
+     "filtro": {"sentiment_label": "negativo"}, "orden": [("_id", 1)]},
+    {"origen": "exportar: solo categoría", "coleccion": "raw_reviews",
+     "filtro": {"categoria": "laptops", **ENRIQUECIDA}, "orden": [("_id", 1)]},
+    {"origen": "dashboard: frecuencias por categoría y sentimiento", "coleccion": "term_freq",
+     "filtro": {"categoria": "laptops", "sentiment_label": "negativo"}},
+    {"origen": "dashboard: frecuencias por sentimiento", "coleccion": "term_freq",
+     "filtro": {"sentiment_label": "negativo"}},
+    {"origen": "dashboard: resumen por categoría", "coleccion": "product_stats",
+     "filtro": {"tipo": "categoria"}},
+    {"origen": "dashboard: ranking de productos", "coleccion": "product_stats",
+     "filtro": {"tipo": "producto", "categoria": "laptops", "total": {"$gte": 5}}},
+]
+
+
+def colecciones_activas():
+    """Colecciones con índices según el esquema: raw_reviews o (compacto) reviews."""
+    omitir = "raw_reviews" if base_datos.ESQUEMA_COMPACTO else "reviews"
+    return [nombre for nombre in INDICES if nombre != omitir]
+
+
+def crear_indices(db=None, colecciones=None):
+    """
+    Crea los índices declarados (create_indexes no hace nada si ya existen).
+    Con el esquema compacto, "raw_reviews" en `colecciones` se refiere a reviews.
+    Retorna la lista de errores (p. ej. URLs duplicadas que impiden el índice único).
+    """
+    db = db if db is not None else base_datos.db()
+    if colecciones is None:
+        colecciones = colecciones_activas()
+    elif base_datos.ESQUEMA_COMPACTO:
+        colecciones = ["reviews" if c == "raw_reviews" else c for c in colecciones]
+    errores = []
+    for nombre, modelos in INDICES.items():
+        if nombre not in colecciones:
+            continue
+        for modelo in modelos:
+            try:
+                db[nombre].create_indexes([modelo])
+            except OperationFailure as e:
+                errores.append((nombre, modelo.document["name"], str(e)))
+    return errores
+
+
+def etapas_plan(plan):
+    """Recorre el árbol de un plan de explain y retorna [(etapa, índice)]."""
+    etapas = []
+    pendientes = [plan]
+    while pendientes:
+        nodo = pendientes.pop()
+        if isinstance(nodo, list):
+            pendientes.extend(nodo)
+            continue
+        if not isinstance(nodo, dict):
+            continue
+        if "stage" in nodo:
+            etapas.append((nodo["stage"], nodo.get("indexName")))
+        for clave in ("inputStage", "inputStages", "queryPlan", "winningPlan", "shards", "thenStage", "elseStage"):
+            if clave in nodo:
+                pendientes.append(nodo[clave])
+    return etapas
+
+
+def auditar_consulta(db, consulta):
+    """Explain (executionStats) de una forma de consulta. Retorna (etapas, estadísticas, problemas)."""
+    coleccion, filtro, orden = consulta["coleccion"], consulta["filtro"], consulta.get("orden")
+    if coleccion == "raw_reviews" and base_datos.ESQUEMA_COMPACTO:
+        # La misma consulta, traducida como la hace esquema.ReseñasCompactas
+        import esquema
+        coleccion = esquema.COLECCION
+        filtro = esquema.traducir_filtro(filtro, esquema.productos())
+        orden = orden and esquema.traducir_orden(orden)[0]
+    comando = {"find": coleccion, "filter": filtro}
+    if orden:
+        comando["sort"] = dict(orden)
+    if consulta.get("limite"):
+        comando["limit"] = consulta["limite"]
+    explain = db.command("explain", comando, verbosity="executionStats")
+
+    etapas = etapas_plan(explain["queryPlanner"]["winningPlan"])
+    stats = explain.get("executionStats", {})
+    estadisticas = {
+        "retornados": stats.get("nReturned", 0),
+        "claves": stats.get("totalKeysExamined", 0),
+        "documentos": stats.get("totalDocsExamined", 0),
+    }
+    nombres = {etapa for etapa, _ in etapas}
+    problemas = []
+    if "COLLSCAN" in nombres:
+        problemas.append("COLLSCAN")
+    if "SORT" in nombres:
+        problemas.append("SORT en memoria")
+    examinados = max(estadisticas["claves"], estadisticas["documentos"])
+    if (examinados >= MINIMO_EXAMINADOS
+            and examinados > FACTOR_EXAMINADOS * max(estadisticas["retornados"], 1)):
+        problemas.append("examina de más")
+    return etapas, estadisticas, problemas
+
+
+def auditar(db=None):
+    """Imprime el plan de cada consulta declarada. Retorna cuántas quedaron marcadas."""
+    db = db if db is not None else base_datos.db()
+    marcadas = 0
+    for consulta in CONSULTAS:
+        etapas, estadisticas, problemas = auditar_consulta(db, consulta)
+        indices_usados = sorted({indice for _, indice in etapas if indice})
+        estado = "⚠ " + ", ".join(problemas) if problemas else "✓"
+        print(f"{estado:<22} {consulta['coleccion']:<14} {consulta['origen']}")
+        print(f"{'':<22} {'':<14} plan: {' ← '.join(e for e, _ in etapas)}"
+              f"{' | índices: ' + ', '.join(indices_usados) if indices_usados else ''}")
+        print(f"{'':<22} {'':<14} retorna {estadisticas['retornados']} · examina "
+              f"{estadisticas['claves']} claves y {estadisticas['documentos']} documentos")
+        marcadas += bool(problemas)
+    return marcadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crear índices y auditar planes de consulta")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--solo-crear", action="store_true")
+    grupo.add_argument("--solo-auditar", action="store_true")
+    args = parser.parse_args()
+
+    db = base_datos.db()
+
+    if not args.solo_auditar:
+        print("="*80)
+        print("CREANDO ÍNDICES")
+        print("="*80)
+        errores = crear_indices(db)
+        for nombre in colecciones_activas():
+            print(f"  {nombre}: {', '.join(sorted(db[nombre].index_information()))}")
+        for nombre, indice, error in errores:
+            print(f"  ✗ {nombre}.{indice}: {error[:120]}")
+            if "duplicate key" in error.lower():
+                print("    Hay documentos duplicados: elimínalos antes de crear el índice único.")
+
+    if not args.solo_crear:
+        print("\n" + "="*80)
+        print("AUDITORÍA DE PLANES (explain)")
+        print("="*80)
+        marcadas = auditar(db)
+        print(f"\n{marcadas} de {len(CONSULTAS)} consultas con COLLSCAN, SORT en memoria o "
+              f"más de {FACTOR_EXAMINADOS:g}x examinados por resultado")
+        if marcadas:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""
+Journal local de escrituras (write-behind) para seguir trabajando cuando
+MongoDB Atlas está lento o caído.
+
+Con JOURNAL=1, enriquecer_lote y scrape_reviews_for_product no escriben en
+MongoDB: agregan cada lote de operaciones como una línea (Extended JSON de
+bson) al segmento actual de journal/<productor>/ y siguen. Un hilo de fondo
+las aplica con bulk_write y guarda en checkpoint.json hasta qué byte de qué
+segmento llegó; si MongoDB falla reintenta con espera creciente, y lo que
+quede pendiente al salir se aplica al iniciar la próxima vez (cada
+productor llama a abrir() antes de su primera lectura).
+
+Cada operación se puede reaplicar sin duplicar nada (un corte entre el
+bulk_write y el checkpoint repite el último tramo):
+  - insertar:     _id generado al escribir el journal → upsert con $setOnInsert
+  - actualizar:   $set / $currentDate por _id → el mismo resultado
+  - incrementar:  $inc de term_freq, product_stats y meta; el documento
+                  guarda en journal_aplicado.<instancia> la posición del
+                  último registro aplicado (un número por journal) y uno en
+                  una posición ya alcanzada no vuelve a sumar. Se aplican en
+                  orden
+  - borrar:       delete_many
+
+    JOURNAL=1                  activa el journal (por defecto 0: escrituras directas)
+    JOURNAL_DIR=journal        directorio de los segmentos
+    JOURNAL_SEGMENTO_MB=64     tamaño a partir del cual se empieza otro segmento
+    JOURNAL_INTERVALO_SEG=2    cada cuánto se vacía si no hay registros nuevos
+    JOURNAL_FSYNC=1            fsync de cada registro (0: más rápido, se puede
+                               perder el último tramo si se corta la luz)
+
+    python journal.py              # estado de los journals
+    python journal.py --vaciar     # aplicar lo pendiente y salir
+"""
+import argparse
+import atexit
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+from bson import json_util
+from pymongo import DeleteMany, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import base_datos
+import metricas
+
+ACTIVO = os.getenv("JOURNAL", "0") == "1"
+DIRECTORIO = os.getenv("JOURNAL_DIR", "journal")
+TAMAÑO_SEGMENTO = int(float(os.getenv("JOURNAL_SEGMENTO_MB", "64")) * 1024 * 1024)
+INTERVALO_SEG = float(os.getenv("JOURNAL_INTERVALO_SEG", "2"))
+FSYNC = os.getenv("JOURNAL_FSYNC", "1") == "1"
+
+# Registros por bulk_write al vaciar
+REGISTROS_POR_TRAMO = 50
+# Posición de un registro: segmento × POSICIONES_POR_SEGMENTO + byte de inicio
+POSICIONES_POR_SEGMENTO = 1 << 40
+
+COLECCIONES = {
+    "raw_reviews": base_datos.raw_reviews,
+    "term_freq": base_datos.term_freq,
+    "product_stats": base_datos.product_stats,
+    "meta": base_datos.meta,
+    "minhash_firmas": lambda: base_datos.coleccion("minhash_firmas"),
+    "minhash_bandas": lambda: base_datos.coleccion("minhash_bandas"),
+}
+
+DUPLICADO = 11000
+
+
+# ------------------------
+# Operaciones
+# ------------------------
+def insertar(coleccion, doc):
+    """`doc` debe traer su _id (ObjectId() al armarlo) para poder reaplicarse."""
+    return {"col": coleccion, "op": "insertar", "doc": doc}
+
+
+def actualizar(coleccion, filtro, cambios, upsert=False):
+    return {"col": coleccion, "op": "actualizar", "filtro": filtro, "cambios": cambios, "upsert": upsert}
+
+
+def incrementar(coleccion, filtro, cambios):
+    """Actualización con $inc (upsert): al reaplicar se descarta si ya se sumó."""
+    return {"col": coleccion, "op": "incrementar", "filtro": filtro, "cambios": cambios}
+
+
+def borrar(coleccion, filtro):
+    return {"col": coleccion, "op": "borrar", "filtro": filtro}
+
+
+def a_pymongo(op, registro=None):
+    """
+    Operación de bulk_write; con `registro` ((instancia del journal, posición
+    del registro)), en su forma reaplicable.
+    """
+    tipo = op["op"]
+    if tipo == "insertar":
+        if registro is None:
+            return InsertOne(dict(op["doc"]))
+        resto = {k: v for k, v in op["doc"].items() if k != "_id"}
+        return UpdateOne({"_id": op["doc"]["_id"]}, {"$setOnInsert": resto}, upsert=True)
+    if tipo == "incrementar":
+        if registro is None:
+            return UpdateOne(op["filtro"], op["cambios"], upsert=True)
+        # Si el documento ya llegó a esta posición el filtro no coincide y el
+        # upsert choca con el _id / índice único: error de duplicado = ya aplicado
+        instancia, posicion = registro
+        campo = f"journal_aplicado.{instancia}"
+        filtro = {**op["filtro"], campo: {"$not": {"$gte": posicion}}}
+        cambios = {**op["cambios"], "$max": {**op["cambios"].get("$max", {}), campo: posicion}}
+        return UpdateOne(filtro, cambios, upsert=True)
+    if tipo == "actualizar":
+        return UpdateOne(op["filtro"], op["cambios"], upsert=op.get("upsert", False))
+    if tipo == "borrar":
+        return DeleteMany(op["filtro"])
+    raise ValueError(f"Operación desconocida en el journal: {tipo}")
+
+
+def aplicar(pares):
+    """
+    Ejecuta [(operación, registro o None)] en orden, con un bulk_write por
+    tramo consecutivo de la misma colección (los borrados van aparte,
+    después de los incrementos que los preceden).
+    """
+    for (nombre, es_borrado), grupo in itertools.groupby(
+        pares, key=lambda par: (par[0]["col"], par[0]["op"] == "borrar")
+    ):
+        grupo = list(grupo)
+        operaciones = [a_pymongo(op, registro) for op, registro in grupo]
+        reaplicable = any(registro is not None for _, registro in grupo)
+        # Los incrementos con posición, en orden: si uno posterior llegara
+        # antes al documento, el anterior se tomaría por ya aplicado
+        ordenado = reaplicable and any(op["op"] == "incrementar" for op, _ in grupo)
+        while operaciones:
+            try:
+                COLECCIONES[nombre]().bulk_write(operaciones, ordered=ordenado)
+                break
+            except BulkWriteError as e:
+                errores = e.details.get("writeErrors", [])
+                if not reaplicable or any(err.get("code") != DUPLICADO for err in errores):
+                    raise
+                # Sin orden ya se intentó todo; en orden se sigue después del duplicado
+                operaciones = operaciones[errores[-1]["index"] + 1:] if ordenado else []
+
+
+def escribir(productor, operaciones):
+    """
+    Punto de escritura de los productores: con JOURNAL=1 agrega las
+    operaciones al journal de `productor` y retorna enseguida; si no, las
+    aplica en MongoDB.
+    """
+    if not operaciones:
+        return
+    if ACTIVO:
+        compartido(productor).agregar(operaciones)
+    else:
+        aplicar([(op, None) for op in operaciones])
+
+
+# ------------------------
+# Journal en disco
+# ------------------------
+class Journal:
+    """
+    Segmentos JSONL numerados (00000001.jsonl, ...) y checkpoint.json con
+    {segmento, offset} de lo ya aplicado y la instancia (id al azar del
+    journal, para las marcas de los $inc). Un solo proceso por directorio.
+    """
+
+    def __init__(self, directorio, nombre=""):
+        self.directorio = directorio
+        self.nombre = nombre or os.path.basename(directorio)
+        os.makedirs(directorio, exist_ok=True)
+        self._bloqueo = open(os.path.join(directorio, ".lock"), "w")
+        try:
+            fcntl.flock(self._bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._bloqueo.close()
+            raise RuntimeError(f"Otro proceso está usando el journal {directorio}")
+
+        self.lock = threading.Lock()
+        # Aplicar un tramo y guardar el checkpoint es una sola sección: si dos
+        # hilos vaciaran a la vez (cerrar() tras un join vencido) aplicarían el
+        # mismo tramo y el checkpoint podría retroceder
+        self.lock_vaciado = threading.Lock()
+        self.ruta_checkpoint = os.path.join(directorio, "checkpoint.json")
+        segmentos = self.segmentos()
+        self.segmento = segmentos[-1] if segmentos else 1
+        # Un corte a mitad de agregar() deja una última línea sin "\n": se
+        # descarta, o el próximo registro quedaría pegado a ella
+        recortar_incompleto(self._ruta(self.segmento))
+        self.archivo = open(self._ruta(self.segmento), "ab")
+        self.checkpoint = self._leer_checkpoint(segmentos)
+        # La instancia queda en disco antes de aplicar nada con ella
+        self._guardar_checkpoint(self.checkpoint["segmento"], self.checkpoint["offset"])
+
+        self.hay_registros = threading.Event()
+        self.detener = threading.Event()
+        self.hilo = threading.Thread(target=self._vaciar_siempre, name=f"journal-{self.nombre}", daemon=True)
+
+        # Lo que quedó de una corrida anterior se aplica antes de producir más
+        # (si no, se volverían a procesar reseñas cuyo resultado ya está aquí)
+        try:
+            aplicados = self.vaciar()
+            if aplicados:
+                print(f" Journal {self.nombre}: {aplicados} registros pendientes aplicados")
+        except PyMongoError as e:
+            print(f" Journal {self.nombre}: MongoDB no disponible ({str(e)[:80]}), se reintenta en segundo plano")
+        self.hilo.start()
+
+    def _ruta(self, segmento):
+        return os.path.join(self.directorio, f"{segmento:08d}.jsonl")
+
+    def segmentos(self):
+        return sorted(int(n.split(".")[0]) for n in os.listdir(self.directorio)
+                      if n.endswith(".jsonl") and n.split(".")[0].isdigit())
+
+    def _leer_checkpoint(self, segmentos):
+        try:
+            with open(self.ruta_checkpoint, encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            checkpoint = {"segmento": segmentos[0] if segmentos else 1, "offset": 0}
+        # Un journal nuevo (o borrado y recreado) numera desde 1 otra vez: con
+        # otra instancia sus posiciones no se comparan con las marcas viejas
+        if "instancia" not in checkpoint:
+            checkpoint["instancia"] = uuid.uuid4().hex[:12]
+        return checkpoint
+
+    def _guardar_checkpoint(self, segmento, offset):
+        self.checkpoint = {"segmento": segmento, "offset": offset, "instancia": self.checkpoint["instancia"]}
+        tmp = self.ruta_checkpoint + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp, self.ruta_checkpoint)
+
+    def agregar(self, operaciones):
+        """Agrega un registro (una línea) y despierta al hilo que vacía. No toca MongoDB."""
+        linea = (json_util.dumps({"ops": operaciones}) + "\n").encode("utf-8")
+        with self.lock:
+            if self.archivo.tell() >= TAMAÑO_SEGMENTO:
+                self.archivo.close()
+                self.segmento += 1
+                self.archivo = open(self._ruta(self.segmento), "ab")
+            self.archivo.write(linea)
+            self.archivo.flush()
+            if FSYNC:
+                os.fsync(self.archivo.fileno())
+        metricas.sumar("ml_journal_registros_total", productor=self.nombre)
+        self.hay_registros.set()
+
+    def _leer_tramo(self, segmento, offset):
+        """Hasta REGISTROS_POR_TRAMO líneas completas desde `offset`."""
+        lineas = []
+        try:
+            with open(self._ruta(segmento), "rb") as f:
+                f.seek(offset)
+                for linea in f:
+                    if not linea.endswith(b"\n"):
+                        break  # registro a medio escribir
+                    lineas.append(linea)
+                    if len(lineas) >= REGISTROS_POR_TRAMO:
+                        break
+        except FileNotFoundError:
+            pass
+        return lineas
+
+    def vaciar(self):
+        """Aplica todo lo pendiente desde el checkpoint. Retorna los registros aplicados."""
+        with self.lock_vaciado:
+            return self._vaciar()
+
+    def _vaciar(self):
+        aplicados = 0
+        while True:
+            with self.lock:
+                actual = self.segmento
+            segmento, offset = self.checkpoint["segmento"], self.checkpoint["offset"]
+            lineas = self._leer_tramo(segmento, offset)
+            if not lineas:
+                if segmento >= actual:
+                    return aplicados
+                # Segmento completo: se pasa al siguiente y se borra
+                self._guardar_checkpoint(segmento + 1, 0)
+                try:
+                    os.remove(self._ruta(segmento))
+                except FileNotFoundError:
+                    pass
+                continue
+
+            pares = []
+            ilegibles = []
+            posicion = segmento * POSICIONES_POR_SEGMENTO + offset
+            for linea in lineas:
+                registro = (self.checkpoint["instancia"], posicion)
+                try:
+                    pares.extend((op, registro) for op in json_util.loads(linea)["ops"])
+                except (ValueError, KeyError, TypeError) as e:
+                    ilegibles.append((linea, e))
+                posicion += len(linea)
+            with metricas.cronometro("ml_journal_vaciado_segundos", productor=self.nombre):
+                aplicar(pares)
+            # Una línea ilegible no debe frenar al resto: se aparta y se sigue
+            for linea, error in ilegibles:
+                self._poner_en_cuarentena(segmento, linea, error)
+            self._guardar_checkpoint(segmento, offset + sum(len(linea) for linea in lineas))
+            aplicados += len(lineas)
+            metricas.sumar("ml_journal_aplicados_total", len(lineas), productor=self.nombre)
+
+    def _poner_en_cuarentena(self, segmento, linea, error):
+        """Agrega `linea` a cuarentena.jsonl (sin aplicar) y lo avisa."""
+        with open(os.path.join(self.directorio, "cuarentena.jsonl"), "ab") as f:
+            f.write(linea if linea.endswith(b"\n") else linea + b"\n")
+        metricas.sumar("ml_journal_cuarentena_total", productor=self.nombre)
+        print(f" Journal {self.nombre}: registro ilegible en el segmento {segmento} ({str(error)[:80]}), "
+              f"apartado en cuarentena.jsonl")
+
+    def esperar(self, timeout=None):
+        """Espera a que se aplique todo lo agregado hasta ahora. Retorna False si venció `timeout`."""
+        with self.lock:
+            objetivo = (self.segmento, self.archivo.tell())
+        self.hay_registros.set()
+        limite = None if timeout is None else time.monotonic() + timeout
+        while (self.checkpoint["segmento"], self.checkpoint["offset"]) < objetivo:
+            if limite is not None and time.monotonic() >= limite:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def pendiente_bytes(self):
+        segmento, offset = self.checkpoint["segmento"], self.checkpoint["offset"]
+        total = 0
+        for s in self.segmentos():
+            if s >= segmento:
+                total += os.path.getsize(self._ruta(s)) - (offset if s == segmento else 0)
+        return max(total, 0)
+
+    def _vaciar_siempre(self):
+        espera = 1
+        while not self.detener.is_set():
+            self.hay_registros.wait(INTERVALO_SEG)
+            self.hay_registros.clear()
+            try:
+                self.vaciar()
+                espera = 1
+            except Exception as e:  # el hilo no debe morir: lo pendiente sigue en disco
+                metricas.sumar("ml_journal_errores_total", productor=self.nombre)
+                print(f" Journal {self.nombre}: no se pudo aplicar ({str(e)[:80]}); "
+                      f"reintento en {espera}s ({self.pendiente_bytes() / 1024:.0f} KB pendientes)")
+                self.detener.wait(espera)
+                espera = min(espera * 2, 60)
+
+    def cerrar(self, timeout=30):
+        """Detiene el hilo y hace un último intento de vaciar; lo que falte queda en disco."""
+        self.detener.set()
+        self.hay_registros.set()
+        self.hilo.join(timeout)
+        try:
+            self.vaciar()
+        except PyMongoError as e:
+            print(f" Journal {self.nombre}: quedan {self.pendiente_bytes() / 1024:.0f} KB sin aplicar "
+                  f"({str(e)[:80]}); se aplicarán en la próxima corrida")
+        with self.lock:
+            self.archivo.close()
+        self._bloqueo.close()
+
+
+def recortar_incompleto(ruta):
+    """Trunca `ruta` después de su último "\n" (si no existe o está completo, no hace nada)."""
+    try:
+        f = open(ruta, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        fin = f.seek(0, os.SEEK_END)
+        posicion = fin
+        while posicion > 0:
+            inicio = max(posicion - 65536, 0)
+            f.seek(inicio)
+            bloque = f.read(posicion - inicio)
+            salto = bloque.rfind(b"\n")
+            if salto >= 0:
+                posicion = inicio + salto + 1
+                break
+            posicion = inicio
+        if posicion < fin:
+            f.truncate(posicion)
+            print(f" Journal: descartados {fin - posicion} bytes de un registro a medio escribir en {ruta}")
+
+
+_journals = {}
+_lock = threading.Lock()
+
+
+def compartido(productor):
+    """Journal de `productor` (journal/<productor>/), uno por proceso; se vacía al salir."""
+    with _lock:
+        if productor not in _journals:
+            if not _journals:
+                atexit.register(cerrar_todos)
+            _journals[productor] = Journal(os.path.join(DIRECTORIO, productor), productor)
+        return _journals[productor]
+
+
+def abrir(*productores):
+    """
+    Abre los journals de `productores` al iniciar, antes de la primera
+    lectura: así lo pendiente de una corrida anterior ya está en MongoDB
+    (si no, se volverían a procesar reseñas cuyo resultado está en disco).
+    Sin JOURNAL no hace nada.
+    """
+    if ACTIVO:
+        for productor in productores:
+            compartido(productor)
+
+
+def esperar(productor, timeout=None):
+    """
+    Barrera para quien lee lo que otro produjo (p. ej. el sentimiento de las
+    reseñas recién extraídas): espera a que el journal de `productor` esté en MongoDB.
+    """
+    with _lock:
+        j = _journals.get(productor)
+    return j.esperar(timeout) if j is not None else True
+
+
+def cerrar_todos():
+    with _lock:
+        journals = list(_journals.values())
+        _journals.clear()
+    for j in journals:
+        j.cerrar()
+
+
+def estado():
+    """{productor: KB pendientes} de los journals en DIRECTORIO (sin abrirlos)."""
+    resultado = {}
+    if not os.path.isdir(DIRECTORIO):
+        return resultado
+    for productor in sorted(os.listdir(DIRECTORIO)):
+        directorio = os.path.join(DIRECTORIO, productor)
+        if not os.path.isdir(directorio):
+            continue
+        try:
+            with open(os.path.join(directorio, "checkpoint.json"), encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            checkpoint = {"segmento": 0, "offset": 0}
+        total = 0
+        for nombre in os.listdir(directorio):
+            if not nombre.endswith(".jsonl") or not nombre.split(".")[0].isdigit():
+                continue  # cuarentena.jsonl no es un segmento
+            if int(nombre.split(".")[0]) >= checkpoint["segmento"]:
+                total += os.path.getsize(os.path.join(directorio, nombre))
+                if int(nombre.split(".")[0]) == checkpoint["segmento"]:
+                    total -= checkpoint["offset"]
+        resultado[productor] = round(total / 1024, 1)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Journal local de escrituras")
+    parser.add_argument("--vaciar", action="store_true", help="aplicar lo pendiente en MongoDB y salir")
+    args = parser.parse_args()
+
+    pendientes = estado()
+    if not pendientes:
+        print(f"No hay journals en {DIRECTORIO}/")
+        return
+    for productor, kb in pendientes.items():
+        print(f"  {productor:<14} {kb:>10} KB pendientes")
+    if args.vaciar:
+        for productor in pendientes:
+            inicio = time.perf_counter()
+            j = Journal(os.path.join(DIRECTORIO, productor), productor)
+            j.cerrar()
+            print(f"  {productor}: vaciado en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Métricas por etapa: contadores e histogramas de latencia en memoria,
+exportables en formato de texto de Prometheus y como resumen JSON.
+
+    METRICAS_PROM_ARCHIVO=metricas/ml.prom   # archivo para el textfile collector de node_exporter
+    METRICAS_JSON=metricas/resumen.json      # resumen de la corrida
+    METRICAS_PUERTO=9108                     # endpoint HTTP /metrics mientras corre el proceso
+    METRICAS_PERFIL=reseñas,sentimiento      # cProfile por etapa ("todas" para todas)
+
+Sin dependencias externas; registrar una observación es un dict lookup y
+unas sumas bajo un lock.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_CONTEO = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# nombre → (tipo, ayuda, buckets)
+DEFINICIONES = {
+    "ml_listado_descarga_segundos": ("histogram", "Descarga HTTP de una página de listado", BUCKETS_LATENCIA),
+    "ml_listado_parseo_segundos": ("histogram", "Parseo (BeautifulSoup) de una página de listado", BUCKETS_LATENCIA),
+    "ml_productos_nuevos_total": ("counter", "Productos nuevos insertados desde los listados", None),
+    "ml_productos_duplicados_total": ("counter", "Productos de listados que ya estaban en la BD", None),
+    "ml_selenium_carga_segundos": ("histogram", "driver.get de la página de un producto", BUCKETS_LATENCIA),
+    "ml_selenium_espera_segundos": ("histogram", "Esperas, scroll y clics de 'Ver más' por producto", BUCKETS_LATENCIA),
+    "ml_resenas_por_producto": ("histogram", "Reseñas extraídas por producto", BUCKETS_CONTEO),
+    "ml_resenas_extraidas_total": ("counter", "Reseñas extraídas con Selenium", None),
+    "ml_inferencia_lote_segundos": ("histogram", "Inferencia de sentimiento de un lote", BUCKETS_LATENCIA),
+    "ml_inferencia_resena_segundos": ("histogram", "Inferencia de sentimiento por reseña (promedio del lote)",
+                                      (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    "ml_resenas_analizadas_total": ("counter", "Reseñas con sentimiento guardado", None),
+    "ml_duplicados_total": ("counter", "Reseñas casi duplicadas detectadas al enriquecer", None),
+    "ml_resenas_reutilizadas_total": ("counter", "Reseñas que reutilizaron el sentimiento de su representante", None),
+    "ml_inferencia_ahorrada_segundos_total": ("counter", "Inferencia evitada por duplicadas (estimada)", None),
+    "ml_mongo_comando_segundos": ("histogram", "Latencia de comandos de MongoDB", BUCKETS_LATENCIA),
+    "ml_mongo_errores_total": ("counter", "Comandos de MongoDB fallidos", None),
+    "ml_journal_registros_total": ("counter", "Lotes de escrituras agregados al journal local", None),
+    "ml_journal_aplicados_total": ("counter", "Lotes del journal aplicados en MongoDB", None),
+    "ml_journal_errores_total": ("counter", "Intentos fallidos de vaciar el journal", None),
+    "ml_journal_cuarentena_total": ("counter", "Registros ilegibles del journal apartados en cuarentena", None),
+    "ml_journal_vaciado_segundos": ("histogram", "bulk_write de un tramo del journal", BUCKETS_LATENCIA),
+}
+
+
+class Registro:
+    """Valores de todas las métricas del proceso, por nombre y etiquetas."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.inicio = time.time()
+
+    def _serie(self, nombre, etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        serie = self.series.get(clave)
+        if serie is None:
+            tipo, _, buckets = DEFINICIONES[nombre]
+            if tipo == "counter":
+                serie = {"valor": 0}
+            else:
+                serie = {"buckets": [0] * (len(buckets) + 1), "suma": 0.0, "conteo": 0,
+                         "min": None, "max": None}
+            self.series[clave] = serie
+        return serie
+
+    def sumar(self, nombre, n=1, **etiquetas):
+        with self.lock:
+            self._serie(nombre, etiquetas)["valor"] += n
+
+    def observar(self, nombre, valor, veces=1, **etiquetas):
+        """Registra `valor` en un histograma (`veces` observaciones iguales)."""
+        buckets = DEFINICIONES[nombre][2]
+        with self.lock:
+            serie = self._serie(nombre, etiquetas)
+            serie["buckets"][bisect_left(buckets, valor)] += veces
+            serie["suma"] += valor * veces
+            serie["conteo"] += veces
+            serie["min"] = valor if serie["min"] is None else min(serie["min"], valor)
+            serie["max"] = valor if serie["max"] is None else max(serie["max"], valor)
+
+    def reiniciar(self):
+        with self.lock:
+            self.series.clear()
+            self.inicio = time.time()
+
+
+registro = Registro()
+sumar = registro.sumar
+observar = registro.observar
+
+
+@contextmanager
+def cronometro(nombre, **etiquetas):
+    """Observa en el histograma `nombre` los segundos que tarda el bloque."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+
+# ------------------------
+# Latencia de MongoDB
+# ------------------------
+class MonitorMongo(monitoring.CommandListener):
+    """CommandListener de PyMongo: latencia por comando (find, insert, update, aggregate...)."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observar("ml_mongo_comando_segundos", event.duration_micros / 1e6, comando=event.command_name)
+
+    def failed(self, event):
+        observar("ml_mongo_comando_segundos", event.duration_micros / 1e6, comando=event.command_name)
+        sumar("ml_mongo_errores_total", comando=event.command_name)
+
+
+# ------------------------
+# Exportación
+# ------------------------
+def _etiquetas_prom(etiquetas, extra=None):
+    pares = list(etiquetas) + (list(extra.items()) if extra else [])
+    if not pares:
+        return ""
+    contenido = ",".join(
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in pares
+    )
+    return "{" + contenido + "}"
+
+
+def texto_prometheus():
+    """Todas las series en el formato de texto de Prometheus."""
+    with registro.lock:
+        series = sorted(registro.series.items())
+        series = [(clave, dict(serie, buckets=list(serie.get("buckets", [])))) for clave, serie in series]
+
+    lineas = []
+    nombre_actual = None
+    for (nombre, etiquetas), serie in series:
+        tipo, ayuda, buckets = DEFINICIONES[nombre]
+        if nombre != nombre_actual:
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            nombre_actual = nombre
+        if tipo == "counter":
+            lineas.append(f"{nombre}{_etiquetas_prom(etiquetas)} {serie['valor']}")
+            continue
+        acumulado = 0
+        for limite, n in zip(list(buckets) + ["+Inf"], serie["buckets"]):
+            acumulado += n
+            lineas.append(f"{nombre}_bucket{_etiquetas_prom(etiquetas, {'le': limite})} {acumulado}")
+        lineas.append(f"{nombre}_sum{_etiquetas_prom(etiquetas)} {serie['suma']:.6f}")
+        lineas.append(f"{nombre}_count{_etiquetas_prom(etiquetas)} {serie['conteo']}")
+    return "\n".join(lineas) + "\n"
+
+
+def _percentil(serie, buckets, p):
+    """Percentil aproximado: límite superior del bucket donde cae (o el máximo observado)."""
+    objetivo = serie["conteo"] * p
+    acumulado = 0
+    for limite, n in zip(buckets, serie["buckets"]):
+        acumulado += n
+        if acumulado >= objetivo:
+            return min(limite, round(serie["max"], 4))
+    return round(serie["max"], 4)
+
+
+def resumen():
+    """Resumen JSON-serializable: contadores y, por histograma, conteo, promedio, p50/p95, min/max."""
+    with registro.lock:
+        series = {clave: dict(serie, buckets=list(serie.get("buckets", [])))
+                  for clave, serie in registro.series.items()}
+        inicio = registro.inicio
+
+    metricas = {}
+    for (nombre, etiquetas), serie in sorted(series.items()):
+        clave = nombre + _etiquetas_prom(etiquetas)
+        tipo, _, buckets = DEFINICIONES[nombre]
+        if tipo == "counter":
+            metricas[clave] = round(serie["valor"], 4)
+        elif serie["conteo"]:
+            metricas[clave] = {
+                "conteo": serie["conteo"],
+                "suma": round(serie["suma"], 4),
+                "promedio": round(serie["suma"] / serie["conteo"], 4),
+                "p50": _percentil(serie, buckets, 0.5),
+                "p95": _percentil(serie, buckets, 0.95),
+                "min": round(serie["min"], 4),
+                "max": round(serie["max"], 4),
+            }
+    return {"segundos": round(time.time() - inicio, 1), "metricas": metricas}
+
+
+def imprimir(metricas):
+    """Tabla breve de un resumen()["metricas"]: una línea por serie."""
+    if not metricas:
+        return
+    print("\nMÉTRICAS")
+    for clave, valor in metricas.items():
+        if isinstance(valor, dict):
+            print(f"  {clave:<60} n={valor['conteo']:<7} prom={valor['promedio']:<8} "
+                  f"p95≤{valor['p95']:<7} máx={valor['max']}")
+        else:
+            print(f"  {clave:<60} {valor}")
+
+
+def _escribir(ruta, contenido):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(tmp, ruta)
+
+
+def exportar_prometheus(ruta):
+    _escribir(ruta, texto_prometheus())
+
+
+def guardar_resumen(ruta):
+    _escribir(ruta, json.dumps(resumen(), ensure_ascii=False, indent=2, default=str))
+
+
+def exportar_configurado():
+    """Escribe los archivos indicados en METRICAS_PROM_ARCHIVO / METRICAS_JSON (si hay)."""
+    if os.getenv("METRICAS_PROM_ARCHIVO"):
+        exportar_prometheus(os.getenv("METRICAS_PROM_ARCHIVO"))
+    if os.getenv("METRICAS_JSON"):
+        guardar_resumen(os.getenv("METRICAS_JSON"))
+
+
+def servir_http(puerto):
+    """Endpoint /metrics en un hilo de fondo (para que Prometheus lo consulte)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            cuerpo = texto_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("0.0.0.0", puerto), Manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+_servidor = None
+
+
+def iniciar_endpoint_configurado():
+    """Levanta el endpoint si METRICAS_PUERTO está definido (una vez por proceso)."""
+    global _servidor
+    puerto = os.getenv("METRICAS_PUERTO")
+    if puerto and _servidor is None:
+        _servidor = servir_http(int(puerto))
+        print(f"Métricas en http://localhost:{puerto}/metrics")
+
+
+# ------------------------
+# Perfilado por etapa
+# ------------------------
+@contextmanager
+def perfilar(etapa):
+    """
+    cProfile del bloque si `etapa` está en METRICAS_PERFIL (o es "todas").
+    Guarda perfiles/<etapa>-<hilo>.prof (ver con `python -m pstats` o snakeviz).
+    cProfile solo mide el hilo que lo activa: envolver el código de cada hilo.
+    """
+    pedidas = {e.strip() for e in os.getenv("METRICAS_PERFIL", "").split(",") if e.strip()}
+    if etapa not in pedidas and "todas" not in pedidas:
+        yield
+        return
+
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError as e:
+        # Otro perfilador activo en el proceso: se sigue sin perfilar
+        print(f" No se pudo perfilar {etapa}: {e}")
+        yield
+        return
+    try:
+        yield
+    finally:
+        perfil.disable()
+        directorio = os.getenv("METRICAS_PERFIL_DIR", "perfiles")
+        os.makedirs(directorio, exist_ok=True)
+        ruta = os.path.join(directorio, f"{etapa}-{threading.current_thread().name}.prof")
+        perfil.dump_stats(ruta)
+        print(f" Perfil de {etapa} guardado en {ruta}")
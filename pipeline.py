@@ -0,0 +1,526 @@
+"""
+Orquestador no interactivo: productos → reseñas → sentimiento.
+
+Las tres etapas corren a la vez conectadas por colas: cada producto nuevo
+de un listado pasa de inmediato a los navegadores que extraen reseñas, y
+cada lote de reseñas insertadas pasa al modelo de sentimiento, sin esperar
+a que termine la etapa anterior. Sin input(): apto para cron o servidores.
+Los menús de scrape_products.py, scrape_reviews.py y enrich_sentiment.py
+siguen disponibles para uso manual.
+
+    python pipeline.py
+    python pipeline.py --categorias laptops --max-paginas 2 --navegadores 2
+    python pipeline.py --etapas reseñas sentimiento   # productos ya guardados
+    python pipeline.py --etapas sentimiento           # solo reseñas pendientes
+
+El avance de los listados se guarda en --checkpoint: al relanzar se
+continúa desde la última página completada (--reiniciar lo ignora); una
+página que no se pudo descargar se reintenta y, si sigue fallando, no se
+marca. Las reseñas y el sentimiento ya son idempotentes (se saltan
+productos con reseñas y reseñas ya analizadas), y al iniciar se encolan
+los productos guardados que todavía no tienen reseñas. Si la etapa de
+sentimiento falla se detiene todo y la salida es 1.
+
+Métricas por etapa (ver metricas.py): el reporte JSON incluye latencias y
+contadores; --metricas-prom escribe el formato de Prometheus durante la
+corrida, --metricas-puerto lo sirve en /metrics y --perfil guarda un
+cProfile por etapa en perfiles/.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import base_datos
+import journal
+import metricas
+
+ETAPAS = ["productos", "reseñas", "sentimiento"]
+
+# Marca de fin de una cola (una por consumidor)
+FIN = object()
+
+# Cada cuántos segundos se reescribe --metricas-prom mientras corre
+INTERVALO_METRICAS_SEG = 15
+
+
+# ------------------------
+# Checkpoint y reporte
+# ------------------------
+class Checkpoint:
+    """Última página completada por categoría, guardada en JSON tras cada página."""
+
+    def __init__(self, ruta, reiniciar=False):
+        self.ruta = ruta
+        self.lock = threading.Lock()
+        self.datos = {"paginas": {}, "completas": []}
+        if ruta and not reiniciar and os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                self.datos.update(json.load(f))
+
+    def pagina_inicial(self, categoria):
+        return self.datos["paginas"].get(categoria, -1) + 1
+
+    def completa(self, categoria):
+        return categoria in self.datos["completas"]
+
+    def marcar_pagina(self, categoria, pagina, ultima=False):
+        with self.lock:
+            self.datos["paginas"][categoria] = pagina
+            if ultima and categoria not in self.datos["completas"]:
+                self.datos["completas"].append(categoria)
+            self._guardar()
+
+    def _guardar(self):
+        if not self.ruta:
+            return
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        tmp = self.ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.datos, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.ruta)
+
+
+class Reporte:
+    """Contadores y tiempos por etapa, compartidos entre hilos."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conteos = {etapa: Counter() for etapa in ETAPAS}
+        self.inicio = {}
+        self.fin = {}
+        self.fallos = {}
+
+    def sumar(self, etapa, **campos):
+        with self.lock:
+            self.conteos[etapa].update(campos)
+
+    def iniciar(self, etapa):
+        with self.lock:
+            self.inicio.setdefault(etapa, time.time())
+
+    def fallar(self, etapa, error):
+        """Una etapa se detuvo por un error: la corrida termina con código distinto de 0."""
+        with self.lock:
+            self.fallos[etapa] = repr(error)
+
+    def terminar(self, etapa):
+        with self.lock:
+            self.fin[etapa] = time.time()
+
+    def resumen(self):
+        resumen = {}
+        for etapa in ETAPAS:
+            if etapa not in self.inicio:
+                continue
+            segundos = self.fin.get(etapa, time.time()) - self.inicio[etapa]
+            resumen[etapa] = {"segundos": round(segundos, 1), **self.conteos[etapa]}
+        return resumen
+
+    def imprimir(self, resumen):
+        print(f"\n{'='*80}")
+        print("REPORTE DEL PIPELINE")
+        print(f"{'='*80}")
+        for etapa, datos in resumen.items():
+            segundos = datos["segundos"]
+            detalle = " | ".join(f"{k}: {v}" for k, v in datos.items() if k != "segundos")
+            print(f"  {etapa:<12} {segundos:>8.1f}s  {detalle}")
+        print(f"{'='*80}")
+
+
+def con_perfil(etapa, objetivo):
+    """Envuelve `objetivo` con metricas.perfilar(etapa) (cProfile si se pidió con --perfil)."""
+    def envuelto(*argumentos):
+        with metricas.perfilar(etapa):
+            return objetivo(*argumentos)
+    return envuelto
+
+
+def poner(cola, item, detener):
+    """put con espera acotada para no quedar bloqueado si se pidió detener."""
+    while not detener.is_set():
+        try:
+            cola.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def cerrar_cola(cola, consumidores, detener):
+    """
+    Una marca FIN por consumidor. Los consumidores vacían la cola, salvo si se
+    pidió detener (p. ej. falló la etapa siguiente): entonces se descarta lo
+    encolado para hacer lugar (ya está en la BD y sale en la próxima corrida).
+    """
+    for _ in range(consumidores):
+        while True:
+            try:
+                cola.put(FIN, timeout=1)
+                break
+            except queue.Full:
+                if detener.is_set():
+                    try:
+                        cola.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+# ------------------------
+# Etapas
+# ------------------------
+def etapa_productos(args, checkpoint, reporte, salida, detener):
+    """
+    Scrapea los listados (un hilo por categoría) y encola cada producto
+    nuevo en `salida` (None si no corre la etapa de reseñas).
+    """
+    from scrape_products import LISTING_CONFIG, ErrorListado, scrape_listing, url_pagina
+
+    def scrapear_pagina(categoria, url, nuevos):
+        """scrape_listing con reintentos (espera creciente) si falla la descarga; None si no se pudo."""
+        for intento in range(args.reintentos_listados + 1):
+            if intento:
+                espera = max(args.pausa_listados, 1) * 2 ** intento
+                print(f" [productos] Reintento {intento} de {url} en {espera:.0f}s")
+                if detener.wait(espera):
+                    return None
+            try:
+                return scrape_listing(categoria, url, nuevos=nuevos, lanzar_errores=True)
+            except ErrorListado:
+                reporte.sumar("productos", errores_descarga=1)
+        return None
+
+    def scrapear_categoria(categoria):
+        cfg = LISTING_CONFIG[categoria]
+        if checkpoint.completa(categoria):
+            print(f" [productos] {categoria}: completa según el checkpoint")
+            return
+        max_paginas = args.max_paginas or cfg["max_pages"]
+        for pagina in range(checkpoint.pagina_inicial(categoria), max_paginas):
+            if detener.is_set():
+                return
+            nuevos = []
+            try:
+                resultado = scrapear_pagina(categoria, url_pagina(cfg["base_url"], pagina), nuevos)
+            except Exception as e:
+                print(f" [productos] Error en {categoria} página {pagina + 1}: {e}")
+                reporte.sumar("productos", errores=1)
+                return
+            if resultado is None:
+                # Sin checkpoint: la corrida siguiente retoma desde esta página
+                print(f" [productos] {categoria} página {pagina + 1} sin descargar, queda para la próxima corrida")
+                reporte.sumar("productos", errores=1)
+                return
+            insertados, hay_mas = resultado
+            reporte.sumar("productos", paginas=1, nuevos=insertados)
+            for doc in nuevos if salida is not None else []:
+                if not poner(salida, doc, detener):
+                    return
+            ultima = not hay_mas or pagina + 1 >= max_paginas
+            checkpoint.marcar_pagina(categoria, pagina, ultima=not hay_mas)
+            if ultima:
+                return
+            time.sleep(args.pausa_listados)
+
+    reporte.iniciar("productos")
+    try:
+        with ThreadPoolExecutor(max_workers=args.hilos_listados) as ejecutor:
+            list(ejecutor.map(con_perfil("productos", scrapear_categoria), args.categorias))
+    finally:
+        reporte.terminar("productos")
+
+
+def productos_desde_bd(args, salida, detener):
+    """
+    Encola los productos guardados que todavía no tienen reseñas. Es la
+    fuente de la etapa de reseñas cuando no corre la de productos, y corre
+    antes de los listados cuando sí: el checkpoint marca una página al
+    encolar sus productos, así que los que una corrida cortada dejó en la
+    cola no vuelven a salir de los listados.
+    """
+    filtro = {"categoria": {"$in": args.categorias}}
+    reviews_col = base_datos.raw_reviews()
+    encolados = 0
+    for doc in base_datos.products().find(filtro):
+        if reviews_col.find_one({"producto_mongo_id": doc["_id"]}, {"_id": 1}):
+            continue
+        if not poner(salida, doc, detener):
+            return
+        encolados += 1
+    print(f" [productos] {encolados} productos guardados sin reseñas encolados")
+
+
+class Activos:
+    """Cuántos trabajadores de una etapa siguen vivos."""
+
+    def __init__(self, n):
+        self.n = n
+        self.lock = threading.Lock()
+
+    def salir(self):
+        """Retorna True si era el último."""
+        with self.lock:
+            self.n -= 1
+            return self.n == 0
+
+
+def trabajador_reseñas(args, reporte, entrada, salida, detener, activos):
+    """
+    Un navegador: toma productos de `entrada` y encola en `salida` los _id de
+    las reseñas insertadas (None si no corre la etapa de sentimiento).
+    """
+    from scrape_reviews import scrape_reviews_for_product, setup_driver
+
+    reporte.iniciar("reseñas")
+    driver = None
+    try:
+        driver = setup_driver()
+        while True:
+            doc = entrada.get()
+            if doc is FIN or detener.is_set():
+                break
+            try:
+                ids = scrape_reviews_for_product(driver, doc, max_reviews=args.max_reseñas)
+            except Exception as e:
+                print(f" [reseñas] Error en {doc.get('url_producto')}: {e}")
+                reporte.sumar("reseñas", errores=1)
+                # El navegador pudo quedar inutilizable: se reemplaza
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+                driver = setup_driver()
+                continue
+            reporte.sumar("reseñas", productos=1, insertadas=len(ids))
+            if ids and salida is not None and not poner(salida, list(ids), detener):
+                break
+            time.sleep(args.pausa)
+    except Exception as e:
+        print(f" [reseñas] Navegador detenido: {e}")
+        reporte.sumar("reseñas", errores=1)
+        if activos.salir():
+            # Era el último navegador: vaciar la cola para no bloquear la etapa de
+            # productos (quedan guardados y se procesan en la próxima corrida)
+            while entrada.get() is not FIN:
+                reporte.sumar("reseñas", sin_procesar=1)
+        activos = None
+    finally:
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        if activos is not None:
+            activos.salir()
+        reporte.terminar("reseñas")
+        if salida is not None:
+            cerrar_cola(salida, 1, detener)
+
+
+def etapa_sentimiento(args, reporte, entrada, productores, detener):
+    """
+    Analiza las reseñas a medida que llegan, en lotes de --lote (o lo que
+    haya tras --espera-lote segundos). Sin etapa de reseñas, procesa las
+    pendientes de la base de datos. Si falla (también al cargar el modelo)
+    pide detener al resto: si no, las etapas anteriores quedarían esperando
+    lugar en la cola.
+    """
+    reporte.iniciar("sentimiento")
+    try:
+        # Importar aquí: carga el modelo sin demorar el inicio del scraping
+        import enrich_sentiment
+
+        enrich_sentiment.asegurar_indices()
+        journal.abrir("sentimiento")
+        _consumir_reseñas(args, reporte, entrada, productores, detener)
+    except (Exception, SystemExit) as e:
+        print(f" [sentimiento] Etapa detenida: {e!r}; deteniendo el pipeline")
+        reporte.fallar("sentimiento", e)
+        detener.set()
+    finally:
+        reporte.terminar("sentimiento")
+
+
+def _consumir_reseñas(args, reporte, entrada, productores, detener):
+    """Cuerpo de etapa_sentimiento (con el modelo ya cargado)."""
+    import enrich_sentiment
+
+    def analizar(ids=None, desde_id=None):
+        filtro = {"sentiment_score": {"$exists": False}}
+        if ids is not None:
+            filtro["_id"] = {"$in": ids}
+            # Con JOURNAL=1 las reseñas pueden no estar todavía en MongoDB
+            journal.esperar("reseñas")
+        exitosas, fallidas, ultimo_id = enrich_sentiment.enriquecer_lote(
+            limit=len(ids) if ids is not None else args.lote, filtro=filtro, desde_id=desde_id
+        )
+        if exitosas or fallidas:
+            reporte.sumar("sentimiento", lotes=1, analizadas=exitosas, fallidas=fallidas)
+        return exitosas, fallidas, ultimo_id
+
+    if entrada is None:
+        ultimo_id = None
+        while not detener.is_set():
+            exitosas, fallidas, ultimo_id = analizar(desde_id=ultimo_id)
+            if exitosas == 0 and fallidas == 0:
+                break
+        return
+
+    pendientes = []
+    fines = 0
+    while fines < productores and not detener.is_set():
+        try:
+            item = entrada.get(timeout=args.espera_lote)
+        except queue.Empty:
+            item = None
+        if item is FIN:
+            fines += 1
+        elif item:
+            pendientes.extend(item)
+
+        # Lotes completos; con la cola quieta o al terminar, también el resto
+        while len(pendientes) >= args.lote:
+            analizar(ids=pendientes[:args.lote])
+            pendientes = pendientes[args.lote:]
+        if pendientes and (item is None or fines == productores):
+            analizar(ids=pendientes)
+            pendientes = []
+
+
+# ------------------------
+# Ejecución
+# ------------------------
+def ejecutar(args):
+    checkpoint = Checkpoint(args.checkpoint, reiniciar=args.reiniciar)
+    reporte = Reporte()
+    detener = threading.Event()
+    hilos = []
+
+    cola_productos = queue.Queue(maxsize=args.cola) if "reseñas" in args.etapas else None
+    cola_reseñas = (
+        queue.Queue(maxsize=args.cola)
+        if "reseñas" in args.etapas and "sentimiento" in args.etapas else None
+    )
+
+    # Con JOURNAL=1, lo pendiente de la corrida anterior se aplica antes de
+    # que las etapas lean (productos sin reseñas, reseñas sin sentimiento)
+    journal.abrir(*[etapa for etapa in ("reseñas", "sentimiento") if etapa in args.etapas])
+
+    def hilo(nombre, objetivo, *argumentos):
+        h = threading.Thread(target=objetivo, args=argumentos, name=nombre, daemon=True)
+        h.start()
+        hilos.append(h)
+        return h
+
+    # Etapa 1: productos (o los ya guardados, si solo corren las etapas siguientes)
+    if "productos" in args.etapas or cola_productos is not None:
+        def fuente_productos():
+            try:
+                if cola_productos is not None:
+                    productos_desde_bd(args, cola_productos, detener)
+                if "productos" in args.etapas:
+                    etapa_productos(args, checkpoint, reporte, cola_productos, detener)
+            finally:
+                if cola_productos is not None:
+                    cerrar_cola(cola_productos, args.navegadores, detener)
+
+        hilo("productos", fuente_productos)
+
+    # Etapa 2: reseñas (un navegador por hilo)
+    if "reseñas" in args.etapas:
+        activos = Activos(args.navegadores)
+        for i in range(args.navegadores):
+            hilo(f"reseñas-{i + 1}", con_perfil("reseñas", trabajador_reseñas),
+                 args, reporte, cola_productos, cola_reseñas, detener, activos)
+
+    # Etapa 3: sentimiento (de la cola de reseñas o, sin ella, de las pendientes en la BD)
+    if "sentimiento" in args.etapas:
+        productores = args.navegadores if cola_reseñas is not None else 0
+        hilo("sentimiento", con_perfil("sentimiento", etapa_sentimiento),
+             args, reporte, cola_reseñas, productores, detener)
+
+    inicio = datetime.now()
+    ultima_exportacion = time.monotonic()
+    try:
+        for h in hilos:
+            while h.is_alive():
+                h.join(timeout=1)
+                if args.metricas_prom and time.monotonic() - ultima_exportacion >= INTERVALO_METRICAS_SEG:
+                    metricas.exportar_prometheus(args.metricas_prom)
+                    ultima_exportacion = time.monotonic()
+    except KeyboardInterrupt:
+        print("\n\nDeteniendo el pipeline (Ctrl+C)...")
+        detener.set()
+        for h in hilos:
+            h.join(timeout=30)
+
+    resumen = {
+        "inicio": inicio.isoformat(timespec="seconds"),
+        "fin": datetime.now().isoformat(timespec="seconds"),
+        "interrumpido": detener.is_set(),
+        "fallos": reporte.fallos,
+        "etapas": reporte.resumen(),
+        "metricas": metricas.resumen()["metricas"],
+    }
+    reporte.imprimir(resumen["etapas"])
+    for etapa, error in resumen["fallos"].items():
+        print(f"  ✗ La etapa {etapa} falló: {error}")
+    metricas.imprimir(resumen["metricas"])
+    if args.metricas_prom:
+        metricas.exportar_prometheus(args.metricas_prom)
+        print(f"Métricas de Prometheus en {args.metricas_prom}")
+    if args.reporte:
+        os.makedirs(os.path.dirname(args.reporte) or ".", exist_ok=True)
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Reporte guardado en {args.reporte}")
+    return resumen
+
+
+def main():
+    from scrape_products import LISTING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Pipeline productos → reseñas → sentimiento")
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=ETAPAS)
+    parser.add_argument("--categorias", nargs="+", choices=list(LISTING_CONFIG),
+                        default=list(LISTING_CONFIG))
+    parser.add_argument("--max-paginas", type=int, help="Páginas por categoría (por defecto las de LISTING_CONFIG)")
+    parser.add_argument("--hilos-listados", type=int, default=2, help="Categorías scrapeadas a la vez")
+    parser.add_argument("--pausa-listados", type=float, default=1.0, help="Segundos entre páginas")
+    parser.add_argument("--reintentos-listados", type=int, default=2,
+                        help="Reintentos de una página de listado que no se pudo descargar")
+    parser.add_argument("--navegadores", type=int, default=1, help="Navegadores Selenium en paralelo")
+    parser.add_argument("--max-reseñas", type=int, default=20, help="Reseñas por producto")
+    parser.add_argument("--pausa", type=float, default=3.0, help="Segundos entre productos por navegador")
+    parser.add_argument("--lote", type=int, default=50, help="Reseñas por lote de inferencia")
+    parser.add_argument("--espera-lote", type=float, default=5.0,
+                        help="Segundos sin reseñas nuevas antes de analizar un lote incompleto")
+    parser.add_argument("--cola", type=int, default=500, help="Tamaño máximo de cada cola")
+    parser.add_argument("--checkpoint", default="cache/pipeline_checkpoint.json")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el checkpoint")
+    parser.add_argument("--reporte", help="Guardar el reporte final en JSON")
+    parser.add_argument("--metricas-prom", default=os.getenv("METRICAS_PROM_ARCHIVO"),
+                        help="Archivo de texto de Prometheus (textfile collector)")
+    parser.add_argument("--metricas-puerto", type=int, help="Servir /metrics en este puerto")
+    parser.add_argument("--perfil", nargs="+", choices=ETAPAS + ["todas"],
+                        help="Guardar un cProfile de estas etapas en perfiles/")
+    args = parser.parse_args()
+
+    if args.perfil:
+        os.environ["METRICAS_PERFIL"] = ",".join(args.perfil)
+    if args.metricas_puerto:
+        metricas.servir_http(args.metricas_puerto)
+        print(f"Métricas en http://localhost:{args.metricas_puerto}/metrics")
+    resumen = ejecutar(args)
+    if resumen["fallos"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# ------------------------
+# Caché de imágenes renderizadas (nubes de palabras, gráficos)
+# ------------------------
+# Las claves incluyen la versión de los datos, así que una imagen solo se
+# vuelve a generar cuando llegan reseñas nuevas o cambia el filtro. Cada
+# versión deja sus PNGs en disco, por eso el directorio tiene un tope de
+# tamaño: al pasarlo se borran los archivos usados hace más tiempo.
+
+
+class CacheRender:
+    """
+    Caché LRU en memoria de PNGs, con copia opcional en disco (también LRU,
+    por fecha de último uso, hasta `max_bytes_disco`).
+    Segura para usar desde varias sesiones de Streamlit (hilos) a la vez.
+    """
+
+    def __init__(self, max_items=64, directorio=None, max_bytes_disco=256 * 1024 * 1024):
+        self.max_items = max_items
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def _nombre_archivo(clave):
+        return hashlib.sha1(repr(clave).encode("utf-8")).hexdigest() + ".png"
+
+    def obtener(self, clave):
+        """Retorna el PNG (bytes) o None si no está en caché."""
+        with self._lock:
+            if clave in self._items:
+                self._items.move_to_end(clave)
+                return self._items[clave]
+
+        if self.directorio:
+            ruta = os.path.join(self.directorio, self._nombre_archivo(clave))
+            try:
+                with open(ruta, "rb") as f:
+                    png = f.read()
+                # Marca de uso para el recorte LRU del directorio
+                os.utime(ruta)
+            except FileNotFoundError:
+                # No estaba o otra sesión lo recortó entre medio
+                return None
+            self._guardar_memoria(clave, png)
+            return png
+        return None
+
+    def guardar(self, clave, png):
+        self._guardar_memoria(clave, png)
+        if self.directorio:
+            ruta = os.path.join(self.directorio, self._nombre_archivo(clave))
+            # Temporal propio: dos sesiones pueden generar la misma imagen a la vez
+            with tempfile.NamedTemporaryFile(dir=self.directorio, suffix=".tmp", delete=False) as f:
+                f.write(png)
+            try:
+                os.replace(f.name, ruta)
+            except OSError:
+                os.remove(f.name)
+                raise
+            self._recortar_disco()
+
+    def _recortar_disco(self):
+        """Borra los PNGs usados hace más tiempo hasta quedar bajo `max_bytes_disco`."""
+        archivos = []
+        total = 0
+        with os.scandir(self.directorio) as entradas:
+            for entrada in entradas:
+                if not entrada.name.endswith(".png"):
+                    continue
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                archivos.append((info.st_mtime, info.st_size, entrada.path))
+                total += info.st_size
+        if total <= self.max_bytes_disco:
+            return
+        archivos.sort()
+        for _, tamaño, ruta in archivos:
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamaño
+
+    def _guardar_memoria(self, clave, png):
+        with self._lock:
+            self._items[clave] = png
+            self._items.move_to_end(clave)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def obtener_o_generar(self, clave, generar):
+        """Retorna el PNG en caché o lo genera con `generar()` y lo guarda."""
+        png = self.obtener(clave)
+        if png is None:
+            png = generar()
+            self.guardar(clave, png)
+        return png
@@ -1,22 +1,15 @@
 import requests
 from bs4 import BeautifulSoup
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import os
+from pymongo.errors import BulkWriteError
+import base_datos
+import metricas
 import time
 
 # ------------------------
 # Configuración MongoDB
 # ------------------------
-load_dotenv()
-MONGODB_URI = os.getenv("MONGODB_URI")
-
-if not MONGODB_URI:
-    raise ValueError("No se encontró MONGODB_URI en el .env")
-
-client = MongoClient(MONGODB_URI)
-db = client["ml_reviews"]
-products_col = db["products"]
+# Conexión compartida y perezosa (ver base_datos.py)
+products_col = base_datos.products()
 
 # ------------------------
 # Configuración de listados
@@ -36,28 +29,73 @@ LISTING_CONFIG = {
     },
 }
 
+# Código de MongoDB para clave duplicada (índice único de url_producto)
+DUPLICADO = 11000
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
 
-def scrape_listing(category_name, url, debug_mode=False):
+def url_pagina(base_url, page):
+    """URL de la página `page` (desde 0) de un listado."""
+    if page == 0:
+        return base_url
+    offset = (page * 48) + 1
+    return f"{base_url}_Desde_{offset}_NoIndex_True"
+
+
+def insertar_productos(docs):
+    """
+    Inserta los productos sin cortar en el primer duplicado: otro proceso
+    pudo insertar la misma URL entre la verificación y el insert (el índice
+    único lo rechaza con 11000, y se cuenta como ya presente).
+    Retorna los documentos que sí se insertaron.
+    """
+    try:
+        products_col.insert_many(docs, ordered=False)
+        return docs
+    except BulkWriteError as e:
+        errores = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICADO for err in errores):
+            raise
+        rechazados = {err["index"] for err in errores}
+        return [doc for i, doc in enumerate(docs) if i not in rechazados]
+
+
+class ErrorListado(Exception):
+    """No se pudo descargar una página de listado (red, timeout o HTTP 4xx/5xx)."""
+
+
+def scrape_listing(category_name, url, debug_mode=False, nuevos=None, lanzar_errores=False):
+    """
+    Scrapea una página de listado e inserta los productos nuevos.
+    Si se pasa la lista `nuevos`, se le agregan los documentos insertados
+    (con su _id), p. ej. para encolarlos en pipeline.py.
+    Retorna (insertados, hay_mas). Si la descarga falla retorna (0, False),
+    o lanza ErrorListado con `lanzar_errores` (para no confundir el error
+    con la última página).
+    """
     print(f"\n Scrapeando: {url}")
     
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=15)
+        with metricas.cronometro("ml_listado_descarga_segundos", categoria=category_name):
+            resp = requests.get(url, headers=HEADERS, timeout=15)
         resp.raise_for_status()
     except Exception as e:
         print(f" Error: {e}")
+        if lanzar_errores:
+            raise ErrorListado(f"{url}: {e}") from e
         return 0, False
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    with metricas.cronometro("ml_listado_parseo_segundos", categoria=category_name):
+        soup = BeautifulSoup(resp.text, "html.parser")
 
-    # Buscar items
-    items = soup.select("li.ui-search-layout__item")
-    if not items:
-        items = soup.select("div.ui-search-result__wrapper")
-    if not items:
-        items = soup.select("div.ui-search-result")
+        # Buscar items
+        items = soup.select("li.ui-search-layout__item")
+        if not items:
+            items = soup.select("div.ui-search-result__wrapper")
+        if not items:
+            items = soup.select("div.ui-search-result")
 
     print(f" Encontrados {len(items)} items en la página")
 
@@ -66,6 +104,7 @@ def scrape_listing(category_name, url, debug_mode=False):
         return 0, False
 
     docs_to_insert = []
+    urls_pagina = set()
     productos_duplicados = 0
     productos_sin_datos = 0
 
@@ -117,8 +156,8 @@ def scrape_listing(category_name, url, debug_mode=False):
             productos_sin_datos += 1
             continue
 
-        # Verificar duplicados
-        if products_col.find_one({"url_producto": product_url}):
+        # Verificar duplicados (repetidos en la misma página o ya en la BD)
+        if product_url in urls_pagina or products_col.find_one({"url_producto": product_url}):
             productos_duplicados += 1
             if debug_mode and idx <= 5:
                 print(f" Item {idx}: Duplicado - {title[:40]}...")
@@ -132,18 +171,24 @@ def scrape_listing(category_name, url, debug_mode=False):
             "origen": "mercadolibre_listado",
         }
         docs_to_insert.append(doc)
+        urls_pagina.add(product_url)
         
         if debug_mode and idx <= 5:
             print(f"    ✓ Item {idx}: NUEVO - {title[:40]}...")
 
     insertados = 0
     if docs_to_insert:
-        result = products_col.insert_many(docs_to_insert)
-        insertados = len(result.inserted_ids)
+        insertados_docs = insertar_productos(docs_to_insert)
+        insertados = len(insertados_docs)
+        productos_duplicados += len(docs_to_insert) - insertados
+        if nuevos is not None:
+            nuevos.extend(insertados_docs)
         print(f" Insertados: {insertados} productos nuevos")
     else:
         print(f" No hay productos nuevos")
     
+    metricas.sumar("ml_productos_nuevos_total", insertados, categoria=category_name)
+    metricas.sumar("ml_productos_duplicados_total", productos_duplicados, categoria=category_name)
     print(f" {insertados} nuevos | {productos_duplicados} duplicados | {productos_sin_datos} sin datos")
     
     # Retornar si hay más contenido disponible
@@ -163,11 +208,7 @@ def scrape_categoria_interactivo(category_name, base_url, max_pages):
     
     while page < max_pages:
         # Construir URL de la página
-        if page == 0:
-            page_url = base_url
-        else:
-            offset = (page * 48) + 1
-            page_url = f"{base_url}_Desde_{offset}_NoIndex_True"
+        page_url = url_pagina(base_url, page)
         
         print(f"\nPágina {page + 1}/{max_pages}")
         
@@ -274,6 +315,7 @@ def main():
         print(f"  • {category.capitalize()}: {count} productos")
     
     print(f"{'='*80}")
+    metricas.exportar_configurado()
 
 
 if __name__ == "__main__":
@@ -5,21 +5,67 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from bson import ObjectId
+import pymongo
+from pymongo.errors import PyMongoError
+import base_datos
+import journal
+import metricas
 import os
+import threading
 import time
 
-load_dotenv()
-MONGODB_URI = os.getenv("MONGODB_URI")
+# Conexión compartida y perezosa (ver base_datos.py)
+products_col = base_datos.products()
+reviews_col = base_datos.raw_reviews()
 
-if not MONGODB_URI:
-    raise ValueError("No se encontró MONGODB_URI en el .env")
+# Con JOURNAL=1 la verificación de "ya tiene reseñas" no puede quedar esperando
+# a MongoDB: primero se mira la lista local de productos que ya pasaron por el
+# journal (se guarda junto a él) y la consulta usa un timeout corto
+RUTA_PRODUCTOS_JOURNAL = os.path.join(journal.DIRECTORIO, "reseñas", "productos.txt")
+TIMEOUT_VERIFICACION_SEG = float(os.getenv("JOURNAL_TIMEOUT_LECTURA_SEG", "2"))
+_productos_journal = None
+_lock_productos = threading.Lock()
 
-client = MongoClient(MONGODB_URI)
-db = client["ml_reviews"]
-products_col = db["products"]
-reviews_col = db["raw_reviews"]
+
+def productos_en_journal():
+    """_id (str) de los productos cuyas reseñas ya se escribieron en el journal."""
+    global _productos_journal
+    with _lock_productos:
+        if _productos_journal is None:
+            try:
+                with open(RUTA_PRODUCTOS_JOURNAL, encoding="utf-8") as f:
+                    _productos_journal = {linea.strip() for linea in f if linea.strip()}
+            except FileNotFoundError:
+                _productos_journal = set()
+        return _productos_journal
+
+
+def registrar_en_journal(producto_id):
+    productos_en_journal()
+    with _lock_productos:
+        os.makedirs(os.path.dirname(RUTA_PRODUCTOS_JOURNAL), exist_ok=True)
+        with open(RUTA_PRODUCTOS_JOURNAL, "a", encoding="utf-8") as f:
+            f.write(f"{producto_id}\n")
+        _productos_journal.add(str(producto_id))
+
+
+def contar_existentes(producto_id):
+    """
+    Reseñas del producto en la BD. Con JOURNAL=1: 0 si está en la lista
+    local, y si MongoDB no responde en TIMEOUT_VERIFICACION_SEG se asume
+    que no tiene (mejor scrapear de más que dejar al navegador quieto).
+    """
+    if not journal.ACTIVO:
+        return reviews_col.count_documents({"producto_mongo_id": producto_id})
+    if str(producto_id) in productos_en_journal():
+        return None
+    try:
+        with pymongo.timeout(TIMEOUT_VERIFICACION_SEG):
+            return reviews_col.count_documents({"producto_mongo_id": producto_id})
+    except PyMongoError:
+        print("   MongoDB no disponible para verificar reseñas existentes; se scrapea igual")
+        return 0
 
 def setup_driver():
     """Configura el navegador Chrome en modo headless"""
@@ -61,33 +107,35 @@ def setup_driver():
 def extract_reviews_selenium(driver, url, max_reviews=20):  # Aumentado a 20
     """Extrae reseñas usando Selenium"""
     print(f"   Cargando página con Selenium...")
-    driver.get(url)
+    with metricas.cronometro("ml_selenium_carga_segundos"):
+        driver.get(url)
     
     reviews_data = []
     
     try:
-        # Esperar a que cargue la página
-        time.sleep(3)
-        
-        # Scroll para cargar más contenido
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
-        
-        # Intentar hacer clic en "Ver más opiniones" múltiples veces
-        for _ in range(3):  # Intentar hasta 3 veces
-            try:
-                ver_mas_btns = driver.find_elements(By.XPATH, 
-                    "//button[contains(text(), 'Ver más') or contains(text(), 'opiniones') or contains(text(), 'Mostrar más')]")
-                if ver_mas_btns:
-                    ver_mas_btns[0].click()
-                    print("  ✓ Click en 'Ver más opiniones'")
-                    time.sleep(2)
-                    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                    time.sleep(1)
-                else:
+        with metricas.cronometro("ml_selenium_espera_segundos"):
+            # Esperar a que cargue la página
+            time.sleep(3)
+
+            # Scroll para cargar más contenido
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            time.sleep(2)
+
+            # Intentar hacer clic en "Ver más opiniones" múltiples veces
+            for _ in range(3):  # Intentar hasta 3 veces
+                try:
+                    ver_mas_btns = driver.find_elements(By.XPATH, 
+                        "//button[contains(text(), 'Ver más') or contains(text(), 'opiniones') or contains(text(), 'Mostrar más')]")
+                    if ver_mas_btns:
+                        ver_mas_btns[0].click()
+                        print("  ✓ Click en 'Ver más opiniones'")
+                        time.sleep(2)
+                        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                        time.sleep(1)
+                    else:
+                        break
+                except:
                     break
-            except:
-                break
         
         # Selectores posibles para reseñas
         review_selectors = [
@@ -155,6 +203,7 @@ def extract_reviews_selenium(driver, url, max_reviews=20):  # Aumentado a 20
     return reviews_data
 
 def scrape_reviews_for_product(driver, product_doc, max_reviews=20):  # Aumentado a 20
+    """Extrae e inserta las reseñas de un producto. Retorna los _id insertados."""
     url = product_doc["url_producto"]
     categoria = product_doc.get("categoria")
     titulo = product_doc.get("titulo")
@@ -164,21 +213,28 @@ def scrape_reviews_for_product(driver, product_doc, max_reviews=20):  # Aumentad
     print(f" Categoría: {categoria}")
     print(f" URL: {url}")
 
-    # Verificar si ya tiene reseñas en la BD
-    existing_count = reviews_col.count_documents({"producto_mongo_id": product_doc["_id"]})
+    # Verificar si ya tiene reseñas en la BD (o, con JOURNAL=1, en el journal)
+    existing_count = contar_existentes(product_doc["_id"])
+    if existing_count is None:
+        print("   Las reseñas de este producto ya están en el journal. Saltando...")
+        return []
     if existing_count > 0:
         print(f"   Este producto ya tiene {existing_count} reseñas. Saltando...")
-        return
+        return []
 
     reviews = extract_reviews_selenium(driver, url, max_reviews)
+    metricas.observar("ml_resenas_por_producto", len(reviews), categoria=categoria)
+    metricas.sumar("ml_resenas_extraidas_total", len(reviews), categoria=categoria)
 
     if not reviews:
         print("   No se encontraron reseñas para este producto.")
-        return
+        return []
 
     docs_to_insert = []
     for r in reviews:
         doc = {
+            # _id asignado aquí: el journal puede reintentar la inserción sin duplicarla
+            "_id": ObjectId(),
             "producto_mongo_id": product_doc["_id"],
             "categoria": categoria,
             "url_producto": url,
@@ -189,10 +245,19 @@ def scrape_reviews_for_product(driver, product_doc, max_reviews=20):  # Aumentad
         }
         docs_to_insert.append(doc)
 
-    result = reviews_col.insert_many(docs_to_insert)
-    print(f" Insertadas {len(result.inserted_ids)} reseñas en MongoDB.")
+    # Con JOURNAL=1 quedan en disco y las inserta un hilo de fondo (ver journal.py)
+    journal.escribir("reseñas", [journal.insertar("raw_reviews", doc) for doc in docs_to_insert])
+    if journal.ACTIVO:
+        registrar_en_journal(product_doc["_id"])
+    destino = "el journal" if journal.ACTIVO else "MongoDB"
+    print(f" Insertadas {len(docs_to_insert)} reseñas en {destino}.")
+    return [doc["_id"] for doc in docs_to_insert]
 
 def main():
+    # Con JOURNAL=1, las reseñas pendientes de la corrida anterior se insertan
+    # antes de ver qué productos ya tienen reseñas
+    journal.abrir("reseñas")
+
     # Obtener TODOS los productos (sin limit)
     productos = list(products_col.find())
 
@@ -212,11 +277,7 @@ def main():
         
         for idx, p in enumerate(productos, 1):
             print(f"\n[{idx}/{len(productos)}]")
-            before_count = reviews_col.count_documents({})
-            scrape_reviews_for_product(driver, p, max_reviews=20)
-            after_count = reviews_col.count_documents({})
-            
-            nuevas_reseñas = after_count - before_count
+            nuevas_reseñas = len(scrape_reviews_for_product(driver, p, max_reviews=20))
             if nuevas_reseñas > 0:
                 productos_procesados += 1
                 reseñas_totales += nuevas_reseñas
@@ -230,6 +291,7 @@ def main():
         print(f" Productos con reseñas: {productos_procesados}/{len(productos)}")
         print(f" Total de reseñas obtenidas: {reseñas_totales}")
         print(f" Total en BD: {reviews_col.count_documents({})}")
+        metricas.exportar_configurado()
 
 if __name__ == "__main__":
     main()
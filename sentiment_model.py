@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+from transformers import pipeline
+import torch
+
+from token_cache import hash_texto
+
+# ------------------------
+# Modelo de sentimiento compartido
+# ------------------------
+# Separado de enrich_sentiment.py para poder cargar el modelo sin conectarse
+# a MongoDB (benchmarks, pruebas locales).
+
+MODEL_NAME = "pysentimiento/robertuito-sentiment-analysis"
+
+# Límite de tokens si el tokenizer no declara model_max_length (robertuito: 128)
+MAX_TOKENS_POR_DEFECTO = 128
+
+# Mapeo de etiquetas del modelo → (stars, score, label)
+MAPEO_ETIQUETAS = {
+    "POS": (5, 1.0, "positivo"),
+    "NEG": (1, -1.0, "negativo"),
+    "NEU": (3, 0.0, "neutral"),
+}
+
+
+def cargar_pipeline(model_name=MODEL_NAME, device=-1):
+    """
+    Carga el pipeline de transformers para análisis de sentimiento.
+    device: -1 = CPU, 0 = GPU
+    """
+    return pipeline(
+        "sentiment-analysis",
+        model=model_name,
+        tokenizer=model_name,
+        device=device
+    )
+
+
+# Modelos ya exportados a ONNX en esta corrida: {model_name: directorio}
+_exportados_onnx = {}
+
+
+def cargar_pipeline_onnx(model_name=MODEL_NAME, hilos=None):
+    """
+    Carga el mismo modelo exportado a ONNX Runtime (requiere `optimum[onnxruntime]`).
+    `hilos`: intra_op_num_threads de la sesión (torch.set_num_threads no la
+    afecta). Retorna None si el backend no está instalado.
+    """
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        from transformers import AutoTokenizer
+    except ImportError:
+        return None
+
+    opciones = onnxruntime.SessionOptions()
+    if hilos:
+        opciones.intra_op_num_threads = hilos
+    # La exportación es lenta: se hace una vez y las demás sesiones leen el .onnx guardado
+    if model_name not in _exportados_onnx:
+        import tempfile
+
+        directorio = tempfile.mkdtemp(prefix="onnx_")
+        ORTModelForSequenceClassification.from_pretrained(model_name, export=True).save_pretrained(directorio)
+        _exportados_onnx[model_name] = directorio
+    modelo = ORTModelForSequenceClassification.from_pretrained(
+        _exportados_onnx[model_name], session_options=opciones
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return pipeline("sentiment-analysis", model=modelo, tokenizer=tokenizer)
+
+
+def mapear_resultado(result):
+    """
+    Convierte la salida del pipeline ({"label": "POS", "score": 0.98})
+    en (stars, sentiment_score, sentiment_label, confidence).
+
+    Mapeo:
+      - POS → stars=5, score=1.0, label="positivo"
+      - NEG → stars=1, score=-1.0, label="negativo"
+      - NEU → stars=3, score=0.0, label="neutral"
+    """
+    raw_label = result["label"]  # "POS", "NEG", "NEU"
+    confidence = result.get("score", 0.0)
+    stars, sentiment_score, sentiment_label = MAPEO_ETIQUETAS.get(raw_label, MAPEO_ETIQUETAS["NEU"])
+    return stars, sentiment_score, sentiment_label, confidence
+
+
+def max_tokens_modelo(tokenizer, por_defecto=MAX_TOKENS_POR_DEFECTO):
+    """Longitud máxima en tokens que acepta el modelo."""
+    limite = tokenizer.model_max_length
+    # Algunos tokenizers no definen el límite y devuelven un valor enorme
+    return limite if limite and limite < 100_000 else por_defecto
+
+
+def tokenizar_textos(tokenizer, textos, max_tokens, hilos=4, tamaño_bloque=256):
+    """
+    Tokeniza en bloques repartidos entre hilos, truncando por tokens.
+    Los tokenizers "fast" (Rust) liberan el GIL, así que los bloques corren en paralelo.
+    """
+    bloques = [textos[i:i + tamaño_bloque] for i in range(0, len(textos), tamaño_bloque)]
+
+    def _tokenizar(bloque):
+        return tokenizer(bloque, truncation=True, max_length=max_tokens)["input_ids"]
+
+    if hilos <= 1 or len(bloques) <= 1:
+        resultados = [_tokenizar(b) for b in bloques]
+    else:
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            resultados = list(pool.map(_tokenizar, bloques))
+
+    return [ids for bloque in resultados for ids in bloque]
+
+
+def obtener_token_ids(tokenizer, textos, max_tokens, cache=None, hilos=4):
+    """
+    Retorna los input_ids (alineados con `textos`), usando la caché de tokens
+    si se pasa una. Solo se tokenizan los textos que no están en caché, y cada
+    texto repetido se tokeniza una sola vez.
+    """
+    textos = [t.strip() for t in textos]
+    hashes = [hash_texto(t) for t in textos]
+
+    ids_por_hash = cache.obtener(hashes) if cache is not None else {}
+
+    faltantes = {}
+    for h, t in zip(hashes, textos):
+        if h not in ids_por_hash and h not in faltantes:
+            faltantes[h] = t
+
+    if faltantes:
+        nuevos = tokenizar_textos(tokenizer, list(faltantes.values()), max_tokens, hilos=hilos)
+        nuevos_por_hash = dict(zip(faltantes.keys(), nuevos))
+        if cache is not None:
+            cache.guardar(nuevos_por_hash)
+        ids_por_hash.update(nuevos_por_hash)
+
+    return [ids_por_hash[h] for h in hashes]
+
+
+def analizar_ids(pipe, lista_ids, batch_size=16):
+    """
+    Inferencia directa sobre input_ids ya tokenizados (sin volver a tokenizar).
+    Ordena por longitud para minimizar el padding dentro de cada lote.
+    Retorna una lista de {"label", "score"} alineada con `lista_ids`.
+    """
+    modelo = pipe.model
+    pad_id = pipe.tokenizer.pad_token_id or 0
+    id2label = modelo.config.id2label
+
+    orden = sorted(range(len(lista_ids)), key=lambda i: len(lista_ids[i]))
+    resultados = [None] * len(lista_ids)
+
+    with torch.inference_mode():
+        for inicio in range(0, len(orden), batch_size):
+            indices = orden[inicio:inicio + batch_size]
+            largo = max(len(lista_ids[i]) for i in indices)
+
+            input_ids = torch.full((len(indices), largo), pad_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(indices), largo), dtype=torch.long)
+            for fila, i in enumerate(indices):
+                ids = lista_ids[i]
+                input_ids[fila, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[fila, :len(ids)] = 1
+
+            logits = modelo(
+                input_ids=input_ids.to(modelo.device),
+                attention_mask=attention_mask.to(modelo.device),
+            ).logits
+            scores, clases = logits.softmax(dim=-1).max(dim=-1)
+
+            for fila, i in enumerate(indices):
+                resultados[i] = {
+                    "label": id2label[int(clases[fila])],
+                    "score": float(scores[fila]),
+                }
+
+    return resultados
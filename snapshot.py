@@ -0,0 +1,280 @@
+"""
+Snapshot columnar (Parquet) de las reseñas enriquecidas y consultas sobre
+él con DuckDB, para usar el dashboard sin MongoDB Atlas.
+
+Exportar (particionado por categoría):
+
+    python snapshot.py --salida snapshot
+
+Usar el dashboard sobre el snapshot:
+
+    DASHBOARD_SNAPSHOT=snapshot python -m streamlit run dashboard.py
+
+Estructura (snapshot es un enlace a la versión actual, snapshot.<fecha>/):
+    snapshot/
+    ├── reviews/categoria=<cat>/*.parquet
+    ├── term_freq.parquet
+    └── meta.json
+"""
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Columnas del snapshot (incluye el texto para la tabla por producto y la exportación)
+ESQUEMA_REVIEWS = pa.schema([
+    ("_id", pa.string()),
+    ("categoria", pa.string()),
+    ("titulo_producto", pa.string()),
+    ("producto_mongo_id", pa.string()),
+    ("reseña_texto", pa.string()),
+    ("sentiment_label", pa.string()),
+    ("sentiment_stars", pa.int8()),
+    ("sentiment_actualizado", pa.timestamp("ms")),
+    ("tokens_limpios", pa.list_(pa.string())),
+])
+
+ESQUEMA_TERM_FREQ = pa.schema([
+    ("categoria", pa.string()),
+    ("sentiment_label", pa.string()),
+    ("termino", pa.string()),
+    ("conteo", pa.int64()),
+])
+
+
+# ------------------------
+# Exportación desde MongoDB
+# ------------------------
+def lotes_arrow(cursor, esquema, tamaño_lote):
+    """Convierte un cursor de PyMongo en RecordBatches sin materializar toda la colección."""
+    campos = esquema.names
+    filas = []
+    for doc in cursor:
+        fila = {campo: doc.get(campo) for campo in campos}
+        for campo in ("_id", "producto_mongo_id"):
+            if campo in fila and fila[campo] is not None:
+                fila[campo] = str(fila[campo])
+        filas.append(fila)
+        if len(filas) >= tamaño_lote:
+            yield pa.RecordBatch.from_pylist(filas, schema=esquema)
+            filas = []
+    if filas:
+        yield pa.RecordBatch.from_pylist(filas, schema=esquema)
+
+
+def exportar_snapshot(db, salida="snapshot", tamaño_lote=50_000, reseñas=None):
+    """
+    Escribe reseñas enriquecidas, term_freq y la versión de los datos en `salida`.
+    `reseñas`: colección de origen (por defecto db["raw_reviews"]).
+    """
+    tmp = salida.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    proyeccion = {campo: 1 for campo in ESQUEMA_REVIEWS.names}
+    reseñas = reseñas if reseñas is not None else db["raw_reviews"]
+    cursor = reseñas.find(
+        {"sentiment_label": {"$exists": True}}, proyeccion, batch_size=tamaño_lote
+    )
+    ds.write_dataset(
+        lotes_arrow(cursor, ESQUEMA_REVIEWS, tamaño_lote),
+        os.path.join(tmp, "reviews"),
+        schema=ESQUEMA_REVIEWS,
+        format="parquet",
+        partitioning=["categoria"],
+        partitioning_flavor="hive",
+        max_rows_per_group=tamaño_lote,
+    )
+
+    cursor_tf = db["term_freq"].find({}, {"_id": 0, "journal_aplicado": 0}, batch_size=tamaño_lote)
+    tabla_tf = pa.Table.from_batches(
+        list(lotes_arrow(cursor_tf, ESQUEMA_TERM_FREQ, tamaño_lote)), schema=ESQUEMA_TERM_FREQ
+    )
+    pq.write_table(tabla_tf, os.path.join(tmp, "term_freq.parquet"))
+
+    meta = db["meta"].find_one({"_id": "raw_reviews"}) or {}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": meta.get("version", 0),
+            "exportado": datetime.now().isoformat(timespec="seconds"),
+        }, f)
+
+    # Sin reseñas enriquecidas write_dataset no escribe archivos y read_parquet
+    # fallaría: un Parquet vacío con el esquema completo
+    ruta_reviews = os.path.join(tmp, "reviews")
+    if not any(archivos for _, _, archivos in os.walk(ruta_reviews)):
+        os.makedirs(ruta_reviews, exist_ok=True)
+        pq.write_table(ESQUEMA_REVIEWS.empty_table(), os.path.join(ruta_reviews, "vacio.parquet"))
+
+    publicar(tmp, salida)
+
+
+def publicar(tmp, salida):
+    """
+    Reemplaza el snapshot anterior de una sola vez: `salida` es un enlace
+    simbólico a la versión actual (salida.<fecha>) y se cambia con os.replace,
+    así el dashboard nunca ve un directorio a medio borrar.
+    """
+    salida = salida.rstrip("/")
+    version = f"{salida}.{datetime.now():%Y%m%d%H%M%S%f}"
+    os.replace(tmp, version)
+    anterior = os.path.realpath(salida) if os.path.islink(salida) else None
+    if os.path.isdir(salida) and not os.path.islink(salida):
+        # Snapshot de antes de los enlaces (directorio común): se aparta una sola vez
+        anterior = f"{version}.anterior"
+        os.replace(salida, anterior)
+
+    enlace = f"{salida}.enlace"
+    if os.path.lexists(enlace):
+        os.remove(enlace)
+    os.symlink(os.path.basename(version), enlace)
+    os.replace(enlace, salida)
+    if anterior:
+        shutil.rmtree(anterior, ignore_errors=True)
+
+
+def literal_sql(valor):
+    """Cadena SQL entre comillas simples (DuckDB no acepta parámetros en rutas de vistas ni COPY)."""
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+# ------------------------
+# Consultas con DuckDB
+# ------------------------
+class FuenteSnapshot:
+    """
+    Responde las consultas del dashboard sobre el snapshot Parquet con DuckDB
+    (filtros y group by columnares, sin cargar todo en pandas).
+    """
+
+    def __init__(self, directorio):
+        import duckdb
+
+        self.directorio = directorio
+        self.con = duckdb.connect()
+        ruta_reviews = os.path.join(directorio, "reviews", "**", "*.parquet")
+        self.con.execute(
+            f"CREATE VIEW reviews AS SELECT * FROM read_parquet({literal_sql(ruta_reviews)}, hive_partitioning = true)"
+        )
+        self.con.execute(
+            f"CREATE VIEW term_freq AS SELECT * FROM "
+            f"read_parquet({literal_sql(os.path.join(directorio, 'term_freq.parquet'))})"
+        )
+        with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+    def _consultar(self, sql, parametros=None):
+        # Cada consulta con su propio cursor: el dashboard atiende varias sesiones en hilos
+        return self.con.cursor().execute(sql, parametros or []).df()
+
+    @staticmethod
+    def _filtro_categoria(categoria):
+        if categoria and categoria != "Todas":
+            return "WHERE categoria = ?", [categoria]
+        return "", []
+
+    def version(self):
+        return self.meta.get("version", 0)
+
+    def datos(self):
+        return self._consultar(
+            "SELECT _id, categoria, titulo_producto, sentiment_label, sentiment_stars, "
+            "sentiment_actualizado FROM reviews"
+        )
+
+    def resumen(self, categoria=None):
+        where, params = self._filtro_categoria(categoria)
+        agrupado = self._consultar(
+            f"SELECT categoria, sentiment_label, count(*) AS conteo FROM reviews {where} "
+            "GROUP BY categoria, sentiment_label",
+            params,
+        )
+        conteo_labels = agrupado.groupby("sentiment_label")["conteo"].sum().to_dict()
+        return conteo_labels, agrupado
+
+    def frecuencias(self, categoria=None, sentiment_label=None, limite=200):
+        where, params = self._filtro_categoria(categoria)
+        where = f"{where} AND sentiment_label = ?" if where else "WHERE sentiment_label = ?"
+        df = self._consultar(
+            f"SELECT termino, sum(conteo) AS conteo FROM term_freq {where} "
+            "GROUP BY termino HAVING sum(conteo) > 0 ORDER BY conteo DESC LIMIT ?",
+            [*params, sentiment_label, limite],
+        )
+        return dict(zip(df["termino"], df["conteo"].astype(int)))
+
+    def documentos(self):
+        """(tokens, etiquetas, categorías) para el motor de términos distintivos."""
+        df = self._consultar("SELECT tokens_limpios, sentiment_label, categoria FROM reviews")
+        documentos = [list(t) if t is not None else [] for t in df["tokens_limpios"]]
+        return documentos, df["sentiment_label"].tolist(), df["categoria"].tolist()
+
+    def productos(self):
+        """Productos con reseñas en el snapshot, para el índice de búsqueda."""
+        from indice_productos import Producto
+
+        df = self._consultar(
+            "SELECT producto_mongo_id, any_value(titulo_producto) AS titulo, "
+            "any_value(categoria) AS categoria FROM reviews GROUP BY producto_mongo_id"
+        )
+        return [Producto(*fila) for fila in df.itertuples(index=False)]
+
+    def conteo_producto(self, producto_id):
+        df = self._consultar(
+            "SELECT sentiment_label, count(*) AS conteo FROM reviews "
+            "WHERE producto_mongo_id = ? GROUP BY sentiment_label",
+            [producto_id],
+        )
+        return dict(zip(df["sentiment_label"], df["conteo"].astype(int)))
+
+    def peor_calificados(self, categoria=None, minimo_reseñas=5, limite=10):
+        where, params = self._filtro_categoria(categoria)
+        return self._consultar(
+            "SELECT any_value(titulo_producto) AS titulo, count(*) AS total, "
+            "round(avg(sentiment_stars), 2) AS promedio_estrellas, "
+            "round(100.0 * count(*) FILTER (WHERE sentiment_label = 'negativo') / count(*), 1) "
+            f"AS pct_negativas FROM reviews {where} GROUP BY producto_mongo_id "
+            "HAVING count(*) >= ? ORDER BY promedio_estrellas, total DESC LIMIT ?",
+            [*params, minimo_reseñas, limite],
+        )
+
+    def pagina_reseñas_producto(self, producto_id, pagina, tamaño):
+        return self._consultar(
+            "SELECT reseña_texto, sentiment_label, sentiment_stars FROM reviews "
+            "WHERE producto_mongo_id = ? ORDER BY _id LIMIT ? OFFSET ?",
+            [producto_id, tamaño, (pagina - 1) * tamaño],
+        )
+
+    def exportar(self, ruta, formato="csv", categoria=None):
+        """Exporta las reseñas (de una categoría) con COPY de DuckDB, en streaming."""
+        where, params = self._filtro_categoria(categoria)
+        consulta = (
+            "SELECT _id, categoria, titulo_producto, reseña_texto, sentiment_label, "
+            f"sentiment_stars FROM reviews {where} ORDER BY _id"
+        )
+        opciones = "FORMAT parquet" if formato == "parquet" else "FORMAT csv, HEADER true"
+        self.con.cursor().execute(f"COPY ({consulta}) TO {literal_sql(ruta)} ({opciones})", params)
+
+
+def main():
+    import base_datos
+
+    parser = argparse.ArgumentParser(description="Exportar snapshot Parquet de reseñas enriquecidas")
+    parser.add_argument("--salida", default="snapshot", help="Directorio del snapshot")
+    parser.add_argument("--lote", type=int, default=50_000, help="Documentos por lote")
+    args = parser.parse_args()
+
+    print(f"Exportando snapshot a {args.salida}/ ...")
+    # Con el esquema compacto, sin pasar por la vista ($lookup por reseña)
+    exportar_snapshot(base_datos.db(), args.salida, args.lote, reseñas=base_datos.raw_reviews())
+    fuente = FuenteSnapshot(args.salida)
+    total = fuente._consultar("SELECT count(*) AS n FROM reviews")["n"][0]
+    print(f"Snapshot listo: {total} reseñas (versión {fuente.version()})")
+
+
+if __name__ == "__main__":
+    main()
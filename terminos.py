@@ -0,0 +1,224 @@
+"""
+Términos distintivos por sentimiento y categoría.
+
+El top de frecuencias crudas queda dominado por palabras comunes a todos
+los sentimientos. Aquí se arma una vez una matriz dispersa documento-término
+(unigramas y bigramas de `tokens_limpios`) y se calculan, con operaciones
+vectorizadas, los términos más distintivos de cada sentimiento con el
+log-odds ratio con prior de Dirichlet informativo (Monroe et al., 2008):
+z alto = el término aparece mucho más en ese sentimiento que en los demás.
+
+Las consultas posteriores (cualquier categoría / sentimiento) solo operan
+sobre vectores del tamaño del vocabulario, no sobre las reseñas.
+
+    python terminos.py                    # top por sentimiento desde MongoDB
+    python terminos.py --sintetico 500000 # tiempos sobre reseñas sintéticas
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+ETIQUETAS = ["positivo", "neutral", "negativo"]
+
+
+def terminos_documento(tokens, bigramas=True):
+    """Unigramas y, opcionalmente, bigramas de palabras consecutivas."""
+    tokens = list(tokens or [])
+    if bigramas:
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return tokens
+
+
+def construir_matriz(documentos, bigramas=True, min_frecuencia=2):
+    """
+    Matriz CSR (documentos x términos) con el conteo de cada término.
+    Descarta términos con menos de `min_frecuencia` apariciones en total.
+    Retorna (matriz, arreglo de términos).
+    """
+    vocabulario = {}
+    indices = []
+    indptr = [0]
+    for tokens in documentos:
+        for termino in terminos_documento(tokens, bigramas):
+            indices.append(vocabulario.setdefault(termino, len(vocabulario)))
+        indptr.append(len(indices))
+
+    matriz = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32),
+         np.asarray(indices, dtype=np.int32),
+         np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(vocabulario)),
+    )
+    matriz.sum_duplicates()
+    terminos = np.array(list(vocabulario), dtype=object)
+
+    if min_frecuencia > 1 and len(terminos):
+        totales = np.asarray(matriz.sum(axis=0)).ravel()
+        conservar = np.flatnonzero(totales >= min_frecuencia)
+        matriz = matriz[:, conservar]
+        terminos = terminos[conservar]
+    return matriz.tocsr(), terminos
+
+
+def log_odds_dirichlet(conteo_grupo, conteo_resto, prior, min_conteo=3):
+    """
+    z-score del log-odds ratio de cada término entre un grupo y el resto,
+    con prior de Dirichlet `prior` (vector de pseudo-conteos por término).
+    Los términos con menos de `min_conteo` apariciones en el grupo quedan en -inf.
+    """
+    a0 = prior.sum()
+    n_grupo = conteo_grupo.sum()
+    n_resto = conteo_resto.sum()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = (
+            np.log(conteo_grupo + prior) - np.log(n_grupo + a0 - conteo_grupo - prior)
+            - np.log(conteo_resto + prior) + np.log(n_resto + a0 - conteo_resto - prior)
+        )
+        varianza = 1.0 / (conteo_grupo + prior) + 1.0 / (conteo_resto + prior)
+        z = delta / np.sqrt(varianza)
+    z[~np.isfinite(z) | (conteo_grupo < min_conteo)] = -np.inf
+    return z
+
+
+class MotorTerminos:
+    """
+    Matriz documento-término de un conjunto de reseñas, agregada por
+    (categoría, sentimiento). Se construye una vez por versión de los datos.
+    """
+
+    def __init__(self, documentos, etiquetas, categorias, bigramas=True,
+                 min_frecuencia=2, fuerza_prior=1000.0):
+        inicio = time.perf_counter()
+        self.matriz, self.terminos = construir_matriz(documentos, bigramas, min_frecuencia)
+
+        # Un grupo por par (categoría, sentimiento): G (grupos x docs) @ X → conteos por grupo
+        codigos, grupos = pd.factorize(pd.Series(list(zip(categorias, etiquetas)), dtype=object))
+        self.grupo_categoria = np.array([g[0] for g in grupos], dtype=object)
+        self.grupo_etiqueta = np.array([g[1] for g in grupos], dtype=object)
+        indicadora = sparse.csr_matrix(
+            (np.ones(len(codigos), dtype=np.float64), (codigos, np.arange(len(codigos)))),
+            shape=(len(grupos), len(codigos)),
+        )
+        # Disperso: con bigramas el vocabulario puede tener millones de términos
+        self.conteos = (indicadora @ self.matriz).tocsr()
+
+        # Prior informativo: frecuencia relativa del término en todo el corpus
+        totales = np.asarray(self.conteos.sum(axis=0)).ravel()
+        self.prior = fuerza_prior * totales / max(totales.sum(), 1.0)
+        self.segundos_construccion = time.perf_counter() - inicio
+
+    def __len__(self):
+        return self.matriz.shape[0]
+
+    def _mascara(self, categoria=None, sentiment_label=None):
+        mascara = np.ones(len(self.grupo_categoria), dtype=bool)
+        if categoria and categoria != "Todas":
+            mascara &= self.grupo_categoria == categoria
+        if sentiment_label is not None:
+            mascara &= self.grupo_etiqueta == sentiment_label
+        return mascara
+
+    def _suma(self, mascara):
+        return np.asarray(self.conteos[np.flatnonzero(mascara)].sum(axis=0)).ravel()
+
+    def distintivos(self, sentiment_label, categoria=None, top=15, min_conteo=3):
+        """
+        Términos más distintivos de `sentiment_label` frente a los otros
+        sentimientos (dentro de `categoria` si se indica).
+        Retorna DataFrame[termino, z, frecuencia] ordenado por z.
+        """
+        columnas = ["termino", "z", "frecuencia"]
+        en_categoria = self._mascara(categoria)
+        del_grupo = en_categoria & self._mascara(sentiment_label=sentiment_label)
+        if not del_grupo.any() or self.conteos.shape[1] == 0:
+            return pd.DataFrame(columns=columnas)
+
+        conteo_grupo = self._suma(del_grupo)
+        conteo_resto = self._suma(en_categoria & ~del_grupo)
+        z = log_odds_dirichlet(conteo_grupo, conteo_resto, self.prior, min_conteo)
+
+        top = min(top, int(np.isfinite(z).sum()))
+        if top <= 0:
+            return pd.DataFrame(columns=columnas)
+        mejores = np.argpartition(-z, top - 1)[:top]
+        mejores = mejores[np.argsort(-z[mejores])]
+        return pd.DataFrame({
+            "termino": self.terminos[mejores],
+            "z": np.round(z[mejores], 2),
+            "frecuencia": conteo_grupo[mejores].astype(int),
+        })
+
+
+def leer_documentos(coleccion, filtro=None):
+    """(tokens, etiquetas, categorías) de las reseñas enriquecidas con tokens_limpios."""
+    filtro = dict(filtro or {})
+    filtro.setdefault("sentiment_label", {"$exists": True})
+    cursor = coleccion.find(
+        filtro, {"_id": 0, "tokens_limpios": 1, "sentiment_label": 1, "categoria": 1},
+        batch_size=10_000,
+    )
+    documentos, etiquetas, categorias = [], [], []
+    for doc in cursor:
+        documentos.append(doc.get("tokens_limpios") or [])
+        etiquetas.append(doc.get("sentiment_label"))
+        categorias.append(doc.get("categoria"))
+    return documentos, etiquetas, categorias
+
+
+def terminos_distintivos(documentos, etiquetas, categorias, categoria=None, top=15):
+    """
+    Atajo para uso puntual: arma el motor y retorna {sentimiento: DataFrame}.
+    Para varias consultas sobre los mismos datos conviene reutilizar MotorTerminos.
+    """
+    motor = MotorTerminos(documentos, etiquetas, categorias)
+    return {label: motor.distintivos(label, categoria, top) for label in ETIQUETAS}
+
+
+def generar_sintetico(n, semilla=42):
+    """Reseñas tokenizadas sintéticas con vocabulario propio de cada sentimiento."""
+    rnd = random.Random(semilla)
+    comunes = [f"comun{i}" for i in range(2000)]
+    propios = {label: [f"{label[:3]}{i}" for i in range(300)] for label in ETIQUETAS}
+    categorias = ["audifonos", "laptops", "televisores"]
+
+    etiquetas = rnd.choices(ETIQUETAS, k=n)
+    documentos = []
+    for label in etiquetas:
+        largo = rnd.randint(3, 25)
+        documentos.append(rnd.choices(comunes, k=largo) + rnd.choices(propios[label], k=max(1, largo // 5)))
+    return documentos, etiquetas, rnd.choices(categorias, k=n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Términos distintivos por sentimiento")
+    parser.add_argument("--categoria", help="Solo esta categoría")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--sintetico", type=int, help="Usar N reseñas sintéticas en vez de MongoDB")
+    args = parser.parse_args()
+
+    if args.sintetico:
+        print(f"Generando {args.sintetico} reseñas sintéticas...")
+        documentos, etiquetas, categorias = generar_sintetico(args.sintetico)
+    else:
+        import base_datos
+        documentos, etiquetas, categorias = leer_documentos(base_datos.raw_reviews())
+
+    motor = MotorTerminos(documentos, etiquetas, categorias)
+    print(f"Matriz: {motor.matriz.shape[0]} reseñas x {motor.matriz.shape[1]} términos, "
+          f"{motor.matriz.nnz} no nulos ({motor.segundos_construccion:.1f}s)")
+
+    for label in ETIQUETAS:
+        inicio = time.perf_counter()
+        df = motor.distintivos(label, args.categoria, args.top)
+        ms = (time.perf_counter() - inicio) * 1000
+        print(f"\n{label.upper()} ({ms:.1f} ms)")
+        print(df.to_string(index=False) if not df.empty else "  (sin términos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,12 @@
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import os
+import base_datos
 
-# Cargar variables del .env
-load_dotenv()
+# Conexión compartida (lee MONGODB_URI y las opciones de pool/compresión del .env)
+opciones = base_datos.opciones_cliente()
+print("Compresión de red:", opciones.get("compressors", "ninguna"))
+print("Pool máximo:", opciones["maxPoolSize"])
 
-MONGODB_URI = os.getenv("MONGODB_URI")
-
-if not MONGODB_URI:
-    raise ValueError("No se encontró MONGODB_URI en el .env")
-
-# Conectar al cluster
-client = MongoClient(MONGODB_URI)
-
-# Elegir BD y colección
-db = client["ml_reviews"]
-collection = db["raw_reviews"]
+# Elegir colección
+collection = base_datos.raw_reviews()
 
 # Insertar un documento de prueba
 doc = {"tipo": "test_conexion", "mensaje": "Hola MongoDB desde Python"}
@@ -0,0 +1,94 @@
+import re
+
+# ------------------------
+# Limpieza de texto compartida
+# ------------------------
+# La usa enrich_sentiment.py para precalcular los tokens de cada reseña
+# y el dashboard para las nubes de palabras.
+
+# STOPWORDS AMPLIADAS - Incluye palabras contextuales y no significativas
+STOPWORDS_ES = {
+    # Artículos, preposiciones, conectores
+    "el","la","los","las","de","del","y","a","en","un","una","que","se","por",
+    "con","para","es","son","lo","al","como","más","mas","ya","me","mi","su","sus",
+    "este","esta","esto","esa","ese","eso","tu","te","cuando","todo","todos","todas",
+    "hay","aqui","ahí","ahi","pues","pero","si","no","muy","bien","mal","super",
+    "tan","solo","solo","sólo","fue","sido","estar","tener","hacer","vez","veces",
+    "puede","pueden","debe","deben","algún","alguna","otros","otras","cada","mismo",
+    "misma","quiero","quiere","dar","dio","dió","hecho","hacer","está","horas",
+    
+    # Palabras genéricas de opinión que NO aportan insight
+    "reseña","opinion","opinión","review","comentario","calificacion","calificación",
+    "estrellas","estrella","puntos","valoracion","valoración","evaluacion","evaluación",
+    "bueno","buena","regular","normal","común","típico","tipico",
+    
+    # Contexto de compra/producto (demasiado genérico)
+    "producto","productos","artículo","articulo","artículos","articulos","item",
+    "compra","compre","compré","comprado","comprar","compras",
+    "mercado","libre","mercadolibre","tienda","vendedor","vendedora",
+    "precio","precios","costo","costos","vale","pagar","pagué","pague","pago",
+    "envio","envío","envios","envíos","entrega","llegó","llego","llegada",
+    "pedido","pedidos","orden","ordenes","órdenes",
+    "cliente","clientes","servicio","atención","atencion",
+    
+    # Palabras sobre uso/experiencia (muy genéricas)
+    "uso","usar","usada","utilizar","utilizando","utilizó","utilizo",
+    "funcionamiento","función","funciona","funcionan","funcionar",
+    
+    # Adjetivos vagos
+    "útil","util","útiles","utiles","opciones","opción","opcion","expectativas",
+    "características","caracteristicas","materiales","material",
+    "tamaño","tamano","color","colores","modelo","modelos", "único","opiniones",
+    
+    # Verbos comunes poco informativos
+    "recomiendo","recomendar","recomendada","recomendable",
+    "cumple","cumplir","esperar","esperaba","esperado","esperando","geniales","mejor",
+    
+    # Temporalidad genérica
+    "dias","día","dias","meses","mes","año","anos","tiempo","veces","primera","primer",
+    
+    # Meses
+    "ene","feb","mar","abr","may","jun","jul","ago","sept","oct","nov","dic",
+    "enero","febrero","marzo","abril","mayo","junio","julio","agosto",
+    "septiembre","octubre","noviembre","diciembre",
+    
+    # Números y variaciones
+    "uno","dos","tres","cuatro","cinco","seis","siete","ocho","nueve","diez",
+}
+
+def limpiar_texto(texto: str) -> str:
+    """
+    Limpia el texto eliminando stopwords y palabras poco informativas.
+    Mantiene solo palabras relevantes para análisis de sentimiento.
+    """
+    if not texto:
+        return ""
+    
+    texto = str(texto).lower()
+    
+    # Eliminar puntuación pero mantener espacios
+    texto = re.sub(r'[^\w\s]', ' ', texto)
+    
+    # Eliminar números
+    texto = re.sub(r'\d+', '', texto)
+    
+    palabras = texto.split()
+    
+    # Filtrar palabras:
+    # 1. No en stopwords
+    # 2. Longitud >= 4 (más estricto)
+    # 3. No sean solo vocales repetidas (aaaa, eee, etc)
+    palabras_filtradas = [
+        p for p in palabras 
+        if (p not in STOPWORDS_ES and 
+            len(p) >= 4 and
+            len(set(p)) > 2)  # Al menos 3 caracteres diferentes
+    ]
+    
+    return " ".join(palabras_filtradas)
+
+
+def tokens_limpios(texto: str) -> list:
+    """Lista de palabras relevantes de la reseña (misma limpieza que limpiar_texto)."""
+    return limpiar_texto(texto).split()
+
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+# ------------------------
+# Caché local de token ids por reseña
+# ------------------------
+# Guarda los input_ids ya truncados de cada texto (clave: hash del texto) por
+# tokenizer, para que reanalizar con el mismo tokenizer no vuelva a tokenizar.
+
+
+def hash_texto(texto: str) -> str:
+    """Hash estable del texto normalizado (sin espacios al inicio/fin)."""
+    return hashlib.sha1(texto.strip().encode("utf-8")).hexdigest()
+
+
+def id_tokenizer(tokenizer, max_tokens):
+    """Identifica un tokenizer + truncado; si cambia cualquiera, la caché no se reutiliza."""
+    return f"{tokenizer.name_or_path}|{len(tokenizer)}|{max_tokens}"
+
+
+class CacheTokens:
+    """
+    Caché en SQLite: (tokenizer, hash_texto) → input_ids.
+    Es segura para usar desde varios hilos.
+    """
+
+    def __init__(self, ruta="cache/tokens.sqlite", tokenizer_id=""):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.tokenizer_id = tokenizer_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " tokenizer TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " ids BLOB NOT NULL,"
+            " PRIMARY KEY (tokenizer, hash))"
+        )
+        self._conn.commit()
+
+    def obtener(self, hashes):
+        """Retorna {hash: [ids]} para los hashes que están en caché."""
+        encontrados = {}
+        hashes = list(set(hashes))
+        with self._lock:
+            # SQLite limita la cantidad de parámetros por consulta
+            for i in range(0, len(hashes), 500):
+                bloque = hashes[i:i + 500]
+                marcas = ",".join("?" * len(bloque))
+                filas = self._conn.execute(
+                    f"SELECT hash, ids FROM tokens WHERE tokenizer = ? AND hash IN ({marcas})",
+                    [self.tokenizer_id, *bloque],
+                )
+                for h, blob in filas:
+                    ids = array("i")
+                    ids.frombytes(blob)
+                    encontrados[h] = ids.tolist()
+        return encontrados
+
+    def guardar(self, ids_por_hash):
+        """Guarda {hash: [ids]} en la caché."""
+        if not ids_por_hash:
+            return
+        filas = [
+            (self.tokenizer_id, h, array("i", ids).tobytes())
+            for h, ids in ids_por_hash.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tokens (tokenizer, hash, ids) VALUES (?, ?, ?)", filas
+            )
+            self._conn.commit()
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()